@@ -0,0 +1,211 @@
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Limits per service or "service:scope" (an Athena workgroup, a Bedrock model id) as JSON, e.g.
+# {"athena:analytics": {"concurrency": 20, "rate": 5, "burst": 10}}; a scoped entry overrides its service's
+ADMISSION_LIMITS = os.environ.get('ADMISSION_LIMITS', '')
+THROTTLE_RETRY_ATTEMPTS = int(os.environ.get('THROTTLE_RETRY_ATTEMPTS', '4'))
+THROTTLE_RETRY_BASE_SECONDS = float(os.environ.get('THROTTLE_RETRY_BASE_SECONDS', '0.25'))
+THROTTLE_RETRY_MAX_SECONDS = float(os.environ.get('THROTTLE_RETRY_MAX_SECONDS', '8'))
+
+# Only these are retried; a failed query or a rejected request is returned to the caller as is
+THROTTLING_CODES = frozenset(('TooManyRequestsException', 'ThrottlingException'))
+
+
+class ServiceBusyError(Exception):
+    """A service kept throttling, or no slot freed up, before the retries or the deadline ran out."""
+
+    def __init__(self, service, scope, reason) -> None:
+        super().__init__(f"{service} ({scope}) is busy: {reason}")
+        self.service = service
+        self.scope = scope
+        self.reason = reason
+
+
+def is_throttling(error):
+    # botocore ClientError carries the service's error code in `response`
+    response = getattr(error, 'response', None)
+    code = response.get('Error', {}).get('Code') if isinstance(response, dict) else None
+    return code in THROTTLING_CODES
+
+
+def retry_delays(attempts=THROTTLE_RETRY_ATTEMPTS, base=THROTTLE_RETRY_BASE_SECONDS,
+                 maximum=THROTTLE_RETRY_MAX_SECONDS, rng=random):
+    # Full jitter, so clients throttled together don't retry together
+    for attempt in range(attempts):
+        yield rng.uniform(0, min(maximum, base * 2 ** attempt))
+
+
+class TokenBucket:
+    """`rate` requests per second with bursts of up to `burst`; a rate of 0 never waits."""
+
+    def __init__(self, rate=0, burst=None) -> None:
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        # Takes a token now and returns how long to wait before using it; works for threads and coroutines
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class Gate:
+    """Admission for one (service, scope): a concurrency limit and a request-rate bucket.
+
+    `slot` holds one of `concurrency` slots for as long as the work runs (a
+    query until it finishes, a completion until it has streamed); `call` paces
+    a single API call through the bucket and retries it while it is throttled.
+    """
+
+    def __init__(self, service, scope, concurrency=0, rate=0, burst=None) -> None:
+        self.service = service
+        self.scope = scope
+        self.semaphore = threading.BoundedSemaphore(concurrency) if concurrency else None
+        self.bucket = TokenBucket(rate, burst)
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.in_flight = 0
+        self.queue_wait_seconds = 0.0
+        self.max_queue_wait_seconds = 0.0
+        self.rate_wait_seconds = 0.0
+        self.throttled = 0
+        self.retries = 0
+        self.rejected = 0
+
+    def record_wait(self, waited, kind, tracer=None):
+        # kind 'slot' is one admission after waiting for concurrency, 'rate' a call held back by the bucket
+        with self._lock:
+            if kind == 'slot':
+                self.admitted += 1
+                self.queue_wait_seconds += waited
+                self.max_queue_wait_seconds = max(self.max_queue_wait_seconds, waited)
+            else:
+                self.rate_wait_seconds += waited
+        if tracer is not None:
+            tracer.record('admission_wait', waited * 1000, service=self.service, scope=self.scope, kind=kind)
+
+    @contextmanager
+    def slot(self, deadline=None, tracer=None, blocking=True):
+        # Yields the seconds spent waiting for the slot; when not `blocking`, None if no slot is free right now
+        started = time.monotonic()
+        if self.semaphore is not None:
+            if not blocking:
+                if not self.semaphore.acquire(blocking=False):
+                    yield None
+                    return
+            elif not self.semaphore.acquire(timeout=None if deadline is None else max(deadline - started, 0)):
+                with self._lock:
+                    self.rejected += 1
+                raise ServiceBusyError(self.service, self.scope, 'no free slot before the deadline')
+        waited = time.monotonic() - started
+        self.record_wait(waited, 'slot', tracer)
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield waited
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            if self.semaphore is not None:
+                self.semaphore.release()
+
+    def call(self, fn, *args, deadline=None, tracer=None, **kwargs):
+        delays = retry_delays()
+        while True:
+            wait = self.bucket.reserve()
+            if wait:
+                self.record_wait(wait, 'rate', tracer)
+                time.sleep(wait)
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                time.sleep(self._retry_delay(e, delays, deadline, tracer))
+
+    async def call_async(self, run, fn, *args, deadline=None, tracer=None, **kwargs):
+        # `run` executes the blocking `fn` off the event loop, e.g. AsyncSQLAnswerAgent._run
+        import asyncio
+
+        delays = retry_delays()
+        while True:
+            wait = self.bucket.reserve()
+            if wait:
+                self.record_wait(wait, 'rate', tracer)
+                await asyncio.sleep(wait)
+            try:
+                return await run(fn, *args, **kwargs)
+            except Exception as e:
+                await asyncio.sleep(self._retry_delay(e, delays, deadline, tracer))
+
+    def _retry_delay(self, error, delays, deadline, tracer):
+        # Re-raises anything that is not throttling, and throttling once retries or time run out
+        if not is_throttling(error):
+            raise error
+        with self._lock:
+            self.throttled += 1
+        delay = next(delays, None)
+        if delay is None or (deadline is not None and time.monotonic() + delay > deadline):
+            raise ServiceBusyError(self.service, self.scope, str(error)) from error
+        with self._lock:
+            self.retries += 1
+        if tracer is not None:
+            tracer.record('throttle_retry', delay * 1000, service=self.service, scope=self.scope)
+        return delay
+
+    def stats(self):
+        with self._lock:
+            return {
+                'admitted': self.admitted,
+                'in_flight': self.in_flight,
+                'avg_queue_wait_ms': round(self.queue_wait_seconds / self.admitted * 1000, 3) if self.admitted else None,
+                'max_queue_wait_ms': round(self.max_queue_wait_seconds * 1000, 3),
+                'rate_wait_ms': round(self.rate_wait_seconds * 1000, 3),
+                'throttled': self.throttled,
+                'retries': self.retries,
+                'rejected': self.rejected,
+            }
+
+
+class AdmissionController:
+    """Gates per (service, scope), shared by every agent of the process.
+
+    `limits` maps a service, or "service:scope", to Gate keyword arguments
+    (concurrency, rate, burst); ADMISSION_LIMITS entries are applied on top.
+    """
+
+    def __init__(self, limits=None, overrides=ADMISSION_LIMITS) -> None:
+        if isinstance(overrides, str):
+            overrides = json.loads(overrides) if overrides.strip() else {}
+        self.limits = {key: {**(limits or {}).get(key, {}), **overrides.get(key, {})}
+                       for key in set(limits or {}) | set(overrides)}
+        self._gates = {}
+        self._lock = threading.Lock()
+
+    def gate(self, service, scope='default'):
+        key = (service, scope)
+        gate = self._gates.get(key)
+        if gate is not None:
+            return gate
+        with self._lock:
+            gate = self._gates.get(key)
+            if gate is None:
+                config = {**self.limits.get(service, {}), **self.limits.get(f"{service}:{scope}", {})}
+                gate = self._gates[key] = Gate(service, scope, **config)
+        return gate
+
+    def stats(self):
+        with self._lock:
+            gates = list(self._gates.items())
+        return {f"{service}:{scope}": gate.stats() for (service, scope), gate in gates}
@@ -1,56 +1,252 @@
-import boto3
 import json
-import time
+import os
 import re
-from botocore.exceptions import NoCredentialsError, PartialCredentialsError
+import copy
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+
+from admission import AdmissionController, ServiceBusyError
+from answer_flow import answer_steps, run_steps, timed_stage
+from athena_polling import (BackoffPolicy, QueryFailedError, deadline_from_context, query_timings, wait_for_queries,
+                            wait_for_query)
+from athena_results import RESULT_MAX_BYTES, RESULT_MAX_ROWS, RESULT_PAGE_SIZE, ResultStream, iter_result_pages
+from bedrock_stream import iter_stream_text, read_until
+from client_registry import AgentPool, LazyClient, get_client, invocation_stats
+from conversation import (DynamoDBSessionBackend, LocalFileSessionBackend, SessionStore, bounded_history,
+                          needs_standalone_rewrite)
+from result_cache import RecordingStream, ResultCache, normalize_sql, result_reuse_configuration
+from model_routing import routing_table
+from result_format import estimate_tokens, format_result
+from result_profile import PROFILE_MIN_ROWS, SUMMARY_TOKEN_BUDGET, profile_for_prompt
+from s3_results import S3_RESULT_MIN_ROWS, CsvResultStream, local_source_factory, s3_source_factory
+from schema_cache import LocalFileBackend, SchemaCache, fetch_glue_schema
+from schema_compact import prompt_schema, schema_index
+from sql_examples import SQL_EXAMPLES_DIR, SqlExampleIndex, examples_prompt
+from sql_guardrails import (GUARDRAIL_PARTITION_POLICY, GUARDRAIL_SCAN_BUDGET_BYTES, add_limit, estimated_scan_bytes,
+                            explain_query, guard_partitions, scan_budget_decision)
+from sql_memo import SqlMemo
+from sql_validate import SQL_REPAIR_ATTEMPTS, validate_sql
+from tracing import Tracer, metrics_sink
+
+OUTPUT_BUCKET = 's3://llm-output-bucket/'
+SQL_SYSTEM_PROMPT = '''You are an expert SQL database manager to write queries for AWS Athena. youe job is to help convert text descriptions into SQL queries for querying AWS Athena. Verify the correctness of the syntax of the query generated. 
+            Keep in mind that in Athena, timestamps have milliseconds precision. Write query in between SQL tags like <SQL></SQL> and give it in 1 line without any formatting. Dont respond with any explanation of the query, output of this is going to Athena directly so just return SQL query compatible with Athena in response.'''
+SUMMARY_SYSTEM_PROMPT = '''I have the following SQL data start after <data> tag: Can you provide a summary from this data? '''
+SCHEMA_SOURCE = os.environ.get('SCHEMA_SOURCE', 'athena')
+SCHEMA_CACHE_DIR = os.environ.get('SCHEMA_CACHE_DIR')
+# 's3' reads large results from the output bucket, a directory path reads a local copy, 'off' disables it
+RESULT_READER = os.environ.get('RESULT_READER', 's3')
+BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', '8'))
+BEDROCK_MAX_CONCURRENCY = int(os.environ.get('BEDROCK_MAX_CONCURRENCY', '4'))
+ATHENA_MAX_CONCURRENCY = int(os.environ.get('ATHENA_MAX_CONCURRENCY', '4'))
+# Calls per second (token-bucket refill) for StartQueryExecution and InvokeModel; 0 leaves them unpaced
+ATHENA_START_RATE = float(os.environ.get('ATHENA_START_RATE', '0'))
+# Calls per second for the polling and result calls (Get/BatchGetQueryExecution, GetQueryResults), which
+# Athena rate-limits apart from StartQueryExecution
+ATHENA_API_RATE = float(os.environ.get('ATHENA_API_RATE', '0'))
+BEDROCK_REQUEST_RATE = float(os.environ.get('BEDROCK_REQUEST_RATE', '0'))
+ATHENA_WORKGROUP = os.environ.get('ATHENA_WORKGROUP')
+MAX_SQL_STATEMENTS = int(os.environ.get('MAX_SQL_STATEMENTS', '5'))
+# A DynamoDB table name, or a directory for the local stand-in; unset keeps sessions in this instance only
+SESSION_TABLE = os.environ.get('SESSION_TABLE')
+SESSION_STORE_DIR = os.environ.get('SESSION_STORE_DIR')
+# 'auto' pre-warms during init under provisioned concurrency, 'always' on every cold start, 'off' never
+PREWARM = os.environ.get('PREWARM', 'auto')
+# "database.table,database.table" whose agents (and cached schemas) prewarm() gets ready
+PREWARM_TABLES = os.environ.get('PREWARM_TABLES', '')
+
+# botocore's NoCredentialsError and PartialCredentialsError, matched by name so botocore is only imported
+# with the first client
+CREDENTIAL_ERRORS = frozenset(('NoCredentialsError', 'PartialCredentialsError'))
+
+schema_cache = SchemaCache(backend=LocalFileBackend(SCHEMA_CACHE_DIR) if SCHEMA_CACHE_DIR else None)
+result_cache = ResultCache()
+sql_memo = SqlMemo()
+sql_examples = SqlExampleIndex(SQL_EXAMPLES_DIR)
+tracer = Tracer(metrics_sink())
+model_routes = routing_table()
+# Shared by every pooled agent, so the limits hold for the whole process rather than per agent
+admission = AdmissionController({
+    'athena': {'concurrency': ATHENA_MAX_CONCURRENCY, 'rate': ATHENA_START_RATE},
+    'athena_api': {'rate': ATHENA_API_RATE},
+    'bedrock': {'concurrency': BEDROCK_MAX_CONCURRENCY, 'rate': BEDROCK_REQUEST_RATE},
+})
+
+
+def _session_backend():
+    if SESSION_TABLE:
+        return DynamoDBSessionBackend(LazyClient('dynamodb'), SESSION_TABLE)
+    if SESSION_STORE_DIR:
+        return LocalFileSessionBackend(SESSION_STORE_DIR)
+    return None
+
+
+session_store = SessionStore(backend=_session_backend())
+
+
+def _create_agent(database, table_name):
+    # Clients are built on their first call, so a request that never reads from S3 never builds that client
+    bedrock_client = LazyClient('bedrock-runtime', region_name='us-east-1')
+    athena_client = LazyClient('athena')
+    glue_client = LazyClient('glue') if SCHEMA_SOURCE == 'glue' else None
+    if RESULT_READER == 'off':
+        result_source_factory = None
+    elif RESULT_READER == 's3':
+        result_source_factory = s3_source_factory(LazyClient('s3'))
+    else:
+        result_source_factory = local_source_factory(RESULT_READER)
+    return SQL_Answer_Agent(bedrock_client, athena_client, database, table_name, OUTPUT_BUCKET, [],
+                            schema_cache=schema_cache, glue_client=glue_client,
+                            result_source_factory=result_source_factory, result_cache=result_cache,
+                            sql_memo=sql_memo, sql_examples=sql_examples, admission=admission, workgroup=ATHENA_WORKGROUP, tracer=tracer,
+                            routes=model_routes)
+
+
+agent_pool = AgentPool(_create_agent)
+
+
+def prewarm(tables=PREWARM_TABLES):
+    """Pay the first request's setup during init: import boto3, build the clients, and for each
+    "database.table" in `tables` pool an agent with its schema cached. Returns the seconds taken."""
+    started = time.perf_counter()
+    get_client('bedrock-runtime', region_name='us-east-1')
+    get_client('athena')
+    if SCHEMA_SOURCE == 'glue':
+        get_client('glue')
+    if RESULT_READER == 's3':
+        get_client('s3')
+    if SESSION_TABLE:
+        get_client('dynamodb')
+    for spec in filter(None, (spec.strip() for spec in tables.split(','))):
+        database, table_name = spec.split('.', 1)
+        agent = agent_pool.acquire(database, table_name)
+        try:
+            agent.get_set_db_schema()
+        finally:
+            agent_pool.release(agent)
+    elapsed = time.perf_counter() - started
+    tracer.record('prewarm', elapsed * 1000, tables=tables)
+    return elapsed
+
+
+def record_invocation(request_tracer, start, elapsed, **attributes):
+    # The process-wide cache, memo, example and admission counters go to the metrics sink with the invocation,
+    # and are only gathered when there is one
+    if request_tracer.enabled:
+        request_tracer.record('invocation', elapsed * 1000, start=start, result_cache=result_cache.stats(),
+                              sql_memo=sql_memo.stats(), sql_examples=sql_examples.stats(),
+                              admission=admission.stats(), **attributes)
+
 
 def lambda_handler(payload, context):
+    metadata = {}
+    answer = ''.join(stream_lambda_handler(payload, context, metadata))
+    return {
+        # 'statusCode': 200,
+        'body': answer,
+        'metadata': metadata
+    }
+
+
+def stream_lambda_handler(payload, context, metadata=None):
+    # Yields summary chunks as Bedrock produces them, for response-streaming integrations
     # Setup Anthropic API
     # setup_anthropic()
     
     # Initialize Anthropic client
     # anthropic_client = AnthropicClient(api_key=os.environ["ANTHROPIC_API_KEY"])
 
-    # Initialize Bedrock client
-    bedrock_client = boto3.client(service_name='bedrock-runtime', region_name='us-east-1')
-
-    # Initialize Athena client
-    athena_client = boto3.client('athena')
+    invocation = invocation_stats.start()
 
     # event = json.loads(payload['body'])
     event = payload['body']
-    print(f"payload {event}")
 
     # Initialize parameters
     database = event['database']
     table_name = event['table_name']
     client = event['client']
-    output_bucket = 's3://llm-output-bucket/'
     query_ans_arr = event.get('query_ans_arr', [])
+    # With a session id the history is kept server-side; either way the rewrite prompt sees
+    # a rolling summary plus the last few turns, not the whole conversation
+    session_id = event.get('session_id')
+    history = session_store.history(session_id) if session_id else []
+    history = history or bounded_history(query_ans_arr)
+
+    # Reuse a warm SQL_Answer_Agent (and its boto3 clients) for this table
+    sql_agent = agent_pool.acquire(database, table_name)
+    sql_agent.query_ans_arr = history
+    sql_agent.deadline = deadline_from_context(context)
+    sql_agent.tracer = tracer.bind(getattr(context, 'aws_request_id', None), table=table_name)
+    # Pooled agents re-read the schema through the schema cache on every request
+    sql_agent.schema = None
+    try:
+        # Define the question and get SQL query (the schema is fetched alongside the standalone rewrite)
+        question = event['question'] #"give me details of employees in Irwin-Martinez company?"
+        chunks = []
+        for chunk in sql_agent.get_answer_stream(question, client):
+            chunks.append(chunk)
+            yield chunk
+        if session_id:
+            # The standalone form of the question reads on its own once it is folded into the summary
+            session_store.append(session_id, sql_agent.standalone_query or question, ''.join(chunks))
+    except ServiceBusyError as e:
+        # Throttled past every retry: answer with a retryable message instead of failing the invocation
+        print(f"Error answering question: {e}")
+        if metadata is not None:
+            metadata['error'] = {'type': 'busy', 'service': e.service, 'scope': e.scope}
+        yield f"The {e.service} service is busy right now; please try again shortly."
+    finally:
+        if metadata is not None:
+            metadata['stage_timings'] = {stage: round(seconds, 4) for stage, seconds in sql_agent.stage_timings.items()}
+            metadata['schema_prompt'] = sql_agent.last_schema_stats
+            metadata['guardrails'] = sql_agent.guardrail_decisions
+            metadata['models'] = sql_agent.stage_models
+            metadata['sql_examples'] = sql_agent.example_stats
+            metadata['history'] = {'session': bool(session_id), 'items': len(history),
+                                   'tokens': estimate_tokens(str(history))}
+        agent_pool.release(sql_agent)
+        elapsed = invocation_stats.finish(invocation)
+        record_invocation(sql_agent.tracer, invocation[0], elapsed, history_items=len(history))
+
+
+def batch_lambda_handler(payload, context):
+    # body: database, table_name, client and questions, each a string or
+    # {"question": ..., "query_ans_arr": [...], "client": ...}
+    invocation = invocation_stats.start()
+    event = payload['body']
+
+    sql_agent = agent_pool.acquire(event['database'], event['table_name'])
+    sql_agent.query_ans_arr = []
+    sql_agent.deadline = deadline_from_context(context)
+    sql_agent.tracer = tracer.bind(getattr(context, 'aws_request_id', None), table=event['table_name'])
+    sql_agent.schema = None
+    try:
+        # A caller may ask for fewer workers, never more than the instance is sized for
+        max_workers = max(1, min(int(event.get('max_workers') or BATCH_MAX_WORKERS), BATCH_MAX_WORKERS))
+        answers = sql_agent.get_answers(event['questions'], event.get('client'), max_workers=max_workers)
+    finally:
+        agent_pool.release(sql_agent)
+        elapsed = invocation_stats.finish(invocation)
+        record_invocation(sql_agent.tracer, invocation[0], elapsed, batch=True, questions=len(event['questions']))
 
-    # Create SQL_Answer_Agent instance
-    sql_agent = SQL_Answer_Agent(bedrock_client, athena_client, database, table_name, output_bucket, query_ans_arr)
-    
-    # Get and set the schema
-    sql_agent.get_set_db_schema()
-    
-    # Define the question and get SQL query
-    question = event['question'] #"give me details of employees in Irwin-Martinez company?"
-    answer = sql_agent.get_answer(question, client)
-    
-    # Print the results
-    print("############")
-    print(answer)
-    
     return {
         # 'statusCode': 200,
-        'body': answer
+        'body': answers
     }
 
 
 
 class SQL_Answer_Agent:
-    def __init__(self, bedrock_client, athena_client, database,table_name, output_bucket, query_ans_arr) -> None:
+    def __init__(self, bedrock_client, athena_client, database,table_name, output_bucket, query_ans_arr,
+                 schema_cache=None, glue_client=None, poll_policy=None,
+                 max_rows=RESULT_MAX_ROWS, max_bytes=RESULT_MAX_BYTES, result_source_factory=None,
+                 result_cache=None, result_reuse=None, sql_memo=None,
+                 summary_token_budget=SUMMARY_TOKEN_BUDGET, bedrock_concurrency=None, athena_concurrency=None,
+                 tracer=None, sql_repair_attempts=SQL_REPAIR_ATTEMPTS, partition_policy=GUARDRAIL_PARTITION_POLICY,
+                 scan_budget_bytes=GUARDRAIL_SCAN_BUDGET_BYTES, routes=None, admission=None,
+                 workgroup=None, sql_examples=None) -> None:
         # self.client = anthropic_client
         self.bedrock_client = bedrock_client
         self.athena_client = athena_client
@@ -58,6 +254,48 @@ class SQL_Answer_Agent:
         self.output_bucket = output_bucket
         self.table_name = table_name
         self.query_ans_arr = query_ans_arr
+        self.schema_cache = schema_cache
+        self.glue_client = glue_client
+        self.poll_policy = poll_policy or BackoffPolicy()
+        # Monotonic deadline for Athena polling, set per invocation from the Lambda context
+        self.deadline = None
+        self.last_query_stats = None
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.result_source_factory = result_source_factory
+        self.result_cache = result_cache
+        self.sql_memo = sql_memo
+        # Past question -> SQL pairs retrieved as few-shot examples for the SQL prompt
+        self.sql_examples = sql_examples
+        self.example_stats = None
+        self.summary_token_budget = summary_token_budget
+        # Concurrency, rate limits and throttling retries per service; without a shared controller the
+        # limits are this agent's own and shared by its forks, e.g. the questions of one batch
+        self.admission = admission or AdmissionController({
+            'athena': {'concurrency': athena_concurrency or 0},
+            'bedrock': {'concurrency': bedrock_concurrency or 0},
+        })
+        self.workgroup = workgroup
+        self.result_reuse = result_reuse if result_reuse is not None else result_reuse_configuration()
+        self.last_query_execution = None
+        self.last_schema_stats = None
+        self.sql_repair_attempts = sql_repair_attempts
+        self.sql_repairs = 0
+        # Athena's reason for each statement of the current question that failed
+        self.query_errors = {}
+        self.partition_policy = partition_policy
+        self.scan_budget_bytes = scan_budget_bytes
+        # What the guardrails did to the statements of the current question, for the answer metadata
+        self.guardrail_decisions = []
+        # The current question after the standalone rewrite, which is what a session remembers
+        self.standalone_query = None
+        # {stage: Route} for every LLM call; see model_routing
+        self.routes = routes or routing_table()
+        # Model that served each LLM stage of the current question
+        self.stage_models = {}
+        self.stage_timings = {}
+        # Per-stage spans; a tracer without a sink makes them no-ops
+        self.tracer = tracer or Tracer()
         self.schema = None
 
     def set_prompt(self, question, prompt=None):
@@ -67,117 +305,603 @@ class SQL_Answer_Agent:
             self.prompt = f'''Use the schema {self.schema} and respond ONLY with an SQL query to answer the question: {question}. 
             Response should contain ONLY the SQL Query'''
 
-    def get_llm_response(self, content, modelId = "anthropic.claude-3-sonnet-20240229-v1:0"):
-        # "anthropic.claude-3-sonnet-20240229-v1:0"
+    def route(self, stage):
+        route = self.routes.get(stage) or self.routes['sql_generation']
+        self.stage_models[stage] = route.model_id
+        return route
+
+    def llm_request_body(self, content, system, route):
+        body = {
+            "max_tokens": route.max_tokens, 
+            "system": system, 
+            "messages": [{"role": "user", "content": content}], 
+            "anthropic_version": "bedrock-2023-05-31"
+        }
+        if route.stop_sequences:
+            body["stop_sequences"] = list(route.stop_sequences)
+        return json.dumps(body)
+
+    def stream_llm_response(self, content, system, stage='sql_generation', usage=None):
+        route = self.route(stage)
         input = {
-            "modelId": modelId, 
+            "modelId": route.model_id, 
             "contentType": 'application/json',
             "accept": '*/*',
-            "body": json.dumps({
-                "max_tokens": 15000, 
-                "system": f'''You are an expert SQL database manager to write queries for AWS Athena. youe job is to help convert text descriptions into SQL queries for querying AWS Athena. Verify the correctness of the syntax of the query generated. 
-            Keep in mind that in Athena, timestamps have milliseconds precision. Write query in between SQL tags like <SQL></SQL> and give it in 1 line without any formatting. Dont respond with any explanation of the query, output of this is going to Athena directly so just return SQL query compatible with Athena in response.''', 
-                "messages": [{"role": "user", "content": content}], 
-                "anthropic_version": "bedrock-2023-05-31"
-            })
+            "body": self.llm_request_body(content, system, route)
         }
-        
-        response = self.bedrock_client.invoke_model(
-            body=input["body"],
-            modelId=input["modelId"],
-            accept=input["accept"],
-            contentType=input["contentType"]
-        )
-
-        response_body = json.loads(response['body'].read())
-        response = response_body.get('content')[0].get('text')
+        usage = {} if usage is None else usage
+
+        # Hold a Bedrock slot (Bedrock quotas are per model) for as long as the completion is streaming
+        with self.admitted('bedrock', route.model_id) as gate, \
+                self.tracer.span('bedrock', route=stage, model=route.model_id) as span:
+            started = time.perf_counter()
+            response = gate.call(
+                self.bedrock_client.invoke_model_with_response_stream,
+                body=input["body"],
+                modelId=input["modelId"],
+                accept=input["accept"],
+                contentType=input["contentType"],
+                deadline=self.deadline,
+                tracer=self.tracer
+            )
+            try:
+                for i, chunk in enumerate(iter_stream_text(response, usage)):
+                    if i == 0:
+                        span.set('first_token_ms', round((time.perf_counter() - started) * 1000, 3))
+                    yield chunk
+            finally:
+                span.usage(usage)
+
+    @contextmanager
+    def admitted(self, service, scope, blocking=True):
+        # Yields the service's gate once a slot is free (None if not `blocking` and none is); the wait is added
+        # to the question's stage timings
+        gate = self.admission.gate(service, scope)
+        with gate.slot(self.deadline, self.tracer, blocking) as waited:
+            if waited is None:
+                yield None
+                return
+            key = f"{service}_queue_wait"
+            self.stage_timings[key] = self.stage_timings.get(key, 0) + waited
+            yield gate
+
+    def athena_call(self, deadline=None):
+        # call(fn, **kwargs) for Athena's polling and result calls: paced, and retried while throttled
+        gate = self.admission.gate('athena_api', self.workgroup or 'primary')
+        return functools.partial(gate.call, deadline=deadline or self.deadline, tracer=self.tracer)
+
+    def get_llm_response(self, content, stage='sql_generation', stop_tag='</SQL>', open_tag='<SQL>', usage=None):
+        response = read_until(self.stream_llm_response(content, SQL_SYSTEM_PROMPT, stage, usage), stop_tag, open_tag)
         # print(response)
         return response
     
-    def get_set_db_schema(self):
+    def get_set_db_schema(self, refresh=False):
         try:
-            query = f"describe {self.table_name};"
-            query_result = self.execute_sql_query(query)
+            if self.schema_cache is not None and not refresh:
+                cached = self.schema_cache.get(self.database, self.table_name)
+                if cached is not None:
+                    self.schema = cached
+                    return True
+
+            if self.glue_client is not None:
+                query_result = fetch_glue_schema(self.glue_client, self.database, self.table_name)
+            else:
+                query = f"describe {self.table_name};"
+                query_result = self.execute_sql_query(query)
             self.schema = query_result
+            if query_result and self.schema_cache is not None:
+                self.schema_cache.put(self.database, self.table_name, query_result)
             # print(f"self.schema:{self.schema}")
             return True
-        except (NoCredentialsError, PartialCredentialsError) as e:
-            print(f"Credentials error: {e}")
-            return False
+        except ServiceBusyError:
+            raise
         except Exception as e:
-            print(f"Error fetching schema: {e}")
+            if type(e).__name__ in CREDENTIAL_ERRORS:
+                print(f"Credentials error: {e}")
+            else:
+                print(f"Error fetching schema: {e}")
             return False
 
+    def invalidate_schema(self):
+        self.schema = None
+        if self.schema_cache is not None:
+            self.schema_cache.invalidate(self.database, self.table_name)
+        if self.sql_memo is not None:
+            self.sql_memo.invalidate_table(self.table_name)
+
+    def _query_request(self, query, reuse_results):
+        request = {
+            'QueryString': query,
+            'QueryExecutionContext': {'Database': self.database},
+            'ResultConfiguration': {'OutputLocation': self.output_bucket},
+        }
+        if self.workgroup:
+            request['WorkGroup'] = self.workgroup
+        if reuse_results and self.result_reuse:
+            request['ResultReuseConfiguration'] = self.result_reuse
+        return request
+
+    def start_athena_query(self, gate, query, reuse_results=False):
+        # Throttled starts (too many concurrent queries) are retried; a query that runs and fails is not
+        response = gate.call(self.athena_client.start_query_execution, deadline=self.deadline, tracer=self.tracer,
+                             **self._query_request(query, reuse_results))
+        return response['QueryExecutionId']
+
+    def start_sql_query(self, query, reuse_results=False):
+        # The slot is held until the query finishes, since Athena's concurrency quota counts running queries
+        with self.admitted('athena', self.workgroup or 'primary') as gate:
+            query_execution_id = self.start_athena_query(gate, query, reuse_results)
+            # print(query)
+            # print(response)
+            query_execution = wait_for_query(self.athena_client, query_execution_id, policy=self.poll_policy,
+                                             deadline=self.deadline, call=self.athena_call())
+            self.last_query_execution = query_execution
+            self.last_query_stats = self._trace_query(query_execution)
+            status = query_execution['Status']['State']
+            if status != 'SUCCEEDED':
+                raise QueryFailedError(query_execution_id, status, query_execution['Status'].get('StateChangeReason', ''))
+            return query_execution_id
+
     def execute_sql_query(self, query):
         if query:
             try:
-                response = self.athena_client.start_query_execution(
-                    QueryString=query,
-                    QueryExecutionContext={'Database': self.database},
-                    ResultConfiguration={'OutputLocation': self.output_bucket}
-                )
-
-                query_execution_id = response['QueryExecutionId']
-                # print(query)
-                # print(response)
-                while True:
-                    result = self.athena_client.get_query_execution(QueryExecutionId=query_execution_id)
-                    # print(result)
-                    status = result['QueryExecution']['Status']['State']
-                    if status == 'SUCCEEDED':
-                        break
-                    elif status in ['FAILED', 'CANCELLED']:
-                        raise Exception(f"Query failed with status: {status}")
-                    time.sleep(2)
-
-                results = self.athena_client.get_query_results(QueryExecutionId=query_execution_id)
-                rows = results['ResultSet']['Rows']
+                query_execution_id = self.start_sql_query(query)
                 # response_summary = self.summarize_sql_response(f"Question: {question} Answer: {rows}")
-                return rows
+                return self.fetch_rows(query_execution_id)
+            except ServiceBusyError:
+                raise
+            except Exception as e:
+                print(f"Error executing query: {e}")
+                return False
+        else:
+            return False
+
+    def fetch_rows(self, query_execution_id):
+        rows = []
+        for page in iter_result_pages(self.athena_client, query_execution_id, call=self.athena_call()):
+            rows.extend(page['ResultSet']['Rows'])
+            if len(rows) >= self.max_rows:
+                break
+        return rows[:self.max_rows]
+
+    def stream_sql_query(self, query, max_rows=None, max_bytes=None):
+        if query:
+            try:
+                if self.result_cache is not None:
+                    cached = self.result_cache.get(self.database, query)
+                    if cached is not None:
+                        self.tracer.record('athena_execution', 0, result_cache_hit=True)
+                        return cached
+
+                started = time.perf_counter()
+                self.start_sql_query(query, reuse_results=True)
+                query_seconds = time.perf_counter() - started
+                result_stream = self.open_result_stream(self.last_query_execution, max_rows or self.max_rows,
+                                                        max_bytes or self.max_bytes)
+                return self._record_result(query, result_stream, query_seconds, self.last_query_stats)
+            except ServiceBusyError:
+                raise
             except Exception as e:
                 print(f"Error executing query: {e}")
+                if isinstance(e, QueryFailedError) and e.state == 'FAILED':
+                    self.query_errors[query] = e.reason
                 return False
         else:
             return False
+
+    def stream_sql_queries(self, queries, max_rows=None, max_bytes=None):
+        # Submits every uncached statement at once and polls them together; failed ones map to False
+        results = {}
+        pending = []
+        for query in queries:
+            cached = self.result_cache.get(self.database, query) if self.result_cache is not None else None
+            if cached is not None:
+                self.tracer.record('athena_execution', 0, result_cache_hit=True)
+                results[query] = cached
+            elif query not in pending:
+                pending.append(query)
+
+        if pending:
+            started = time.perf_counter()
+            query_execution_ids = {}
+            query_executions = {}
+            try:
+                remaining = pending
+                while remaining:
+                    # Every statement holds its own slot until its wave finishes. Only a wave's first slot is
+                    # waited for, so a question never sits on slots while it waits for more of them.
+                    with ExitStack() as slots:
+                        wave = []
+                        for query in remaining:
+                            gate = slots.enter_context(self.admitted('athena', self.workgroup or 'primary',
+                                                                     blocking=not wave))
+                            if gate is None:
+                                break
+                            query_execution_ids[query] = self.start_athena_query(gate, query, True)
+                            wave.append(query)
+                        remaining = remaining[len(wave):]
+                        query_executions.update(wait_for_queries(
+                            self.athena_client, [query_execution_ids[query] for query in wave],
+                            policy=self.poll_policy, deadline=self.deadline, call=self.athena_call()))
+            except ServiceBusyError:
+                raise
+            except Exception as e:
+                print(f"Error executing queries: {e}")
+            query_seconds = time.perf_counter() - started
+
+            for query in pending:
+                query_execution = query_executions.get(query_execution_ids.get(query))
+                if query_execution is None:
+                    results[query] = False
+                    continue
+                stats = self._trace_query(query_execution)
+                status = query_execution['Status']
+                if status['State'] != 'SUCCEEDED':
+                    print(f"Error executing query: Query failed with status: {status['State']} "
+                          f"{status.get('StateChangeReason', '')}")
+                    if status['State'] == 'FAILED':
+                        self.query_errors[query] = status.get('StateChangeReason', '')
+                    results[query] = False
+                    continue
+                try:
+                    result_stream = self.open_result_stream(query_execution, max_rows or self.max_rows,
+                                                            max_bytes or self.max_bytes)
+                except Exception as e:
+                    print(f"Error reading results: {e}")
+                    results[query] = False
+                    continue
+                results[query] = self._record_result(query, result_stream, query_seconds, stats)
+
+        return [results[query] for query in queries]
+
+    def _trace_query(self, query_execution):
+        # Athena reports queue and engine time itself, so they are recorded rather than timed here
+        stats = query_timings(query_execution)
+        query_execution_id = query_execution['QueryExecutionId']
+        self.tracer.record('athena_queue', stats['queue_ms'] or 0, query_execution_id=query_execution_id)
+        self.tracer.record('athena_execution', stats['execution_ms'] or 0, query_execution_id=query_execution_id,
+                           state=query_execution['Status']['State'],
+                           data_scanned_bytes=stats['data_scanned_bytes'] or 0,
+                           reused_previous_result=stats['reused_previous_result'])
+        return stats
+
+    def _record_result(self, query, result_stream, query_seconds, stats):
+        if self.result_cache is None:
+            return result_stream
+
+        scanned_bytes = stats['data_scanned_bytes']
+
+        def cache_result(result, fetch_seconds):
+            self.result_cache.put(self.database, query, result,
+                                  cost_seconds=query_seconds + fetch_seconds, scanned_bytes=scanned_bytes)
+
+        return RecordingStream(result_stream, cache_result)
         
-    def create_standalone_query(self, query_ans_arr):
-        if len(query_ans_arr) > 0:
-            prompt = f'''Create a standalone question from the history:{query_ans_arr}. 
+    def open_result_stream(self, query_execution, max_rows, max_bytes):
+        # Large results are read straight from the CSV Athena wrote to the output bucket
+        query_execution_id = query_execution['QueryExecutionId']
+        call = self.athena_call()
+        if self.result_source_factory is None:
+            return ResultStream(self.athena_client, query_execution_id, max_rows=max_rows, max_bytes=max_bytes,
+                                call=call)
+
+        # The first page decides: a result that fits in it never touches S3, a longer one is read from the CSV
+        first_page = call(self.athena_client.get_query_results, QueryExecutionId=query_execution_id,
+                          MaxResults=min(S3_RESULT_MIN_ROWS, RESULT_PAGE_SIZE))
+        if not first_page.get('NextToken'):
+            return ResultStream(self.athena_client, query_execution_id, max_rows=max_rows, max_bytes=max_bytes,
+                                first_page=first_page, call=call)
+
+        output_location = query_execution['ResultConfiguration']['OutputLocation']
+        self.tracer.record('result_reader', 0, reader='s3', query_execution_id=query_execution_id)
+        column_info = first_page['ResultSet']['ResultSetMetadata']['ColumnInfo']
+        return CsvResultStream(self.result_source_factory(output_location), column_info, max_rows=max_rows,
+                               max_bytes=max_bytes)
+
+    def standalone_prompt(self, query_ans_arr):
+        return f'''Create a standalone question from the history:{query_ans_arr}. 
             Write the standalone question in between tags like <SAQ></SAQ>.'''
+
+    def sql_prompt(self, query, client, examples=()):
+        # The prompt always asks for a client filter, so client columns survive pruning
+        stats = {}
+        with self.tracer.span('schema_prune') as span:
+            schema = prompt_schema(self.schema, query, stats, required=('client',))
+            for key, value in stats.items():
+                span.set(key, value)
+        self.last_schema_stats = stats
+        return f'''Use the schema for table {self.table_name} mentioned below to prepare query. 
+                Schema - {schema}. Please provide the SQL query for this question:{query} and for client {client} ''' \
+            + examples_prompt(examples)
+
+    def retrieve_examples(self, query, client):
+        # [(score, example)] nearest to `query` among questions on this table that ran successfully
+        if self.sql_examples is None:
+            return []
+        with self.tracer.span('example_retrieval') as span:
+            examples = self.sql_examples.search(self.table_name, client, query)
+            span.set('examples', len(examples))
+            if examples:
+                span.set('top_score', round(examples[0][0], 3))
+        return examples
+
+    def record_sql_outcome(self, client, query, sql_queries, examples, first_try, succeeded):
+        # Called for generated (not memoized) SQL only; successful SQL becomes an example for later questions
+        self.tracer.record('sql_outcome', 0, first_try=int(first_try), examples=len(examples))
+        if self.sql_examples is None:
+            return
+        self.sql_examples.record_outcome(first_try, bool(examples))
+        if succeeded and sql_queries:
+            self.sql_examples.add(self.table_name, client, query, sql_queries)
+
+    def create_standalone_query(self, query_ans_arr, usage=None):
+        if len(query_ans_arr) > 0:
+            prompt = self.standalone_prompt(query_ans_arr)
         
-            llm_response = self.get_llm_response(prompt)
+            llm_response = self.get_llm_response(prompt, 'standalone_rewrite', stop_tag='</SAQ>', open_tag=None,
+                                                 usage=usage)
             query_standalone = self.extract_standalone_query(llm_response)
             return query_standalone
 
 
     def get_answer(self, query, client, prompt=None):
+        return ''.join(self.get_answer_stream(query, client, prompt))
+
+    def fork(self, query_ans_arr):
+        # Shares clients, caches, schema and concurrency limits; per-question state is fresh
+        agent = copy.copy(self)
+        agent.query_ans_arr = list(query_ans_arr)
+        agent.stage_timings = {}
+        agent.last_query_stats = None
+        agent.last_query_execution = None
+        agent.last_schema_stats = None
+        agent.sql_repairs = 0
+        agent.query_errors = {}
+        agent.guardrail_decisions = []
+        agent.standalone_query = None
+        agent.stage_models = {}
+        agent.example_stats = None
+        return agent
+
+    def get_answers(self, questions, client, max_workers=BATCH_MAX_WORKERS):
+        # The schema is fetched once and shared by every question in the batch; False marks a failed fetch
+        if not self.schema:
+            self.get_set_db_schema()
+
+        def answer(item):
+            if isinstance(item, str):
+                item = {'question': item}
+            # Long client-sent histories are cut to a rolling summary plus the last few turns, as in the stream path
+            agent = self.fork(bounded_history(item.get('query_ans_arr', [])))
+            started = time.perf_counter()
+            try:
+                result = {'answer': agent.get_answer(item['question'], item.get('client', client)), 'error': None}
+            except Exception as e:
+                print(f"Error answering {item['question']}: {e}")
+                result = {'answer': None, 'error': str(e)}
+            result.update({
+                'question': item['question'],
+                'seconds': round(time.perf_counter() - started, 3),
+                'stage_timings': {stage: round(seconds, 3) for stage, seconds in agent.stage_timings.items()},
+                'guardrails': agent.guardrail_decisions,
+                'models': agent.stage_models,
+                'sql_examples': agent.example_stats,
+            })
+            return result
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(answer, questions))
+
+    def get_answer_stream(self, query, client, prompt=None):
+        self.stage_timings = {}
+        self.stage_models = {}
+        self.example_stats = None
+        history = list(self.query_ans_arr)
         self.query_ans_arr.append(query)
-        if query:
-            print("query")
-            query = self.create_standalone_query(self.query_ans_arr)
-            print(query)
+        rewrite = bool(query) and needs_standalone_rewrite(query, history)
 
-        if prompt:
-            prompt = prompt
-        else:
-            prompt = f'''Use the schema for table {self.table_name} mentioned below to prepare query. 
-            Schema - {self.schema}. Please provide the SQL query for this question:{query} and for client {client} '''
-            
-        # print(f"prompt: {prompt}") 
-        llm_response = self.get_llm_response(prompt)
-        sql_query = self.extract_sql(llm_response)
-        print(f"llm_response: {llm_response}") 
-        print(f"sql_query: {sql_query}") 
-        sql_response = self.execute_sql_query(sql_query)
-        response_summary = self.summarize_sql_response(query, f'<data> {sql_response}')
-
-        return response_summary
+        # The schema fetch and the standalone rewrite are independent, so overlap them
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            schema_future = None
+            if not self.schema:
+                schema_future = executor.submit(self._timed_stage, 'schema', self.get_set_db_schema)
+            if rewrite:
+                standalone = self._timed_stage('standalone_rewrite', self.create_standalone_query, self.query_ans_arr,
+                                               usage={})
+                query = standalone or query
+            if schema_future is not None:
+                schema_future.result()
+        self.standalone_query = query
+        overlapped = time.perf_counter() - started
+        self.stage_timings['schema_and_rewrite'] = overlapped
+        self.stage_timings['overlap_saved'] = max(
+            self.stage_timings.get('schema', 0) + self.stage_timings.get('standalone_rewrite', 0) - overlapped, 0)
+
+        message, summary_input = run_steps(answer_steps(self, self, query, client, prompt), self.run_step)
+        if message is not None:
+            yield message
+            return
+        started = time.perf_counter()
+        usage = {}
+        with self.tracer.span('summarization') as span:
+            for chunk in self.summarize_sql_response_stream(*summary_input, usage):
+                if 'summary_first_token' not in self.stage_timings:
+                    self.stage_timings['summary_first_token'] = time.perf_counter() - started
+                    span.set('first_token_ms', round(self.stage_timings['summary_first_token'] * 1000, 3))
+                yield chunk
+            span.usage(usage)
+        self.stage_timings['summarization'] = time.perf_counter() - started
+
+    def run_step(self, stage, *args):
+        # Runs a step of answer_steps (see there) in this thread, timed as its stage
+        if stage in ('sql_generation', 'sql_repair'):
+            # Under the latency policy a repair is where a draft from the fast model falls back to the larger one
+            return self._timed_stage(stage, self.get_llm_response, *args, stage, usage={})
+        if stage == 'guardrails':
+            return self._timed_stage(stage, self.guard_sqls, *args)
+        return self._timed_stage(stage, self.run_sql_queries, *args)
+
+    def run_sql_queries(self, sql_queries):
+        if len(sql_queries) > 1:
+            sql_response = self.stream_sql_queries(sql_queries)
+            return sql_response, all(result is not False for result in sql_response)
+        sql_response = self.stream_sql_query(sql_queries[0] if sql_queries else "")
+        return sql_response, sql_response is not False
+
+    def validate_sqls(self, sql_queries):
+        # (sql, problem) for every statement that should not be sent to Athena
+        if not sql_queries:
+            return [('', 'no SQL statement between <SQL></SQL> tags')]
+        columns = [column[0] for column in schema_index(self.schema).columns] if self.schema else None
+        failures = []
+        for sql_query in sql_queries:
+            problems = validate_sql(sql_query, columns, self.table_name)
+            if problems:
+                failures.append((sql_query, '; '.join(problems)))
+        return failures
+
+    def repair_prompt(self, query, client, failures):
+        problems = '\n'.join(f"<SQL>{sql_query}</SQL> was rejected: {problem}" for sql_query, problem in failures)
+        return f'''{self.sql_prompt(query, client)}
+                The previous attempt did not work:
+                {problems}
+                Respond with the corrected SQL query only.'''
+
+    def guard_sqls(self, query, sql_queries, deadline=None):
+        """(sql_queries, decisions, failures) after the LIMIT, partition and scan-budget guardrails."""
+        planned = self.plan_guards(query, sql_queries)
+        estimates = [self.estimate_scan_bytes(sql_query, deadline) if explain else None
+                     for sql_query, _, _, explain in planned]
+        return self.finish_guards(planned, estimates)
+
+    def plan_guards(self, query, sql_queries):
+        # [(sql_query, decisions, problem, explain)] after the LIMIT and partition guardrails; `explain` marks the
+        # statements whose scan still has to be estimated, which the caller does with its own Athena client
+        partition_keys = [(name, data_type) for name, data_type, _, partition in schema_index(self.schema).columns
+                          if partition] if self.schema else []
+        planned = []
+        for sql_query in sql_queries:
+            sql_query, decision = add_limit(sql_query, query, self.max_rows)
+            statement_decisions = [decision]
+            sql_query, decision, problem = guard_partitions(sql_query, partition_keys, self.table_name,
+                                                            self.partition_policy)
+            if decision:
+                statement_decisions.append(decision)
+            explain = problem is None and bool(self.scan_budget_bytes)
+            if explain and self.result_cache is not None and self.result_cache.contains(self.database, sql_query):
+                # Served from the result cache without scanning, so an EXPLAIN round trip would be pure overhead
+                statement_decisions.append({'guardrail': 'scan_budget', 'action': 'skipped', 'reason': 'cached'})
+                explain = False
+            planned.append((sql_query, statement_decisions, problem, explain))
+        return planned
+
+    def finish_guards(self, planned, estimates):
+        # `estimates` holds estimate_scan_bytes' (estimate, problem) per planned statement, None where not explained
+        guarded, decisions, failures = [], [], []
+        for statement, ((sql_query, statement_decisions, problem, _), estimated) in enumerate(zip(planned, estimates)):
+            if estimated is not None:
+                estimate, problem = estimated
+                if problem is None:
+                    decision, problem = scan_budget_decision(estimate, self.scan_budget_bytes)
+                else:
+                    decision = {'guardrail': 'scan_budget', 'action': 'explain_failed', 'reason': problem}
+                statement_decisions.append(decision)
+            for decision in statement_decisions:
+                decision['statement'] = statement
+                self.tracer.record('guardrail', 0, **decision)
+            decisions.extend(statement_decisions)
+            if problem:
+                failures.append((sql_query, problem))
+            guarded.append(sql_query)
+        return guarded, decisions, failures
+
+    def estimate_scan_bytes(self, sql_query, deadline=None):
+        # EXPLAIN plans the query without reading data; a statement Athena can't plan fails here, before it runs
+        try:
+            with self.admitted('athena', self.workgroup or 'primary') as gate:
+                query_execution_id = self.start_athena_query(gate, explain_query(sql_query))
+                query_execution = wait_for_query(self.athena_client, query_execution_id, policy=self.poll_policy,
+                                                 deadline=deadline or self.deadline, call=self.athena_call(deadline))
+            status = query_execution['Status']
+            if status['State'] == 'FAILED':
+                return None, status.get('StateChangeReason', 'EXPLAIN failed')
+            if status['State'] != 'SUCCEEDED':
+                return None, None
+            rows = []
+            for page in iter_result_pages(self.athena_client, query_execution['QueryExecutionId'],
+                                          call=self.athena_call(deadline)):
+                rows.extend(page['ResultSet']['Rows'])
+            return estimated_scan_bytes(rows), None
+        except ServiceBusyError:
+            raise
+        except Exception as e:
+            print(f"Error estimating scan size: {e}")
+            return None, None
+
+    def guarded_question(self, query, decisions):
+        # Tell the summarizer about rows the guardrails filtered out or cut off
+        added = [decision for decision in decisions if decision.get('action') == 'added']
+        predicates = [decision['predicate'] for decision in added if 'predicate' in decision]
+        notes = []
+        if predicates:
+            notes.append(f"data limited to rows where {' and '.join(dict.fromkeys(predicates))}")
+        limits = {decision['kind']: decision['limit'] for decision in added if decision['guardrail'] == 'limit'}
+        if 'sample' in limits:
+            notes.append(f"only a sample of at most {limits['sample']} rows was fetched; totals and counts over it "
+                         f"are not totals for the whole table")
+        if 'row_budget' in limits:
+            notes.append(f"results were capped at {limits['row_budget'] - 1} rows")
+        if not notes:
+            return query
+        return f"{query} ({'; '.join(notes)})"
+
+    def failure_message(self, failures):
+        problems = '; '.join(problem for _, problem in failures)
+        return f"I could not answer this question: {problems}"
+
+    def _timed_stage(self, stage, fn, *args, **kwargs):
+        return timed_stage(self, self.tracer, stage, fn, *args, **kwargs)
 
     def summarize_sql_response(self, query, sql_response):
+        return ''.join(self.summarize_sql_response_stream(query, sql_response))
+
+    def summarize_sql_response_stream(self, query, sql_response, usage=None):
+        return self.stream_summary(self.summary_prompt(query, sql_response), usage=usage)
+
+    def summary_prompt(self, query, sql_response):
+        if isinstance(sql_response, list):
+            # Results of several statements are merged into one summarization call
+            blocks = []
+            for i, result in enumerate(sql_response, 1):
+                text = self.render_result_stream(result) if hasattr(result, 'columns') else f'<data> {result}'
+                blocks.append(f"result {i}:\n{text}")
+            sql_response = '\n\n'.join(blocks)
+        elif hasattr(sql_response, 'columns'):
+            sql_response = self.render_result_stream(sql_response)
+        elif not str(sql_response).startswith('<data>'):
+            sql_response = f'<data> {sql_response}'
         prompt = f"Analyze the data mentioned below and respond only with the analysis based on the given Question {query}  : {sql_response}"
         # prompt = f"Summarize: {sql_response}"
-        response = self.summary_llm_agent(prompt)
-        return response
+        return prompt
+
+    def render_result_stream(self, result_stream):
+        # Consume the stream row by row; the stream's own budget bounds the size
+        with self.tracer.span('result_fetch') as span:
+            rows = list(result_stream)
+            if len(rows) > PROFILE_MIN_ROWS:
+                # Large results are summarized from local column statistics plus a sample
+                text = profile_for_prompt(result_stream.columns, result_stream.column_types, rows,
+                                          token_budget=self.summary_token_budget, truncated=result_stream.truncated)
+                span.set('profiled', True)
+            else:
+                stats = {}
+                text = format_result(result_stream, stats=stats, rows=rows)
+                span.set('saved_tokens', stats.get('saved_tokens'))
+            span.set('rows', len(rows))
+            span.set('truncated', bool(getattr(result_stream, 'truncated', False)))
+            span.set('prompt_tokens', estimate_tokens(text))
+        return f"<data>\n{text}"
 
     def extract_sql(self, text):
         pattern = r'<SQL>(.*?)</SQL>'
@@ -188,7 +912,19 @@ class SQL_Answer_Agent:
             # Replace newline characters with spaces
             return cleaned_match.replace('\n', ' ')
         else:
-            return "" #Future: Loop over the queries        return cleaned_matches[0] #Future: Loop over the queries
+            return ""
+
+    def extract_sqls(self, text):
+        # Every <SQL> block, deduplicated on normalized text and capped at MAX_SQL_STATEMENTS
+        sql_queries = []
+        seen = set()
+        for match in re.findall(r'<SQL>(.*?)</SQL>', text, re.DOTALL):
+            sql_query = match.strip().replace('\n', ' ')
+            key = normalize_sql(sql_query)
+            if key and key not in seen:
+                seen.add(key)
+                sql_queries.append(sql_query)
+        return sql_queries[:MAX_SQL_STATEMENTS]
         
     def extract_standalone_query(self, text):
         pattern = r'<SAQ>(.*?)</SAQ>'
@@ -202,28 +938,15 @@ class SQL_Answer_Agent:
             return "" #Future: Loop over the queries        return cleaned_matches[0] #Future: Loop over the queries
         
     
-    def summary_llm_agent(self, content, modelId = "anthropic.claude-3-sonnet-20240229-v1:0"):
-        # "anthropic.claude-3-sonnet-20240229-v1:0"
-        input = {
-            "modelId": modelId, 
-            "contentType": 'application/json',
-            "accept": '*/*',
-            "body": json.dumps({
-                "max_tokens": 15000, 
-                "system": f'''I have the following SQL data start after <data> tag: Can you provide a summary from this data? ''', 
-                "messages": [{"role": "user", "content": content}], 
-                "anthropic_version": "bedrock-2023-05-31"
-            })
-        }
-        
-        response = self.bedrock_client.invoke_model(
-            body=input["body"],
-            modelId=input["modelId"],
-            accept=input["accept"],
-            contentType=input["contentType"]
-        )
-
-        response_body = json.loads(response['body'].read())
-        response = response_body.get('content')[0].get('text')
+    def stream_summary(self, content, usage=None):
+        return self.stream_llm_response(content, SUMMARY_SYSTEM_PROMPT, 'summarization', usage)
+
+    def summary_llm_agent(self, content):
+        response = ''.join(self.stream_summary(content))
         # print(response)
-        return response
\ No newline at end of file
+        return response
+
+
+if PREWARM == 'always' or (PREWARM == 'auto' and
+                           os.environ.get('AWS_LAMBDA_INITIALIZATION_TYPE') == 'provisioned-concurrency'):
+    prewarm()
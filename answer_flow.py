@@ -0,0 +1,134 @@
+import time
+
+from sql_memo import schema_fingerprint
+from sql_validate import only_unknown_columns
+
+
+class QuestionState:
+    """What answering one question records, for agents that keep it off the (shared) agent.
+
+    SQL_Answer_Agent carries the same attributes itself and passes itself as
+    the state; the async agent answers many questions at once and gives each
+    its own QuestionState.
+    """
+
+    def __init__(self) -> None:
+        self.stage_timings = {}
+        # Model that served each LLM stage
+        self.stage_models = {}
+        # What the guardrails did to the statements, for the answer metadata
+        self.guardrail_decisions = []
+        self.sql_repairs = 0
+        # Athena's reason for each statement that failed
+        self.query_errors = {}
+        self.example_stats = None
+        # The question after the standalone rewrite, which is what a session remembers
+        self.standalone_query = None
+
+
+def timed_stage(state, tracer, stage, fn, *args, **kwargs):
+    # A `usage` keyword is passed through to the LLM call and its token counts land on the span.
+    # Stages that run more than once for a question (repairs, retried queries) accumulate.
+    started = time.perf_counter()
+    with tracer.span(stage) as span:
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            state.stage_timings[stage] = state.stage_timings.get(stage, 0) + time.perf_counter() - started
+            if 'usage' in kwargs:
+                span.usage(kwargs['usage'])
+
+
+def answer_steps(agent, state, query, client, prompt=None):
+    """Generator that takes one question from SQL to something to summarize.
+
+    Runs after the schema fetch and standalone rewrite. Every step that waits
+    on a service is yielded as (stage, args) for the driving agent to run,
+    which sends back its result:
+
+        ('sql_generation', (prompt,)) / ('sql_repair', (prompt,)) -> LLM text
+        ('guardrails', (question, sql_queries)) -> (sql_queries, decisions, failures)
+        ('athena', (sql_queries,)) -> (sql_response, succeeded)
+
+    Returns (message, None) when the question can't be answered, otherwise
+    (None, (question, sql_response)) for the summarization.
+    """
+    tracer = agent.tracer
+    # A repeat question against an unchanged schema skips the SQL-generation call
+    use_memo = agent.sql_memo is not None and not prompt
+    sql_queries = None
+    if use_memo:
+        fingerprint = schema_fingerprint(agent.schema)
+        sql_queries = agent.sql_memo.get(agent.table_name, client, query, fingerprint)
+
+    memoized = bool(sql_queries)
+    examples = []
+    if memoized:
+        tracer.record('sql_generation', 0, memoized=True, statements=len(sql_queries))
+    else:
+        if not prompt:
+            examples = agent.retrieve_examples(query, client)
+            prompt = agent.sql_prompt(query, client, examples)
+        sql_queries = agent.extract_sqls((yield 'sql_generation', (prompt,)))
+
+    # Invalid SQL is repaired before it costs an Athena round trip; memoized SQL already ran successfully
+    state.sql_repairs = 0
+    state.query_errors = {}
+    state.guardrail_decisions = []
+    failures = [] if memoized else timed_stage(state, tracer, 'sql_validation', agent.validate_sqls, sql_queries)
+    guarded = memoized
+    # The SQL as generated (and repaired); the example index learns from this, not the LIMITs and predicates
+    # the guardrails added for this one question
+    generated = sql_queries
+    while True:
+        if failures:
+            # Bounded by sql_repair_attempts per question, shared between local and Athena errors
+            while failures and state.sql_repairs < agent.sql_repair_attempts:
+                state.sql_repairs += 1
+                llm_response = yield 'sql_repair', (agent.repair_prompt(query, client, failures),)
+                sql_queries = agent.extract_sqls(llm_response) or sql_queries
+                # Resubmitting a statement Athena already rejected would only fail again
+                failures = agent.validate_sqls(sql_queries) + [(sql_query, state.query_errors[sql_query])
+                                                               for sql_query in sql_queries
+                                                               if sql_query in state.query_errors]
+            # Repaired SQL is new SQL, memoized or not, and is guarded before it runs or is memoized
+            guarded = False
+            generated = sql_queries
+            # With repairs used up, columns only the local validator doesn't know are left for Athena to judge
+            if any(sql_query in state.query_errors or not only_unknown_columns(problem)
+                   for sql_query, problem in failures):
+                return agent.failure_message(failures), None
+            failures = []
+        if not guarded:
+            guarded = True
+            # A query over the scan budget goes back through repair like invalid SQL
+            sql_queries, state.guardrail_decisions, failures = yield 'guardrails', (query, sql_queries)
+            if failures:
+                continue
+        sql_response, succeeded = yield 'athena', (sql_queries,)
+        # Athena's own error message gets one more repair round while attempts remain
+        failures = [(sql, state.query_errors[sql]) for sql in sql_queries if sql in state.query_errors]
+        if succeeded or not failures or state.sql_repairs >= agent.sql_repair_attempts:
+            break
+
+    if use_memo and sql_queries and succeeded:
+        agent.sql_memo.put(agent.table_name, client, query, fingerprint, sql_queries)
+    if not memoized:
+        first_try = succeeded and state.sql_repairs == 0
+        state.example_stats = {'used': len(examples), 'first_try': first_try}
+        agent.record_sql_outcome(client, query, generated, examples, first_try, succeeded)
+    if sql_response is False:
+        # Nothing to summarize; say why instead of asking the model to summarize `False`
+        return agent.failure_message(failures or [('', 'the query did not complete')]), None
+    return None, (agent.guarded_question(query, state.guardrail_decisions), sql_response)
+
+
+def run_steps(steps, run_step):
+    # Drives answer_steps with a blocking run_step(stage, *args) and returns its result
+    result = None
+    while True:
+        try:
+            stage, args = steps.send(result)
+        except StopIteration as done:
+            return done.value
+        result = run_step(stage, *args)
@@ -0,0 +1,324 @@
+import asyncio
+import functools
+import os
+import time
+from contextlib import asynccontextmanager
+
+from admission import ServiceBusyError
+from answer_flow import QuestionState, answer_steps
+from athena_polling import QueryFailedError, query_timings, wait_for_query_async
+from sql_guardrails import estimated_scan_bytes, explain_query
+from bedrock_stream import iter_stream_text, stop_reading
+from conversation import bounded_history, needs_standalone_rewrite
+from schema_cache import fetch_glue_schema
+
+from amazon_aws import SQL_SYSTEM_PROMPT, SUMMARY_SYSTEM_PROMPT
+
+ASYNC_BEDROCK_CONCURRENCY = int(os.environ.get('ASYNC_BEDROCK_CONCURRENCY', '32'))
+ASYNC_ATHENA_CONCURRENCY = int(os.environ.get('ASYNC_ATHENA_CONCURRENCY', '20'))
+
+_DONE = object()
+
+
+class AsyncSQLAnswerAgent:
+    """asyncio front end for SQL_Answer_Agent.
+
+    The wrapped agent supplies configuration, caches, prompts and parsing;
+    blocking boto3 calls are offloaded to `executor` and Athena is polled with
+    asyncio.sleep, so one event loop can keep hundreds of questions in flight.
+    Per-question state lives in a QuestionState, never on the agent; the
+    steps from SQL generation to the Athena results are answer_flow's, shared
+    with the wrapped agent.
+    """
+
+    def __init__(self, agent, executor=None, bedrock_concurrency=ASYNC_BEDROCK_CONCURRENCY,
+                 athena_concurrency=ASYNC_ATHENA_CONCURRENCY) -> None:
+        self.agent = agent
+        self.executor = executor
+        self.bedrock_limit = asyncio.Semaphore(bedrock_concurrency)
+        self.athena_limit = asyncio.Semaphore(athena_concurrency)
+        self._schema_lock = asyncio.Lock()
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    async def stream_llm_response(self, content, system, stage='sql_generation', usage=None, models=None):
+        agent = self.agent
+        # agent.route() would record the model on the shared agent, so the table is read directly and the
+        # model is recorded in the question's own `models`
+        route = agent.routes.get(stage) or agent.routes['sql_generation']
+        if models is not None:
+            models[stage] = route.model_id
+        body = agent.llm_request_body(content, system, route)
+        usage = {} if usage is None else usage
+        gate = agent.admission.gate('bedrock', route.model_id)
+        async with self.admitted(self.bedrock_limit, gate, agent.tracer):
+            with agent.tracer.span('bedrock', route=stage, model=route.model_id) as span:
+                started = time.perf_counter()
+                response = await gate.call_async(self._run, agent.bedrock_client.invoke_model_with_response_stream,
+                                                 body=body, modelId=route.model_id, accept='*/*',
+                                                 contentType='application/json', tracer=agent.tracer)
+                chunks = iter_stream_text(response, usage)
+                try:
+                    first = True
+                    while True:
+                        chunk = await self._run(next, chunks, _DONE)
+                        if chunk is _DONE:
+                            return
+                        if first:
+                            span.set('first_token_ms', round((time.perf_counter() - started) * 1000, 3))
+                            first = False
+                        yield chunk
+                finally:
+                    chunks.close()
+                    span.usage(usage)
+
+    async def get_llm_response(self, content, stage='sql_generation', stop_tag='</SQL>', open_tag='<SQL>',
+                               usage=None, models=None):
+        text = ''
+        chunks = self.stream_llm_response(content, SQL_SYSTEM_PROMPT, stage, usage, models)
+        try:
+            async for chunk in chunks:
+                text += chunk
+                if stop_reading(text, stop_tag, open_tag):
+                    break
+        finally:
+            await chunks.aclose()
+        return text
+
+    @asynccontextmanager
+    async def admitted(self, limit, gate, tracer):
+        # This loop's own semaphore bounds concurrency; the shared gate paces calls and keeps the wait stats
+        started = time.monotonic()
+        async with limit:
+            gate.record_wait(time.monotonic() - started, 'slot', tracer)
+            yield
+
+    def athena_run(self, deadline=None):
+        # run(fn, **kwargs) for polling calls: off the loop, paced and retried while throttled
+        gate = self.agent.admission.gate('athena_api', self.agent.workgroup or 'primary')
+        return functools.partial(gate.call_async, self._run, deadline=deadline, tracer=self.agent.tracer)
+
+    async def start_sql_query(self, query, reuse_results=False, deadline=None):
+        agent = self.agent
+        gate = agent.admission.gate('athena', agent.workgroup or 'primary')
+        async with self.admitted(self.athena_limit, gate, agent.tracer):
+            response = await gate.call_async(self._run, agent.athena_client.start_query_execution, deadline=deadline,
+                                             tracer=agent.tracer, **agent._query_request(query, reuse_results))
+            query_execution = await wait_for_query_async(agent.athena_client, response['QueryExecutionId'],
+                                                         policy=agent.poll_policy, deadline=deadline,
+                                                         run=self.athena_run(deadline))
+        agent._trace_query(query_execution)
+        status = query_execution['Status']
+        if status['State'] != 'SUCCEEDED':
+            raise QueryFailedError(query_execution['QueryExecutionId'], status['State'],
+                                   status.get('StateChangeReason', ''))
+        return query_execution
+
+    async def execute_sql_query(self, query, deadline=None):
+        # Raw Athena rows, as SQL_Answer_Agent.execute_sql_query returns them (used for DESCRIBE)
+        if not query:
+            return False
+        try:
+            query_execution = await self.start_sql_query(query, deadline=deadline)
+            return await self._run(self.agent.fetch_rows, query_execution['QueryExecutionId'])
+        except ServiceBusyError:
+            raise
+        except Exception as e:
+            print(f"Error executing query: {e}")
+            return False
+
+    async def stream_sql_query(self, query, deadline=None, errors=None):
+        # Athena's reason for a FAILED query is written to `errors`, keyed by the SQL
+        agent = self.agent
+        if not query:
+            return False
+        try:
+            if agent.result_cache is not None:
+                cached = agent.result_cache.get(agent.database, query)
+                if cached is not None:
+                    agent.tracer.record('athena_execution', 0, result_cache_hit=True)
+                    return cached
+            started = time.perf_counter()
+            query_execution = await self.start_sql_query(query, reuse_results=True, deadline=deadline)
+            stats = query_timings(query_execution)
+            query_seconds = time.perf_counter() - started
+            result_stream = await self._run(agent.open_result_stream, query_execution, agent.max_rows, agent.max_bytes)
+            return agent._record_result(query, result_stream, query_seconds, stats)
+        except ServiceBusyError:
+            raise
+        except Exception as e:
+            print(f"Error executing query: {e}")
+            if errors is not None and isinstance(e, QueryFailedError) and e.state == 'FAILED':
+                errors[query] = e.reason
+            return False
+
+    async def estimate_scan_bytes(self, sql_query, deadline=None):
+        # Async twin of SQL_Answer_Agent.estimate_scan_bytes: the EXPLAIN takes a slot of this loop's Athena
+        # semaphore and is polled with asyncio.sleep, like any other statement
+        try:
+            query_execution = await self.start_sql_query(explain_query(sql_query), deadline=deadline)
+            rows = await self._run(self.agent.fetch_rows, query_execution['QueryExecutionId'])
+            return estimated_scan_bytes(rows), None
+        except ServiceBusyError:
+            raise
+        except QueryFailedError as e:
+            return None, (e.reason or 'EXPLAIN failed') if e.state == 'FAILED' else None
+        except Exception as e:
+            print(f"Error estimating scan size: {e}")
+            return None, None
+
+    async def guard_sqls(self, query, sql_queries, deadline=None):
+        agent = self.agent
+        planned = agent.plan_guards(query, sql_queries)
+
+        async def estimate(sql_query, explain):
+            return await self.estimate_scan_bytes(sql_query, deadline) if explain else None
+
+        estimates = await asyncio.gather(*(estimate(sql_query, explain) for sql_query, _, _, explain in planned))
+        return agent.finish_guards(planned, list(estimates))
+
+    async def run_sql_queries(self, sql_queries, deadline=None, errors=None):
+        if len(sql_queries) > 1:
+            sql_response = list(await asyncio.gather(*(self.stream_sql_query(sql_query, deadline, errors)
+                                                       for sql_query in sql_queries)))
+            return sql_response, all(result is not False for result in sql_response)
+        sql_response = await self.stream_sql_query(sql_queries[0] if sql_queries else "", deadline, errors)
+        return sql_response, sql_response is not False
+
+    async def get_set_db_schema(self, refresh=False, deadline=None):
+        agent = self.agent
+        # One DESCRIBE per table even when many questions arrive at once. The schema cache is read on every
+        # question, so TTL expiry and invalidate_schema reach this long-lived agent; a failed fetch (False) is
+        # retried rather than kept.
+        async with self._schema_lock:
+            if not refresh:
+                if agent.schema_cache is not None:
+                    cached = agent.schema_cache.get(agent.database, agent.table_name)
+                    if cached is not None:
+                        agent.schema = cached
+                        return True
+                elif agent.schema:
+                    return True
+            try:
+                if agent.glue_client is not None:
+                    schema = await self._run(fetch_glue_schema, agent.glue_client, agent.database, agent.table_name)
+                else:
+                    schema = await self.execute_sql_query(f"describe {agent.table_name};", deadline)
+            except ServiceBusyError:
+                raise
+            except Exception as e:
+                print(f"Error fetching schema: {e}")
+                return False
+            agent.schema = schema
+            if schema and agent.schema_cache is not None:
+                agent.schema_cache.put(agent.database, agent.table_name, schema)
+            return True
+
+    async def create_standalone_query(self, query_ans_arr, usage=None, models=None):
+        if len(query_ans_arr) > 0:
+            llm_response = await self.get_llm_response(self.agent.standalone_prompt(query_ans_arr),
+                                                       'standalone_rewrite', stop_tag='</SAQ>', open_tag=None,
+                                                       usage=usage, models=models)
+            return self.agent.extract_standalone_query(llm_response)
+
+    async def summarize_sql_response_stream(self, query, sql_response, usage=None, models=None):
+        # Rendering drains the result pages and may profile large results, so it runs off the loop
+        prompt = await self._run(self.agent.summary_prompt, query, sql_response)
+        async for chunk in self.stream_llm_response(prompt, SUMMARY_SYSTEM_PROMPT, 'summarization', usage, models):
+            yield chunk
+
+    async def summarize_sql_response(self, query, sql_response):
+        return ''.join([chunk async for chunk in self.summarize_sql_response_stream(query, sql_response)])
+
+    async def run_step(self, state, stage, *args, deadline=None):
+        # Runs a step of answer_flow.answer_steps on the loop, timed as its stage
+        started = time.perf_counter()
+        with self.agent.tracer.span(stage) as span:
+            try:
+                if stage in ('sql_generation', 'sql_repair'):
+                    usage = {}
+                    response = await self.get_llm_response(*args, stage, usage=usage, models=state.stage_models)
+                    span.usage(usage)
+                    return response
+                if stage == 'guardrails':
+                    return await self.guard_sqls(*args, deadline)
+                return await self.run_sql_queries(*args, deadline, state.query_errors)
+            finally:
+                state.stage_timings[stage] = state.stage_timings.get(stage, 0) + time.perf_counter() - started
+
+    async def get_answer_stream(self, query, client, query_ans_arr=(), deadline=None, state=None):
+        # `state` (a QuestionState) collects the timings, guardrail decisions, models and example stats
+        agent = self.agent
+        state = QuestionState() if state is None else state
+        # Long client-sent histories are cut to a rolling summary plus the last few turns
+        history = bounded_history(query_ans_arr)
+        rewrite = bool(query) and needs_standalone_rewrite(query, history)
+
+        tracer = agent.tracer
+
+        async def fetch_schema():
+            with tracer.span('schema'):
+                return await self.get_set_db_schema(deadline=deadline)
+
+        started = time.perf_counter()
+        schema_task = asyncio.ensure_future(fetch_schema())
+        try:
+            if rewrite:
+                usage = {}
+                with tracer.span('standalone_rewrite') as span:
+                    query = await self.create_standalone_query(history + [query], usage, state.stage_models) or query
+                    span.usage(usage)
+            await schema_task
+        finally:
+            schema_task.cancel()
+        state.standalone_query = query
+        state.stage_timings['schema_and_rewrite'] = time.perf_counter() - started
+
+        steps = answer_steps(agent, state, query, client)
+        result = None
+        while True:
+            try:
+                stage, args = steps.send(result)
+            except StopIteration as done:
+                message, summary_input = done.value
+                break
+            result = await self.run_step(state, stage, *args, deadline=deadline)
+        if message is not None:
+            yield message
+            return
+
+        started = time.perf_counter()
+        usage = {}
+        with tracer.span('summarization') as span:
+            async for chunk in self.summarize_sql_response_stream(*summary_input, usage, state.stage_models):
+                state.stage_timings.setdefault('summary_first_token', time.perf_counter() - started)
+                yield chunk
+            span.usage(usage)
+        state.stage_timings['summarization'] = time.perf_counter() - started
+
+    async def get_answer(self, query, client, query_ans_arr=(), deadline=None, state=None):
+        return ''.join([chunk async for chunk in self.get_answer_stream(query, client, query_ans_arr, deadline,
+                                                                        state)])
+
+    async def get_answers(self, questions, client, deadline=None):
+        async def answer(item):
+            if isinstance(item, str):
+                item = {'question': item}
+            state = QuestionState()
+            started = time.perf_counter()
+            try:
+                result = {'answer': await self.get_answer(item['question'], item.get('client', client),
+                                                          item.get('query_ans_arr', []), deadline, state),
+                          'error': None}
+            except Exception as e:
+                result = {'answer': None, 'error': str(e)}
+            result.update({'question': item['question'], 'seconds': round(time.perf_counter() - started, 3),
+                           'stage_timings': {stage: round(seconds, 3) for stage, seconds in state.stage_timings.items()},
+                           'guardrails': state.guardrail_decisions,
+                           'models': state.stage_models,
+                           'sql_examples': state.example_stats})
+            return result
+
+        return list(await asyncio.gather(*(answer(item) for item in questions)))
@@ -0,0 +1,169 @@
+import os
+import time
+
+POLL_INITIAL_SECONDS = float(os.environ.get('ATHENA_POLL_INITIAL_SECONDS', '0.1'))
+POLL_MAX_SECONDS = float(os.environ.get('ATHENA_POLL_MAX_SECONDS', '2'))
+DEADLINE_MARGIN_MS = int(os.environ.get('ATHENA_DEADLINE_MARGIN_MS', '3000'))
+
+TERMINAL_STATES = ('SUCCEEDED', 'FAILED', 'CANCELLED')
+BATCH_GET_MAX_IDS = 50
+
+
+class QueryTimeoutError(Exception):
+    def __init__(self, query_execution_id) -> None:
+        super().__init__(f"Query {query_execution_id} exceeded its deadline and was cancelled")
+        self.query_execution_id = query_execution_id
+
+
+class QueryFailedError(Exception):
+    def __init__(self, query_execution_id, state, reason='') -> None:
+        super().__init__(f"Query failed with status: {state} {reason}")
+        self.query_execution_id = query_execution_id
+        self.state = state
+        self.reason = reason
+
+
+class FixedPolicy:
+    def __init__(self, interval=2.0) -> None:
+        self.interval = interval
+
+    def delays(self):
+        while True:
+            yield self.interval
+
+
+class BackoffPolicy:
+    """Exponential backoff starting at `initial` seconds, capped at `maximum`."""
+
+    def __init__(self, initial=POLL_INITIAL_SECONDS, maximum=POLL_MAX_SECONDS, multiplier=2.0) -> None:
+        self.initial = initial
+        self.maximum = maximum
+        self.multiplier = multiplier
+
+    def delays(self):
+        delay = self.initial
+        while True:
+            yield delay
+            delay = min(delay * self.multiplier, self.maximum)
+
+
+def deadline_from_context(context, margin_ms=DEADLINE_MARGIN_MS):
+    # Leave a margin so a cancelled query can still be reported before Lambda exits
+    if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+        return None
+    remaining_ms = context.get_remaining_time_in_millis() - margin_ms
+    return time.monotonic() + max(remaining_ms, 0) / 1000
+
+
+def _call(fn, **kwargs):
+    return fn(**kwargs)
+
+
+def stop_queries(athena_client, query_execution_ids):
+    # Best effort: a query whose poll loop gave up must not keep running, and scanning, on its own
+    for query_execution_id in query_execution_ids:
+        try:
+            athena_client.stop_query_execution(QueryExecutionId=query_execution_id)
+        except Exception as e:
+            print(f"Could not stop query {query_execution_id}: {e}")
+
+
+def wait_for_query(athena_client, query_execution_id, policy=None, deadline=None, call=_call):
+    """The terminal QueryExecution of `query_execution_id`, stopping the query at `deadline`.
+
+    `call(fn, **kwargs)` makes each client call, e.g. through an admission
+    gate that paces polls and retries throttled ones; if it raises, the query
+    is stopped before the error propagates.
+    """
+    policy = policy or BackoffPolicy()
+    delays = policy.delays()
+    try:
+        while True:
+            result = call(athena_client.get_query_execution, QueryExecutionId=query_execution_id)
+            query_execution = result['QueryExecution']
+            if query_execution['Status']['State'] in TERMINAL_STATES:
+                return query_execution
+
+            delay = next(delays)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise QueryTimeoutError(query_execution_id)
+                delay = min(delay, remaining)
+            time.sleep(delay)
+    except Exception:
+        stop_queries(athena_client, [query_execution_id])
+        raise
+
+
+async def wait_for_query_async(athena_client, query_execution_id, policy=None, deadline=None, run=None):
+    """Async twin of wait_for_query: sleeps on the event loop and stops the query if cancelled or failed.
+
+    `run(fn, **kwargs)` awaits a blocking client call, by default in a worker thread.
+    """
+    # Only the async front end needs asyncio; the Lambda path never loads it
+    import asyncio
+
+    policy = policy or BackoffPolicy()
+    run = run or (lambda fn, **kwargs: asyncio.to_thread(fn, **kwargs))
+    delays = policy.delays()
+    try:
+        while True:
+            result = await run(athena_client.get_query_execution, QueryExecutionId=query_execution_id)
+            query_execution = result['QueryExecution']
+            if query_execution['Status']['State'] in TERMINAL_STATES:
+                return query_execution
+
+            delay = next(delays)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise QueryTimeoutError(query_execution_id)
+                delay = min(delay, remaining)
+            await asyncio.sleep(delay)
+    except (Exception, asyncio.CancelledError):
+        # Don't leave a runaway query behind a cancelled or failed caller
+        stop_queries(athena_client, [query_execution_id])
+        raise
+
+
+def wait_for_queries(athena_client, query_execution_ids, policy=None, deadline=None, call=_call):
+    # One shared poll loop for many queries: batch_get_query_execution takes up to 50 ids per call
+    policy = policy or BackoffPolicy()
+    delays = policy.delays()
+    pending = list(query_execution_ids)
+    finished = {}
+    try:
+        while True:
+            for start in range(0, len(pending), BATCH_GET_MAX_IDS):
+                response = call(athena_client.batch_get_query_execution,
+                                QueryExecutionIds=pending[start:start + BATCH_GET_MAX_IDS])
+                for query_execution in response['QueryExecutions']:
+                    if query_execution['Status']['State'] in TERMINAL_STATES:
+                        finished[query_execution['QueryExecutionId']] = query_execution
+            pending = [query_execution_id for query_execution_id in pending if query_execution_id not in finished]
+            if not pending:
+                return finished
+
+            delay = next(delays)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise QueryTimeoutError(', '.join(pending))
+                delay = min(delay, remaining)
+            time.sleep(delay)
+    except Exception:
+        stop_queries(athena_client, pending)
+        raise
+
+
+def query_timings(query_execution):
+    statistics = query_execution.get('Statistics', {})
+    return {
+        'queue_ms': statistics.get('QueryQueueTimeInMillis'),
+        'planning_ms': statistics.get('QueryPlanningTimeInMillis'),
+        'execution_ms': statistics.get('EngineExecutionTimeInMillis'),
+        'total_ms': statistics.get('TotalExecutionTimeInMillis'),
+        'data_scanned_bytes': statistics.get('DataScannedInBytes'),
+        'reused_previous_result': statistics.get('ResultReuseInformation', {}).get('ReusedPreviousResult', False),
+    }
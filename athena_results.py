@@ -0,0 +1,103 @@
+import os
+from decimal import Decimal
+
+RESULT_MAX_ROWS = int(os.environ.get('RESULT_MAX_ROWS', '10000'))
+RESULT_MAX_BYTES = int(os.environ.get('RESULT_MAX_BYTES', str(1024 * 1024)))
+RESULT_PAGE_SIZE = 1000
+
+INTEGER_TYPES = ('tinyint', 'smallint', 'integer', 'int', 'bigint')
+FLOAT_TYPES = ('double', 'float', 'real')
+
+
+def decode_value(value, athena_type):
+    if value is None:
+        return None
+    athena_type = (athena_type or '').lower()
+    try:
+        if athena_type in INTEGER_TYPES:
+            return int(value)
+        if athena_type in FLOAT_TYPES:
+            return float(value)
+        if athena_type == 'decimal':
+            return Decimal(value)
+        if athena_type == 'boolean':
+            return value.lower() == 'true'
+    except ValueError:
+        pass
+    return value
+
+
+def _call(fn, **kwargs):
+    return fn(**kwargs)
+
+
+def iter_result_pages(athena_client, query_execution_id, page_size=RESULT_PAGE_SIZE, first_page=None, call=_call):
+    # `call(fn, **kwargs)` makes each get_query_results call, e.g. through an admission gate
+    kwargs = {'QueryExecutionId': query_execution_id, 'MaxResults': page_size}
+    while True:
+        if first_page is not None:
+            page, first_page = first_page, None
+        else:
+            page = call(athena_client.get_query_results, **kwargs)
+        yield page
+        next_token = page.get('NextToken')
+        if not next_token:
+            return
+        kwargs['NextToken'] = next_token
+
+
+class ResultStream:
+    """Lazily pages through get_query_results and yields typed row tuples.
+
+    Iteration stops once `max_rows` or `max_bytes` is reached; `truncated`
+    records whether the budget cut the result short.
+    """
+
+    def __init__(self, athena_client, query_execution_id, max_rows=RESULT_MAX_ROWS, max_bytes=RESULT_MAX_BYTES,
+                 page_size=RESULT_PAGE_SIZE, first_page=None, call=_call) -> None:
+        self.athena_client = athena_client
+        self.call = call
+        self.query_execution_id = query_execution_id
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.page_size = page_size
+        self.first_page = first_page
+        self.columns = None
+        self.column_types = None
+        self.rows_read = 0
+        self.bytes_read = 0
+        self.truncated = False
+        self._consumed = False
+
+    def __iter__(self):
+        if self._consumed:
+            raise RuntimeError("ResultStream can only be iterated once")
+        self._consumed = True
+        return self._rows()
+
+    def _rows(self):
+        first_row = True
+        pages = iter_result_pages(self.athena_client, self.query_execution_id, self.page_size, self.first_page,
+                                  self.call)
+        self.first_page = None
+        for page in pages:
+            result_set = page['ResultSet']
+            if self.columns is None:
+                column_info = result_set.get('ResultSetMetadata', {}).get('ColumnInfo', [])
+                self.columns = [column['Name'] for column in column_info]
+                self.column_types = [column['Type'] for column in column_info]
+            for row in result_set['Rows']:
+                values = [datum.get('VarCharValue') for datum in row['Data']]
+                # SELECT results repeat the column names as the first row
+                if first_row:
+                    first_row = False
+                    if values == self.columns:
+                        continue
+                size = sum(len(value) for value in values if value is not None)
+                if self.rows_read >= self.max_rows or self.bytes_read + size > self.max_bytes:
+                    self.truncated = True
+                    return
+                self.rows_read += 1
+                self.bytes_read += size
+                yield tuple(decode_value(value, self.column_types[i] if i < len(self.column_types) else None)
+                            for i, value in enumerate(values))
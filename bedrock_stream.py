@@ -0,0 +1,63 @@
+import json
+
+
+def iter_stream_text(response, usage=None):
+    """Yield text deltas from an invoke_model_with_response_stream response.
+
+    Token counts reported by the stream are written into `usage` when given. A
+    stop sequence that ended the completion is yielded as the last delta.
+    Closing the generator early closes the underlying event stream.
+    """
+    body = response['body']
+    try:
+        for event in body:
+            chunk = event.get('chunk')
+            if not chunk:
+                continue
+            payload = json.loads(chunk['bytes'])
+            kind = payload.get('type')
+            if kind == 'content_block_delta':
+                text = payload.get('delta', {}).get('text')
+                if text:
+                    yield text
+            elif usage is not None and kind == 'message_start':
+                usage.update(payload.get('message', {}).get('usage', {}))
+            elif kind == 'message_delta':
+                delta = payload.get('delta', {})
+                if delta.get('stop_reason') == 'stop_sequence' and delta.get('stop_sequence'):
+                    # Bedrock leaves the matched stop sequence out of the text; tag parsers still need it
+                    yield delta['stop_sequence']
+                if usage is not None:
+                    usage.update(payload.get('usage', {}))
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+
+
+def stop_reading(text, stop_tag=None, open_tag=None):
+    """Whether the text read so far is complete, for read_until and the async agent.
+
+    It is once `stop_tag` has arrived; with `open_tag`, only when what follows
+    the last closing tag is not (the start of) another tagged block, so
+    several <SQL> blocks can still be collected.
+    """
+    if not stop_tag or stop_tag not in text:
+        return False
+    if not open_tag:
+        return True
+    tail = text.rsplit(stop_tag, 1)[1].lstrip()
+    return bool(tail) and not tail.startswith(open_tag) and not open_tag.startswith(tail)
+
+
+def read_until(chunks, stop_tag=None, open_tag=None):
+    """Read a text stream until `stop_tag` arrives instead of waiting for the full completion."""
+    text = ''
+    try:
+        for chunk in chunks:
+            text += chunk
+            if stop_reading(text, stop_tag, open_tag):
+                break
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    return text
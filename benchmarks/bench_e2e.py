@@ -0,0 +1,183 @@
+"""Offline end-to-end benchmark of amazon_aws.lambda_handler.
+
+Replays the payloads in test.json against fake Bedrock and Athena clients
+(benchmarks/fake_aws.py) at a configurable concurrency, then reports
+p50/p95/p99 latency, throughput and a per-stage breakdown. Results are
+written as JSON so runs can be compared:
+
+    python benchmarks/bench_e2e.py --requests 200 --concurrency 8 --output bench_e2e.json
+    python benchmarks/bench_e2e.py --compare bench_e2e.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Keep result reads on the paginated API; the fakes don't serve S3 objects
+os.environ.setdefault('RESULT_READER', 'off')
+
+import amazon_aws  # noqa: E402
+from client_registry import register_client  # noqa: E402
+from fake_aws import FakeAthena, FakeBedrock, Latency  # noqa: E402
+from model_routing import routing_table  # noqa: E402
+
+
+def load_payloads(path, default_client='bench'):
+    # test.json holds comma-separated objects rather than a JSON array
+    with open(path) as f:
+        entries = json.loads(f"[{f.read()}]")
+    payloads = []
+    for entry in entries:
+        body = dict(entry.get('body', entry))
+        body.setdefault('client', default_client)
+        payloads.append({'body': body})
+    return payloads
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'mean_ms': round(statistics.fmean(values) * 1000, 2) if values else None,
+        'p50_ms': round(percentile(values, 50) * 1000, 2) if values else None,
+        'p95_ms': round(percentile(values, 95) * 1000, 2) if values else None,
+        'p99_ms': round(percentile(values, 99) * 1000, 2) if values else None,
+    }
+
+
+def run(args):
+    athena = FakeAthena(rows=args.rows, queue=Latency(args.athena_queue_ms, args.sigma, seed=1),
+                        execution=Latency(args.athena_exec_ms, args.sigma, seed=2),
+                        api=Latency(args.athena_api_ms, args.sigma, seed=3))
+    bedrock = FakeBedrock(first_token=Latency(args.bedrock_first_token_ms, args.sigma, seed=4),
+                          per_token_ms=args.bedrock_per_token_ms,
+                          model_speed={'haiku': args.fast_model_speed})
+    register_client('athena', athena)
+    register_client('bedrock-runtime', bedrock, region_name='us-east-1')
+    if not args.caches:
+        # Zero TTLs turn every cache lookup into a miss
+        amazon_aws.schema_cache.ttl_seconds = 0
+        amazon_aws.result_cache.ttl_seconds = 0
+        amazon_aws.sql_memo.ttl_seconds = 0
+    amazon_aws.model_routes = routing_table(args.routing)
+    amazon_aws.agent_pool.clear()
+
+    payloads = load_payloads(args.payloads)
+    requests = [payloads[i % len(payloads)] for i in range(args.requests)]
+
+    def invoke(payload):
+        started = time.perf_counter()
+        response = amazon_aws.lambda_handler(json.loads(json.dumps(payload)), None)
+        return time.perf_counter() - started, response.get('metadata', {}).get('stage_timings', {})
+
+    devnull = open(os.devnull, 'w')
+    stdout = sys.stdout
+    if not args.verbose:
+        sys.stdout = devnull
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(invoke, requests))
+        wall_seconds = time.perf_counter() - started
+    finally:
+        sys.stdout = stdout
+        devnull.close()
+
+    latencies = [latency for latency, _ in results]
+    stages = {}
+    for _, stage_timings in results:
+        for stage, seconds in stage_timings.items():
+            stages.setdefault(stage, []).append(seconds)
+
+    return {
+        'config': vars(args),
+        'requests': len(requests),
+        'wall_seconds': round(wall_seconds, 3),
+        'throughput_rps': round(len(requests) / wall_seconds, 2),
+        'latency': summarize(latencies),
+        'stages': {stage: summarize(values) for stage, values in sorted(stages.items())},
+        'athena_queries': athena.started,
+        'bedrock_calls': bedrock.calls,
+        'bedrock_calls_by_model': bedrock.calls_by_model,
+        'admission': amazon_aws.admission.stats(),
+        'sql_examples': amazon_aws.sql_examples.stats(),
+    }
+
+
+def print_report(report, baseline=None):
+    def delta(current, previous):
+        if previous in (None, 0) or current is None:
+            return ''
+        return f" ({(current - previous) / previous * 100:+.1f}%)"
+
+    base_latency = (baseline or {}).get('latency', {})
+    print(f"requests {report['requests']} in {report['wall_seconds']}s, "
+          f"{report['throughput_rps']} req/s{delta(report['throughput_rps'], (baseline or {}).get('throughput_rps'))}")
+    for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+        print(f"  {key:<7} {report['latency'][key]}{delta(report['latency'][key], base_latency.get(key))}")
+    print(f"  athena queries {report['athena_queries']}, bedrock calls {report['bedrock_calls']}")
+    for model_id, calls in sorted(report.get('bedrock_calls_by_model', {}).items()):
+        print(f"    {model_id}: {calls}")
+    for gate, stats in sorted(report.get('admission', {}).items()):
+        print(f"  {gate} queue wait avg/max ms {stats['avg_queue_wait_ms']} / {stats['max_queue_wait_ms']}, "
+              f"throttled {stats['throttled']}")
+    examples = report.get('sql_examples')
+    if examples:
+        print(f"  sql examples {examples['examples']}, retrieval avg/max ms {examples['avg_search_ms']} / "
+              f"{examples['max_search_ms']}, first-try success {examples['first_try_success']}")
+    print('stages (mean / p95 ms):')
+    base_stages = (baseline or {}).get('stages', {})
+    for stage, values in report['stages'].items():
+        previous = base_stages.get(stage, {}).get('mean_ms')
+        print(f"  {stage:<20} {values['mean_ms']} / {values['p95_ms']}{delta(values['mean_ms'], previous)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--payloads', default=os.path.join(ROOT, 'test.json'))
+    parser.add_argument('--requests', type=int, default=60)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--rows', type=int, default=1000, help='rows in the synthetic result table')
+    parser.add_argument('--athena-queue-ms', type=float, default=150)
+    parser.add_argument('--athena-exec-ms', type=float, default=800)
+    parser.add_argument('--athena-api-ms', type=float, default=40)
+    parser.add_argument('--bedrock-first-token-ms', type=float, default=600)
+    parser.add_argument('--bedrock-per-token-ms', type=float, default=15)
+    parser.add_argument('--routing', choices=('quality', 'latency'), default='quality',
+                        help='model routing policy, see model_routing.py')
+    parser.add_argument('--fast-model-speed', type=float, default=0.4,
+                        help='latency multiplier of the fast model relative to the default one')
+    parser.add_argument('--sigma', type=float, default=0.3, help='log-normal spread of every latency')
+    parser.add_argument('--caches', action='store_true', help='keep schema/result/SQL caches enabled')
+    parser.add_argument('--output', help='write the report as JSON to this path')
+    parser.add_argument('--compare', help='JSON report from an earlier run to diff against')
+    parser.add_argument('--verbose', action='store_true', help='keep the handler logs')
+    args = parser.parse_args()
+
+    report = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
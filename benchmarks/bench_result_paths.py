@@ -0,0 +1,98 @@
+"""Compare the paginated get_query_results path with the direct CSV reader.
+
+Runs fully offline: a synthetic result is written as an Athena-style CSV under
+a local bucket directory, and a fake Athena client serves the same rows page by
+page with a configurable per-request latency.
+
+    python benchmarks/bench_result_paths.py --rows 100000 --page-latency-ms 80
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from athena_results import ResultStream  # noqa: E402
+from s3_results import CsvResultStream, LocalObjectSource  # noqa: E402
+
+COLUMN_INFO = [
+    {'Name': 'account_id', 'Type': 'varchar'},
+    {'Name': 'posting_amount', 'Type': 'double'},
+    {'Name': 'fiscal_year', 'Type': 'integer'},
+]
+
+
+def synthetic_rows(count):
+    for i in range(count):
+        yield [str(100000 + i % 251), f"{(i * 37) % 10000 / 7:.2f}", str(2020 + i % 5)]
+
+
+class PagedAthena:
+    def __init__(self, rows, latency) -> None:
+        self.rows = rows
+        self.latency = latency
+
+    def get_query_results(self, QueryExecutionId, MaxResults=1000, NextToken=None):
+        time.sleep(self.latency)
+        start = int(NextToken or 0)
+        page = self.rows[start:start + MaxResults]
+        rows = [{'Data': [{'VarCharValue': value} for value in row]} for row in page]
+        if start == 0:
+            rows.insert(0, {'Data': [{'VarCharValue': column['Name']} for column in COLUMN_INFO]})
+        response = {'ResultSet': {'Rows': rows, 'ResultSetMetadata': {'ColumnInfo': COLUMN_INFO}}}
+        if start + MaxResults < len(self.rows):
+            response['NextToken'] = str(start + MaxResults)
+        return response
+
+
+class SlowLocalSource(LocalObjectSource):
+    def __init__(self, root, bucket, key, latency) -> None:
+        super().__init__(root, bucket, key)
+        self.latency = latency
+
+    def read_range(self, start, end):
+        time.sleep(self.latency)
+        return super().read_range(start, end)
+
+
+def timed(stream):
+    started = time.perf_counter()
+    count = sum(1 for _ in stream)
+    return count, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--page-latency-ms', type=float, default=80)
+    parser.add_argument('--range-latency-ms', type=float, default=30)
+    parser.add_argument('--chunk-kb', type=int, default=1024)
+    args = parser.parse_args()
+
+    rows = list(synthetic_rows(args.rows))
+    with tempfile.TemporaryDirectory() as root:
+        os.makedirs(os.path.join(root, 'llm-output-bucket'))
+        with open(os.path.join(root, 'llm-output-bucket', 'bench.csv'), 'w', newline='') as f:
+            writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+            writer.writerow([column['Name'] for column in COLUMN_INFO])
+            writer.writerows(rows)
+
+        athena = PagedAthena(rows, args.page_latency_ms / 1000)
+        paged = ResultStream(athena, 'bench', max_rows=args.rows, max_bytes=1 << 40)
+        paged_count, paged_seconds = timed(paged)
+
+        source = SlowLocalSource(root, 'llm-output-bucket', 'bench.csv', args.range_latency_ms / 1000)
+        direct = CsvResultStream(source, COLUMN_INFO, max_rows=args.rows, max_bytes=1 << 40,
+                                 chunk_bytes=args.chunk_kb * 1024)
+        direct_count, direct_seconds = timed(direct)
+
+    print(f"paginated API : {paged_count} rows in {paged_seconds:.3f}s")
+    print(f"direct CSV    : {direct_count} rows in {direct_seconds:.3f}s")
+    print(f"speedup       : {paged_seconds / direct_seconds:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
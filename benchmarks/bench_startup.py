@@ -0,0 +1,148 @@
+"""Cold-start benchmark: import-to-first-request time of amazon_aws.lambda_handler.
+
+Every run is a fresh interpreter, like a new Lambda execution environment.
+It times `import amazon_aws` (the init phase), the first request and a
+second, warm one against the fake clients of benchmarks/fake_aws.py, and
+records which heavy modules the import left unloaded. Results are
+written as JSON so runs can be compared:
+
+    python benchmarks/bench_startup.py --runs 10 --output bench_startup.json
+    python benchmarks/bench_startup.py --prewarm --compare bench_startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+HEAVY_MODULES = ('boto3', 'botocore', 'numpy', 'asyncio')
+
+# Runs in the child; the fakes are registered before the import so a pre-warm at init uses them too
+CHILD = '''
+import time
+started = time.perf_counter()
+import json, os, sys
+sys.path[:0] = [{root!r}, {bench_dir!r}]
+from client_registry import register_client
+from fake_aws import FakeAthena, FakeBedrock, Latency
+register_client('athena', FakeAthena(rows={rows}, queue=Latency(0), execution=Latency(0), api=Latency(0)))
+register_client('bedrock-runtime', FakeBedrock(first_token=Latency(0), per_token_ms=0), region_name='us-east-1')
+import amazon_aws
+imported = time.perf_counter()
+loaded = [name for name in {heavy!r} if name in sys.modules]
+payload = {payload!r}
+stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+amazon_aws.lambda_handler(json.loads(payload), None)
+first = time.perf_counter()
+amazon_aws.lambda_handler(json.loads(payload), None)
+second = time.perf_counter()
+sys.stdout = stdout
+print(json.dumps({{'import_s': imported - started, 'first_request_s': first - imported,
+                  'import_to_first_request_s': first - started, 'warm_request_s': second - first,
+                  'loaded_at_import': loaded}}))
+'''
+
+
+def load_payload(path, default_client='bench'):
+    # test.json holds comma-separated objects rather than a JSON array; the first one is replayed
+    with open(path) as f:
+        entry = json.loads(f"[{f.read()}]")[0]
+    body = dict(entry.get('body', entry))
+    body.setdefault('client', default_client)
+    return {'body': body}
+
+
+def run_once(args, payload):
+    env = dict(os.environ, RESULT_READER='off', PREWARM='always' if args.prewarm else 'off')
+    body = payload['body']
+    env['PREWARM_TABLES'] = f"{body['database']}.{body['table_name']}"
+    code = CHILD.format(root=ROOT, bench_dir=BENCH_DIR, rows=args.rows, heavy=HEAVY_MODULES,
+                        payload=json.dumps(payload))
+    command = [sys.executable, '-X', 'importtime', '-c', code] if args.importtime else [sys.executable, '-c', code]
+    completed = subprocess.run(command, env=env, capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1]), completed.stderr
+
+
+def slowest_imports(stderr, top):
+    # `-X importtime` lines: "import time: self [us] | cumulative | imported package"
+    imports = []
+    for line in stderr.splitlines():
+        parts = line.split('|')
+        if line.startswith('import time:') and len(parts) == 3 and parts[1].strip().isdigit():
+            imports.append((int(parts[1]), parts[2].rstrip()))
+    return [{'module': name, 'cumulative_ms': round(us / 1000, 2)} for us, name in sorted(imports, reverse=True)[:top]]
+
+
+def summarize(values):
+    return {
+        'median_ms': round(statistics.median(values) * 1000, 2),
+        'min_ms': round(min(values) * 1000, 2),
+        'max_ms': round(max(values) * 1000, 2),
+    }
+
+
+def run(args):
+    payload = load_payload(args.payloads)
+    results = []
+    stderr = ''
+    for _ in range(args.runs):
+        result, stderr = run_once(args, payload)
+        results.append(result)
+    report = {
+        'config': vars(args),
+        'runs': len(results),
+        'phases': {phase: summarize([result[f"{phase}_s"] for result in results])
+                   for phase in ('import', 'first_request', 'import_to_first_request', 'warm_request')},
+        'loaded_at_import': results[-1]['loaded_at_import'],
+    }
+    if args.importtime:
+        report['slowest_imports'] = slowest_imports(stderr, args.importtime)
+    return report
+
+
+def print_report(report, baseline=None):
+    def delta(current, previous):
+        if previous in (None, 0) or current is None:
+            return ''
+        return f" ({(current - previous) / previous * 100:+.1f}%)"
+
+    base_phases = (baseline or {}).get('phases', {})
+    print(f"{report['runs']} cold starts (median / min / max ms):")
+    for phase, values in report['phases'].items():
+        previous = base_phases.get(phase, {}).get('median_ms')
+        print(f"  {phase:<24} {values['median_ms']} / {values['min_ms']} / {values['max_ms']}"
+              f"{delta(values['median_ms'], previous)}")
+    print(f"  loaded at import: {', '.join(report['loaded_at_import']) or 'none of ' + ', '.join(HEAVY_MODULES)}")
+    for entry in report.get('slowest_imports', []):
+        print(f"    {entry['cumulative_ms']:>8} ms {entry['module']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--payloads', default=os.path.join(ROOT, 'test.json'))
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters to start')
+    parser.add_argument('--rows', type=int, default=100, help='rows in the synthetic result table')
+    parser.add_argument('--prewarm', action='store_true',
+                        help='run amazon_aws.prewarm() during import, as under provisioned concurrency')
+    parser.add_argument('--importtime', type=int, default=0, metavar='N',
+                        help='also list the N slowest imports of the last run (python -X importtime)')
+    parser.add_argument('--output', help='write the report as JSON to this path')
+    parser.add_argument('--compare', help='JSON report from an earlier run to diff against')
+    args = parser.parse_args()
+
+    report = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
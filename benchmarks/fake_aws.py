@@ -0,0 +1,211 @@
+"""Local stand-ins for the bedrock-runtime, athena and s3 clients used by the agent.
+
+Latencies are drawn from log-normal distributions so benchmarks see a
+realistic spread instead of a constant, and the Athena fake serves a
+synthetic table with a configurable number of rows.
+"""
+import io
+import itertools
+import json
+import math
+import random
+import threading
+import time
+
+SYNTHETIC_COLUMNS = [
+    ('account_id', 'varchar'),
+    ('client', 'varchar'),
+    ('posting_amount', 'double'),
+    ('fiscal_year', 'integer'),
+    ('employee_name', 'varchar'),
+]
+
+
+class Latency:
+    """Log-normal latency with the given median (ms); sigma controls the tail."""
+
+    def __init__(self, median_ms, sigma=0.3, seed=None) -> None:
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        if self.median_ms <= 0:
+            return 0.0
+        with self._lock:
+            z = self._random.gauss(0, 1)
+        return self.median_ms * math.exp(self.sigma * z) / 1000
+
+    def sleep(self):
+        time.sleep(self.sample())
+
+
+def synthetic_row(i):
+    return [str(100000 + i % 251), 'bluestar', f"{(i * 37) % 10000 / 7:.2f}", str(2020 + i % 5),
+            f"Employee {i % 997}"]
+
+
+class FakeAthena:
+    def __init__(self, rows=1000, queue=None, execution=None, api=None, page_size=1000, partition_key=None) -> None:
+        # partition_key, e.g. ('load_date', 'string'), is listed by DESCRIBE as the table's partition column
+        self.rows = rows
+        self.partition_key = partition_key
+        self.queue = queue or Latency(150)
+        self.execution = execution or Latency(800)
+        self.api = api or Latency(40)
+        self.page_size = page_size
+        self._ids = itertools.count()
+        self._queries = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.stopped = 0
+
+    def start_query_execution(self, QueryString, QueryExecutionContext=None, ResultConfiguration=None,
+                              ResultReuseConfiguration=None, **kwargs):
+        self.api.sleep()
+        with self._lock:
+            query_execution_id = f"bench-{next(self._ids)}"
+            self.started += 1
+        now = time.monotonic()
+        queue_seconds = self.queue.sample()
+        execution_seconds = self.execution.sample()
+        output_location = (ResultConfiguration or {}).get('OutputLocation', 's3://bench/')
+        self._queries[query_execution_id] = {
+            'sql': QueryString,
+            'running_at': now + queue_seconds,
+            'done_at': now + queue_seconds + execution_seconds,
+            'queue_ms': int(queue_seconds * 1000),
+            'execution_ms': int(execution_seconds * 1000),
+            'state': None,
+            'output_location': f"{output_location}{query_execution_id}.csv",
+        }
+        return {'QueryExecutionId': query_execution_id}
+
+    def _query_execution(self, query_execution_id):
+        query = self._queries[query_execution_id]
+        now = time.monotonic()
+        state = query['state'] or ('SUCCEEDED' if now >= query['done_at'] else
+                                   'RUNNING' if now >= query['running_at'] else 'QUEUED')
+        return {
+            'QueryExecutionId': query_execution_id,
+            'Query': query['sql'],
+            'Status': {'State': state},
+            'ResultConfiguration': {'OutputLocation': query['output_location']},
+            'Statistics': {
+                'QueryQueueTimeInMillis': query['queue_ms'],
+                'EngineExecutionTimeInMillis': query['execution_ms'],
+                'TotalExecutionTimeInMillis': query['queue_ms'] + query['execution_ms'],
+                'DataScannedInBytes': self.rows * 64,
+            },
+        }
+
+    def get_query_execution(self, QueryExecutionId):
+        self.api.sleep()
+        return {'QueryExecution': self._query_execution(QueryExecutionId)}
+
+    def batch_get_query_execution(self, QueryExecutionIds):
+        self.api.sleep()
+        return {'QueryExecutions': [self._query_execution(query_execution_id)
+                                    for query_execution_id in QueryExecutionIds],
+                'UnprocessedQueryExecutionIds': []}
+
+    def stop_query_execution(self, QueryExecutionId):
+        self._queries[QueryExecutionId]['state'] = 'CANCELLED'
+        with self._lock:
+            self.stopped += 1
+        return {}
+
+    def get_query_results(self, QueryExecutionId, MaxResults=1000, NextToken=None):
+        self.api.sleep()
+        sql = self._queries[QueryExecutionId]['sql'].strip().lower()
+        if sql.startswith('describe'):
+            columns = SYNTHETIC_COLUMNS + ([self.partition_key] if self.partition_key else [])
+            rows = [{'Data': [{'VarCharValue': f"{name:<24}\t{athena_type:<16}\t"}]} for name, athena_type in columns]
+            if self.partition_key:
+                rows += [{'Data': [{'VarCharValue': line}]} for line in
+                         ('', '# Partition Information', '# col_name\tdata_type\tcomment',
+                          f"{self.partition_key[0]:<24}\t{self.partition_key[1]:<16}\t")]
+            return {'ResultSet': {'Rows': rows,
+                                  'ResultSetMetadata': {'ColumnInfo': [{'Name': 'col_name', 'Type': 'varchar'}]}}}
+
+        if sql.startswith('explain'):
+            plan = {'inputTableColumnInfos': [{'estimate': {'outputRowCount': self.rows,
+                                                            'outputSizeInBytes': self.rows * 64}}]}
+            return {'ResultSet': {'Rows': [{'Data': [{'VarCharValue': json.dumps(plan)}]}],
+                                  'ResultSetMetadata': {'ColumnInfo': [{'Name': 'Query Plan', 'Type': 'varchar'}]}}}
+
+        column_info = [{'Name': name, 'Type': athena_type} for name, athena_type in SYNTHETIC_COLUMNS]
+        start = int(NextToken or 0)
+        end = min(start + min(MaxResults, self.page_size), self.rows)
+        rows = [{'Data': [{'VarCharValue': value} for value in synthetic_row(i)]} for i in range(start, end)]
+        if start == 0:
+            rows.insert(0, {'Data': [{'VarCharValue': name} for name, _ in SYNTHETIC_COLUMNS]})
+        response = {'ResultSet': {'Rows': rows, 'ResultSetMetadata': {'ColumnInfo': column_info}}}
+        if end < self.rows:
+            response['NextToken'] = str(end)
+        return response
+
+
+class FakeBedrock:
+    """Canned completions chosen from the prompt, streamed with first-token and per-token latency."""
+
+    def __init__(self, first_token=None, per_token_ms=15, sql=None, summary=None, model_speed=None) -> None:
+        self.first_token = first_token or Latency(600)
+        self.per_token_ms = per_token_ms
+        # Latency multiplier per model id substring, e.g. {'haiku': 0.4}; unlisted models run at 1.0
+        self.model_speed = model_speed or {'haiku': 0.4}
+        self.sql = sql or 'SELECT account_id, sum(posting_amount) FROM pl_transaction GROUP BY account_id LIMIT 10'
+        self.summary = summary or ('There are 251 distinct account ids; the largest posting totals belong to '
+                                   'accounts 100000, 64010 and 63100.')
+        self.calls = 0
+        self.calls_by_model = {}
+
+    def _speed(self, model_id):
+        self.calls_by_model[model_id] = self.calls_by_model.get(model_id, 0) + 1
+        return next((factor for name, factor in self.model_speed.items() if name in model_id), 1.0)
+
+    def _completion(self, body):
+        request = json.loads(body)
+        content = request['messages'][0]['content']
+        if '<SAQ>' in content:
+            text = '<SAQ>List some of the distinct account ids in pl_transaction</SAQ>'
+        elif 'SQL tags' in request.get('system', ''):
+            text = f'<SQL>{self.sql}</SQL>'
+        else:
+            text = self.summary
+        input_tokens = (len(request.get('system', '')) + len(content)) // 4
+        stop = next((sequence for sequence in request.get('stop_sequences', ()) if sequence in text), None)
+        if stop:
+            text = text[:text.index(stop)]
+        return text, input_tokens, stop
+
+    def invoke_model(self, body, modelId, accept='*/*', contentType='application/json'):
+        self.calls += 1
+        speed = self._speed(modelId)
+        text, input_tokens, _ = self._completion(body)
+        time.sleep(self.first_token.sample() * speed)
+        time.sleep(self.per_token_ms * speed * len(text.split()) / 1000)
+        payload = {'content': [{'type': 'text', 'text': text}],
+                   'usage': {'input_tokens': input_tokens, 'output_tokens': len(text) // 4}}
+        return {'body': io.BytesIO(json.dumps(payload).encode('utf-8'))}
+
+    def invoke_model_with_response_stream(self, body, modelId, accept='*/*', contentType='application/json'):
+        self.calls += 1
+        speed = self._speed(modelId)
+        text, input_tokens, stop = self._completion(body)
+        return {'body': self._events(text, input_tokens, stop, speed)}
+
+    def _events(self, text, input_tokens, stop=None, speed=1.0):
+        def event(payload):
+            return {'chunk': {'bytes': json.dumps(payload).encode('utf-8')}}
+
+        time.sleep(self.first_token.sample() * speed)
+        yield event({'type': 'message_start', 'message': {'usage': {'input_tokens': input_tokens}}})
+        words = text.split(' ')
+        for i, word in enumerate(words):
+            yield event({'type': 'content_block_delta', 'delta': {'text': word if i == 0 else ' ' + word}})
+            time.sleep(self.per_token_ms * speed / 1000)
+        delta = {'stop_reason': 'stop_sequence', 'stop_sequence': stop} if stop else {'stop_reason': 'end_turn'}
+        yield event({'type': 'message_delta', 'delta': delta, 'usage': {'output_tokens': len(text) // 4}})
+        yield event({'type': 'message_stop'})
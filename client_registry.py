@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+
+# Module level state survives warm Lambda invocations, so clients (and their
+# credential resolution / TLS connection pools) are only built on a cold start.
+# boto3 and botocore are imported by the first get_client, not at import time.
+MAX_POOL_CONNECTIONS = int(os.environ.get('MAX_POOL_CONNECTIONS', '10'))
+AGENT_POOL_MAX_SIZE = int(os.environ.get('AGENT_POOL_MAX_SIZE', '4'))
+AGENT_IDLE_SECONDS = float(os.environ.get('AGENT_IDLE_SECONDS', '900'))
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(service_name, region_name=None, max_pool_connections=None):
+    key = (service_name, region_name)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            import boto3
+            from botocore.config import Config
+
+            config = Config(max_pool_connections=max_pool_connections or MAX_POOL_CONNECTIONS)
+            if region_name:
+                client = boto3.client(service_name, region_name=region_name, config=config)
+            else:
+                client = boto3.client(service_name, config=config)
+            _clients[key] = client
+    return client
+
+
+def register_client(service_name, client, region_name=None):
+    # Lets tests and benchmarks substitute stand-in clients for boto3 ones
+    with _clients_lock:
+        _clients[(service_name, region_name)] = client
+
+
+def reset_clients():
+    with _clients_lock:
+        _clients.clear()
+
+
+class LazyClient:
+    """Stands in for get_client(service_name, region_name) until a method is first called.
+
+    Resolves through the registry on every attribute access, so clients
+    registered later (or after reset_clients) are picked up.
+    """
+
+    __slots__ = ('service_name', 'region_name')
+
+    def __init__(self, service_name, region_name=None) -> None:
+        self.service_name = service_name
+        self.region_name = region_name
+
+    def __getattr__(self, name):
+        return getattr(get_client(self.service_name, self.region_name), name)
+
+
+class AgentPool:
+    """Keyed pool of agents per (database, table_name) with idle eviction."""
+
+    def __init__(self, factory, max_size=AGENT_POOL_MAX_SIZE, idle_seconds=AGENT_IDLE_SECONDS) -> None:
+        self.factory = factory
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+
+    def acquire(self, database, table_name):
+        key = (database, table_name)
+        with self._lock:
+            self._evict_idle(time.monotonic())
+            entries = self._idle.get(key)
+            if entries:
+                agent, _ = entries.pop()
+                self.reused += 1
+                return agent
+            self.created += 1
+        return self.factory(database, table_name)
+
+    def release(self, agent):
+        key = (agent.database, agent.table_name)
+        with self._lock:
+            entries = self._idle.setdefault(key, [])
+            if len(entries) >= self.max_size:
+                self.evicted += 1
+                return
+            entries.append((agent, time.monotonic()))
+
+    def _evict_idle(self, now):
+        for key in list(self._idle):
+            entries = self._idle[key]
+            kept = [(agent, ts) for agent, ts in entries if now - ts < self.idle_seconds]
+            self.evicted += len(entries) - len(kept)
+            if kept:
+                self._idle[key] = kept
+            else:
+                del self._idle[key]
+
+    def clear(self):
+        with self._lock:
+            self._idle.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'created': self.created,
+                'reused': self.reused,
+                'evicted': self.evicted,
+                'idle': sum(len(entries) for entries in self._idle.values()),
+            }
+
+
+class InvocationStats:
+    """Counts cold vs warm invocations and the latency of each."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.cold = True
+        self.counts = {'cold': 0, 'warm': 0}
+        self.total_seconds = {'cold': 0.0, 'warm': 0.0}
+
+    def start(self):
+        with self._lock:
+            kind = 'cold' if self.cold else 'warm'
+            self.cold = False
+        return kind, time.perf_counter()
+
+    def finish(self, token):
+        kind, started = token
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.counts[kind] += 1
+            self.total_seconds[kind] += elapsed
+        return elapsed
+
+    def summary(self):
+        with self._lock:
+            summary = {}
+            for kind in ('cold', 'warm'):
+                count = self.counts[kind]
+                summary[kind] = {
+                    'count': count,
+                    'avg_ms': (self.total_seconds[kind] / count * 1000) if count else None,
+                }
+            return summary
+
+
+invocation_stats = InvocationStats()
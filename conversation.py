@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import re
+
+from ttl_store import LocalFileBackend, StoreBackend, TTLStore
+
+# Words that only make sense with earlier turns in view
+_CONTEXT_WORDS = {
+    'it', 'its', 'they', 'them', 'their', 'theirs', 'those', 'these', 'that', 'this',
+    'he', 'she', 'him', 'her', 'his', 'hers', 'one', 'ones', 'same', 'above', 'previous',
+    'earlier', 'former', 'latter', 'listed', 'list', 'such', 'also', 'else', 'more', 'other',
+}
+_FOLLOW_UP_PREFIXES = ('and ', 'also ', 'what about', 'how about', 'then ', 'only ', 'now ', 'instead')
+_MIN_SELF_CONTAINED_WORDS = 4
+
+
+def needs_standalone_rewrite(question, history):
+    """Cheap check for whether a rewrite against `history` could change `question`."""
+    if not history:
+        return False
+    text = (question or '').strip().lower()
+    if not text:
+        return False
+    if text.startswith(_FOLLOW_UP_PREFIXES):
+        return True
+    words = re.findall(r"[a-z']+", text)
+    if len(words) < _MIN_SELF_CONTAINED_WORDS:
+        return True
+    return any(word in _CONTEXT_WORDS for word in words)
+
+
+SESSION_TTL_SECONDS = float(os.environ.get('SESSION_TTL_SECONDS', '86400'))
+SESSION_MAX_ENTRIES = int(os.environ.get('SESSION_MAX_ENTRIES', '1024'))
+# Turns (question + answer) kept verbatim; older ones are folded into the rolling summary
+SESSION_RECENT_TURNS = int(os.environ.get('SESSION_RECENT_TURNS', '3'))
+SESSION_SUMMARY_MAX_CHARS = int(os.environ.get('SESSION_SUMMARY_MAX_CHARS', '1500'))
+SESSION_TURN_MAX_CHARS = int(os.environ.get('SESSION_TURN_MAX_CHARS', '600'))
+_SUMMARY_ANSWER_CHARS = 160
+
+
+def _clip(text, max_chars):
+    text = re.sub(r'\s+', ' ', str(text or '')).strip()
+    return text if len(text) <= max_chars else text[:max_chars - 1] + '…'
+
+
+def compress_turns(summary, turns, max_chars=SESSION_SUMMARY_MAX_CHARS):
+    """Fold `turns` into `summary`: each question kept, each answer cut to its first sentence.
+
+    Once over `max_chars` the oldest lines are dropped, so the summary never grows past it.
+    """
+    lines = [line for line in (summary or '').split('\n') if line]
+    for question, answer in turns:
+        first_sentence = re.split(r'(?<=[.!?])\s', _clip(answer, 10 * _SUMMARY_ANSWER_CHARS), maxsplit=1)[0]
+        lines.append(f"Q: {_clip(question, _SUMMARY_ANSWER_CHARS)} A: {_clip(first_sentence, _SUMMARY_ANSWER_CHARS)}")
+    while len(lines) > 1 and sum(len(line) + 1 for line in lines) > max_chars:
+        lines.pop(0)
+    return _clip('\n'.join(lines), max_chars) if len(lines) == 1 else '\n'.join(lines)
+
+
+def pair_turns(query_ans_arr):
+    # query_ans_arr alternates question, answer, question, answer, ...
+    items = list(query_ans_arr or [])
+    if len(items) % 2:
+        items.append('')
+    return [(items[i], items[i + 1]) for i in range(0, len(items), 2)]
+
+
+def history_for_prompt(summary, turns):
+    history = [f"Summary of the earlier conversation: {summary}"] if summary else []
+    for question, answer in turns:
+        history.extend([question, answer] if answer else [question])
+    return history
+
+
+def bounded_history(query_ans_arr, recent_turns=SESSION_RECENT_TURNS, summarizer=compress_turns):
+    """The client-sent history cut to the same shape a session keeps: summary plus the last turns."""
+    turns = [(_clip(question, SESSION_TURN_MAX_CHARS), _clip(answer, SESSION_TURN_MAX_CHARS))
+             for question, answer in pair_turns(query_ans_arr)]
+    if len(turns) <= recent_turns:
+        return history_for_prompt('', turns)
+    older, recent = turns[:len(turns) - recent_turns], turns[len(turns) - recent_turns:]
+    return history_for_prompt(summarizer('', older), recent)
+
+
+class LocalFileSessionBackend(LocalFileBackend):
+    """Local stand-in for a shared session table, one JSON file per session."""
+
+    field = 'session'
+
+    def _filename(self, session_id):
+        return f"{hashlib.sha256(session_id.encode('utf-8')).hexdigest()[:32]}.json"
+
+
+class DynamoDBSessionBackend(StoreBackend):
+    """Sessions in a DynamoDB table keyed by `session_id`; `expires_at` can be the table's TTL attribute."""
+
+    def __init__(self, dynamodb_client, table_name) -> None:
+        self.dynamodb_client = dynamodb_client
+        self.table_name = table_name
+
+    def get(self, session_id):
+        response = self.dynamodb_client.get_item(TableName=self.table_name, Key={'session_id': {'S': session_id}},
+                                                 ConsistentRead=True)
+        item = response.get('Item')
+        if not item:
+            return None
+        return float(item['expires_at']['N']), json.loads(item['session']['S'])
+
+    def put(self, session_id, expires_at, session):
+        self.dynamodb_client.put_item(TableName=self.table_name, Item={
+            'session_id': {'S': session_id},
+            'expires_at': {'N': str(int(expires_at))},
+            'session': {'S': json.dumps(session)},
+        })
+
+    def delete(self, session_id):
+        self.dynamodb_client.delete_item(TableName=self.table_name, Key={'session_id': {'S': session_id}})
+
+
+class SessionStore(TTLStore):
+    """Conversation history per session id: a rolling summary plus the last `recent_turns` turns.
+
+    Sessions live in an in-memory LRU and are written through to `backend`,
+    so another Lambda instance can pick up the conversation. The history a
+    prompt sees is bounded by recent_turns and summary_max_chars however long
+    the conversation runs.
+    """
+
+    def __init__(self, ttl_seconds=SESSION_TTL_SECONDS, max_entries=SESSION_MAX_ENTRIES, backend=None,
+                 recent_turns=SESSION_RECENT_TURNS, summary_max_chars=SESSION_SUMMARY_MAX_CHARS,
+                 summarizer=compress_turns) -> None:
+        super().__init__(ttl_seconds, max_entries, backend)
+        self.recent_turns = recent_turns
+        self.summary_max_chars = summary_max_chars
+        self.summarizer = summarizer
+
+    def get(self, session_id):
+        return self.lookup(session_id)
+
+    def history(self, session_id):
+        session = self.get(session_id)
+        if session is None:
+            return []
+        return history_for_prompt(session['summary'], session['turns'])
+
+    def append(self, session_id, question, answer):
+        session = self.get(session_id) or {'summary': '', 'turns': []}
+        turns = session['turns'] + [[_clip(question, SESSION_TURN_MAX_CHARS), _clip(answer, SESSION_TURN_MAX_CHARS)]]
+        summary = session['summary']
+        if len(turns) > self.recent_turns:
+            # Only the turns falling out of the window are summarized, never the whole history again
+            folded, turns = turns[:len(turns) - self.recent_turns], turns[len(turns) - self.recent_turns:]
+            summary = self.summarizer(summary, folded, self.summary_max_chars)
+        session = {'summary': summary, 'turns': turns}
+        self.store(session_id, session)
+        return session
+
+    def delete(self, session_id):
+        self.discard(session_id)
@@ -0,0 +1,49 @@
+import json
+import os
+
+DEFAULT_MODEL_ID = os.environ.get('BEDROCK_MODEL_ID', 'anthropic.claude-3-sonnet-20240229-v1:0')
+FAST_MODEL_ID = os.environ.get('BEDROCK_FAST_MODEL_ID', 'anthropic.claude-3-haiku-20240307-v1:0')
+# 'quality' sends every stage to BEDROCK_MODEL_ID; 'latency' sends the cheap stages to BEDROCK_FAST_MODEL_ID
+# and keeps SQL repair (which only runs after validation or Athena rejected a draft) on the larger model
+MODEL_ROUTING_POLICY = os.environ.get('MODEL_ROUTING_POLICY', 'quality')
+# JSON overrides per stage, e.g. {"summarization": {"model_id": "...", "max_tokens": 1024}}
+MODEL_ROUTES = os.environ.get('MODEL_ROUTES', '')
+
+# stage: (max_tokens, stop_sequences). SQL stages get no stop sequence because a reply may hold several
+# <SQL> blocks; read_until already closes the stream after the last one.
+STAGE_LIMITS = {
+    'standalone_rewrite': (256, ('</SAQ>',)),
+    'sql_generation': (1024, ()),
+    'sql_repair': (1024, ()),
+    'summarization': (4096, ()),
+}
+FAST_STAGES = frozenset(('standalone_rewrite', 'sql_generation'))
+
+
+class Route:
+    """Model id and request limits for one LLM stage."""
+
+    __slots__ = ('model_id', 'max_tokens', 'stop_sequences')
+
+    def __init__(self, model_id, max_tokens, stop_sequences=()) -> None:
+        self.model_id = model_id
+        self.max_tokens = max_tokens
+        self.stop_sequences = tuple(stop_sequences)
+
+    def __repr__(self):
+        return f"Route({self.model_id!r}, {self.max_tokens}, {self.stop_sequences!r})"
+
+
+def routing_table(policy=MODEL_ROUTING_POLICY, overrides=MODEL_ROUTES, default_model_id=DEFAULT_MODEL_ID,
+                  fast_model_id=FAST_MODEL_ID):
+    """{stage: Route} for `policy`, with `overrides` (a dict or its JSON) applied per stage."""
+    if isinstance(overrides, str):
+        overrides = json.loads(overrides) if overrides.strip() else {}
+    table = {}
+    for stage in set(STAGE_LIMITS) | set(overrides):
+        max_tokens, stop_sequences = STAGE_LIMITS.get(stage, STAGE_LIMITS['sql_generation'])
+        model_id = fast_model_id if policy == 'latency' and stage in FAST_STAGES else default_model_id
+        override = overrides.get(stage, {})
+        table[stage] = Route(override.get('model_id', model_id), int(override.get('max_tokens', max_tokens)),
+                             override.get('stop_sequences', stop_sequences))
+    return table
@@ -0,0 +1,153 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get('RESULT_CACHE_TTL_SECONDS', '300'))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+RESULT_CACHE_MAX_ENTRY_BYTES = int(os.environ.get('RESULT_CACHE_MAX_ENTRY_BYTES', str(8 * 1024 * 1024)))
+RESULT_REUSE_MAX_AGE_MINUTES = int(os.environ.get('RESULT_REUSE_MAX_AGE_MINUTES', '60'))
+
+_STRING_LITERAL = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+
+
+def normalize_sql(sql):
+    # Case and whitespace are insignificant outside quoted literals/identifiers
+    parts = _STRING_LITERAL.split(sql.strip().rstrip(';').strip())
+    normalized = []
+    for i, part in enumerate(parts):
+        if i % 2:
+            normalized.append(part)
+        else:
+            normalized.append(re.sub(r'\s+', ' ', part).lower())
+    return ''.join(normalized).strip()
+
+
+def result_reuse_configuration(max_age_minutes=RESULT_REUSE_MAX_AGE_MINUTES):
+    if not max_age_minutes:
+        return None
+    return {'ResultReuseByAgeConfiguration': {'Enabled': True, 'MaxAgeInMinutes': max_age_minutes}}
+
+
+class CachedResult:
+    """A materialised result that quacks like ResultStream but can be replayed."""
+
+    def __init__(self, columns, column_types, rows, truncated, size) -> None:
+        self.columns = columns
+        self.column_types = column_types
+        self.rows = rows
+        self.truncated = truncated
+        self.rows_read = len(rows)
+        self.bytes_read = size
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class RecordingStream:
+    """Wraps a result stream and hands the rows to `on_complete` once exhausted."""
+
+    def __init__(self, stream, on_complete, max_bytes=RESULT_CACHE_MAX_ENTRY_BYTES) -> None:
+        self.stream = stream
+        self.on_complete = on_complete
+        self.max_bytes = max_bytes
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    def __iter__(self):
+        return self._rows()
+
+    def _rows(self):
+        started = time.perf_counter()
+        rows = []
+        recording = True
+        for row in self.stream:
+            if recording:
+                rows.append(row)
+                if self.stream.bytes_read > self.max_bytes:
+                    recording = False
+                    rows = None
+            yield row
+        if recording:
+            result = CachedResult(self.stream.columns, self.stream.column_types, rows,
+                                  self.stream.truncated, self.stream.bytes_read)
+            self.on_complete(result, time.perf_counter() - started)
+
+
+class ResultCache:
+    """TTL + LRU cache of query results keyed by (database, normalized SQL), capped in bytes."""
+
+    def __init__(self, ttl_seconds=RESULT_CACHE_TTL_SECONDS, max_bytes=RESULT_CACHE_MAX_BYTES) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.saved_scanned_bytes = 0
+
+    def get(self, database, sql):
+        key = (database, normalize_sql(sql))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['expires_at'] <= now:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += entry['cost_seconds']
+            self.saved_scanned_bytes += entry['scanned_bytes']
+            return entry['result']
+
+    def contains(self, database, sql):
+        # An unexpired entry exists; unlike get, neither counts a hit or miss nor touches the LRU order
+        entry = self._entries.get((database, normalize_sql(sql)))
+        return entry is not None and entry['expires_at'] > time.monotonic()
+
+    def put(self, database, sql, result, cost_seconds=0.0, scanned_bytes=0):
+        key = (database, normalize_sql(sql))
+        size = result.bytes_read
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                'expires_at': time.monotonic() + self.ttl_seconds,
+                'result': result,
+                'size': size,
+                'cost_seconds': cost_seconds,
+                'scanned_bytes': scanned_bytes or 0,
+            }
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, database=None):
+        with self._lock:
+            for key in [key for key in self._entries if database is None or key[0] == database]:
+                self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.size -= entry['size']
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'saved_scans': self.hits,
+                'saved_seconds': round(self.saved_seconds, 3),
+                'saved_scanned_bytes': self.saved_scanned_bytes,
+            }
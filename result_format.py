@@ -0,0 +1,68 @@
+import os
+from decimal import Decimal
+
+FORMAT_MAX_CELL_CHARS = int(os.environ.get('FORMAT_MAX_CELL_CHARS', '80'))
+# Rough characters-per-token ratio for English/SQL-ish text, good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def format_cell(value, max_chars=FORMAT_MAX_CELL_CHARS):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        text = 'true' if value else 'false'
+    elif isinstance(value, float):
+        text = f"{value:.6g}"
+    elif isinstance(value, Decimal):
+        text = format(value.normalize(), 'f')
+    else:
+        text = str(value)
+    text = text.replace('\n', ' ').replace('|', '/')
+    if len(text) > max_chars:
+        text = text[:max_chars - 1] + '…'
+    return text
+
+
+def format_rows(columns, column_types, rows, max_chars=FORMAT_MAX_CELL_CHARS):
+    """Render rows as a pipe-separated table with a single typed header line."""
+    types = list(column_types or [])
+    header = '|'.join(
+        f"{name}:{types[i]}" if i < len(types) else name for i, name in enumerate(columns or [])
+    )
+    lines = [header]
+    for row in rows:
+        lines.append('|'.join(format_cell(value, max_chars) for value in row))
+    return '\n'.join(lines)
+
+
+def _raw_row_chars(values):
+    # Length of the repr Athena's nested Rows structure would have had for this row
+    return len(str({'Data': [{'VarCharValue': str(value)} for value in values]})) + 2
+
+
+def format_result(result_stream, max_chars=FORMAT_MAX_CELL_CHARS, stats=None, rows=None):
+    """Format a result stream compactly; `stats` receives before/after token estimates.
+
+    Pass `rows` when the stream has already been consumed.
+    """
+    # Iterating the stream drives pagination, so rows are formatted as they arrive
+    lines = []
+    raw_chars = len('<data> []')
+    for row in (result_stream if rows is None else rows):
+        lines.append('|'.join(format_cell(value, max_chars) for value in row))
+        if stats is not None:
+            raw_chars += _raw_row_chars(row)
+    # Column metadata is only known once the first page has been read
+    text = '\n'.join([format_rows(result_stream.columns, result_stream.column_types, (), max_chars)] + lines)
+    if result_stream.truncated:
+        text += f"\n(truncated to first {result_stream.rows_read} rows)"
+    if stats is not None:
+        raw_chars += _raw_row_chars(result_stream.columns or [])
+        stats['raw_tokens'] = (raw_chars + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+        stats['compact_tokens'] = estimate_tokens(text)
+        stats['saved_tokens'] = stats['raw_tokens'] - stats['compact_tokens']
+    return text
@@ -0,0 +1,111 @@
+import os
+
+import numpy as np
+
+from result_format import estimate_tokens, format_cell, format_rows
+
+PROFILE_MIN_ROWS = int(os.environ.get('PROFILE_MIN_ROWS', '200'))
+SUMMARY_TOKEN_BUDGET = int(os.environ.get('SUMMARY_TOKEN_BUDGET', '4000'))
+PROFILE_TOP_K = 5
+PROFILE_HISTOGRAM_BINS = 8
+# A column qualifies for stratified sampling when it has this many distinct values or fewer
+MAX_STRATA = 50
+
+NUMERIC_TYPES = ('tinyint', 'smallint', 'integer', 'int', 'bigint', 'double', 'float', 'real', 'decimal')
+
+
+def to_columns(column_types, rows):
+    """Load row tuples into one NumPy array per column.
+
+    Numeric columns become float64 with NaN for NULL; everything else is an
+    object array of strings with None kept for NULL.
+    """
+    arrays = []
+    for i, athena_type in enumerate(column_types):
+        values = [row[i] if i < len(row) else None for row in rows]
+        if (athena_type or '').lower() in NUMERIC_TYPES:
+            arrays.append(np.array([np.nan if value is None else float(value) for value in values], dtype=np.float64))
+        else:
+            arrays.append(np.array([None if value is None else str(value) for value in values], dtype=object))
+    return arrays
+
+
+def profile_column(name, athena_type, array, top_k=PROFILE_TOP_K, bins=PROFILE_HISTOGRAM_BINS):
+    if array.dtype == np.float64:
+        present = array[~np.isnan(array)]
+        profile = {'name': name, 'type': athena_type, 'count': int(present.size),
+                   'nulls': int(array.size - present.size), 'distinct': int(np.unique(present).size)}
+        if present.size:
+            counts, edges = np.histogram(present, bins=min(bins, max(int(np.unique(present).size), 1)))
+            profile.update({
+                'min': float(present.min()),
+                'max': float(present.max()),
+                'mean': float(present.mean()),
+                'sum': float(present.sum()),
+                'histogram': [(float(edges[i]), float(edges[i + 1]), int(counts[i])) for i in range(counts.size)],
+            })
+        return profile
+
+    mask = np.array([value is not None for value in array], dtype=bool)
+    present = array[mask].astype(str)
+    values, counts = np.unique(present, return_counts=True) if present.size else (np.array([]), np.array([]))
+    order = np.argsort(-counts, kind='stable')[:top_k]
+    return {'name': name, 'type': athena_type, 'count': int(present.size), 'nulls': int(array.size - present.size),
+            'distinct': int(values.size), 'top': [(str(values[i]), int(counts[i])) for i in order]}
+
+
+def stratified_sample(arrays, profiles, row_count, size, seed=0):
+    """Pick `size` row indices, proportionally across the lowest-cardinality text column."""
+    if size >= row_count:
+        return np.arange(row_count)
+    candidates = [i for i, profile in enumerate(profiles)
+                  if 'top' in profile and 1 < profile['distinct'] <= MAX_STRATA]
+    if not candidates:
+        return np.unique(np.linspace(0, row_count - 1, size).astype(int))
+
+    strata_column = min(candidates, key=lambda i: profiles[i]['distinct'])
+    keys = np.array(['' if value is None else value for value in arrays[strata_column]], dtype=object).astype(str)
+    rng = np.random.default_rng(seed)
+    strata = [np.flatnonzero(keys == key) for key in np.unique(keys)]
+    # At least one row per stratum, the rest proportional to stratum size
+    takes = [min(members.size, max(1, int(round(size * members.size / row_count)))) for members in strata]
+    # Rounding up can overshoot; trim the largest strata, never below one row each
+    while sum(takes) > max(size, len(strata)):
+        largest = max(range(len(takes)), key=takes.__getitem__)
+        takes[largest] -= 1
+    chosen = [rng.choice(members, size=take, replace=False) for members, take in zip(strata, takes)]
+    return np.sort(np.concatenate(chosen))
+
+
+def format_profile(profile):
+    parts = [f"{profile['name']}:{profile['type']} count={profile['count']} nulls={profile['nulls']}",
+             f"distinct={profile['distinct']}"]
+    if 'mean' in profile:
+        parts.append(f"min={format_cell(profile['min'])} max={format_cell(profile['max'])} "
+                     f"mean={format_cell(profile['mean'])} sum={format_cell(profile['sum'])}")
+        histogram = ' '.join(f"[{format_cell(low)},{format_cell(high)}):{count}"
+                             for low, high, count in profile['histogram'])
+        parts.append(f"histogram={histogram}")
+    elif 'top' in profile:
+        parts.append('top=' + ', '.join(f"{format_cell(value, 40)}({count})" for value, count in profile['top']))
+    return ' '.join(parts)
+
+
+def profile_for_prompt(columns, column_types, rows, token_budget=SUMMARY_TOKEN_BUDGET, truncated=False):
+    """Column statistics plus a stratified sample that fits in `token_budget`."""
+    arrays = to_columns(column_types, rows)
+    profiles = [profile_column(name, athena_type, array)
+                for name, athena_type, array in zip(columns, column_types, arrays)]
+    scope = f"first {len(rows)} rows" if truncated else f"all {len(rows)} rows"
+    stats_text = '\n'.join([f"statistics over {scope}:"] + [format_profile(profile) for profile in profiles])
+
+    # Start from an estimate based on the first rows, then halve until it fits
+    per_row = max(estimate_tokens(format_rows(columns, column_types, rows[:20])) // max(min(len(rows), 20), 1), 1)
+    size = max(min(len(rows), (token_budget - estimate_tokens(stats_text)) // per_row), 1)
+    while True:
+        indices = stratified_sample(arrays, profiles, len(rows), size)
+        sample_text = format_rows(columns, column_types, [rows[i] for i in indices])
+        text = f"{stats_text}\nsample of {len(indices)} rows:\n{sample_text}"
+        if estimate_tokens(text) <= token_budget or size <= 1:
+            return text
+        size //= 2
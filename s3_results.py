@@ -0,0 +1,130 @@
+import codecs
+import csv
+import os
+
+from athena_results import RESULT_MAX_BYTES, RESULT_MAX_ROWS, decode_value
+
+S3_CHUNK_BYTES = int(os.environ.get('S3_RESULT_CHUNK_BYTES', str(1024 * 1024)))
+# Results with more rows than this (or a page) are read from the CSV in S3; shorter ones from their first page
+S3_RESULT_MIN_ROWS = int(os.environ.get('S3_RESULT_MIN_ROWS', '1000'))
+
+
+def parse_s3_uri(uri):
+    if not uri.startswith('s3://'):
+        raise ValueError(f"Not an S3 URI: {uri}")
+    bucket, _, key = uri[len('s3://'):].partition('/')
+    return bucket, key
+
+
+class S3ObjectSource:
+    def __init__(self, s3_client, bucket, key) -> None:
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+
+    def size(self):
+        return self.s3_client.head_object(Bucket=self.bucket, Key=self.key)['ContentLength']
+
+    def read_range(self, start, end):
+        # HTTP ranges are inclusive
+        response = self.s3_client.get_object(Bucket=self.bucket, Key=self.key, Range=f"bytes={start}-{end - 1}")
+        return response['Body'].read()
+
+
+class LocalObjectSource:
+    """Stand-in for an S3 object, stored at <root>/<bucket>/<key>."""
+
+    def __init__(self, root, bucket, key) -> None:
+        self.path = os.path.join(root, bucket, key)
+
+    def size(self):
+        return os.path.getsize(self.path)
+
+    def read_range(self, start, end):
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            return f.read(end - start)
+
+
+def s3_source_factory(s3_client):
+    def factory(output_location):
+        return S3ObjectSource(s3_client, *parse_s3_uri(output_location))
+    return factory
+
+
+def local_source_factory(root):
+    def factory(output_location):
+        return LocalObjectSource(root, *parse_s3_uri(output_location))
+    return factory
+
+
+def iter_chunks(source, chunk_bytes=S3_CHUNK_BYTES):
+    size = source.size()
+    start = 0
+    while start < size:
+        end = min(start + chunk_bytes, size)
+        yield source.read_range(start, end)
+        start = end
+
+
+def iter_lines(chunks):
+    # Lines keep their terminators so csv can rejoin quoted multi-line fields
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pending = ''
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        # Split on '\n' only; str.splitlines would also break on characters
+        # such as '\x1c' that can legitimately appear inside a field
+        lines = pending.split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+class CsvResultStream:
+    """Streams the CSV Athena wrote to the output location with ranged GETs.
+
+    Mirrors ResultStream: yields typed row tuples and honours the same row
+    and byte budgets, without ever holding the whole object in memory.
+    """
+
+    def __init__(self, source, column_info, max_rows=RESULT_MAX_ROWS, max_bytes=RESULT_MAX_BYTES,
+                 chunk_bytes=S3_CHUNK_BYTES) -> None:
+        self.source = source
+        self.columns = [column['Name'] for column in column_info]
+        self.column_types = [column['Type'] for column in column_info]
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.chunk_bytes = chunk_bytes
+        self.rows_read = 0
+        self.bytes_read = 0
+        self.truncated = False
+        self._consumed = False
+
+    def __iter__(self):
+        if self._consumed:
+            raise RuntimeError("CsvResultStream can only be iterated once")
+        self._consumed = True
+        return self._rows()
+
+    def _rows(self):
+        reader = csv.reader(iter_lines(iter_chunks(self.source, self.chunk_bytes)))
+        next(reader, None)  # header
+        for values in reader:
+            size = sum(len(value) for value in values)
+            if self.rows_read >= self.max_rows or self.bytes_read + size > self.max_bytes:
+                self.truncated = True
+                return
+            self.rows_read += 1
+            self.bytes_read += size
+            yield tuple(self._decode(value, i) for i, value in enumerate(values))
+
+    def _decode(self, value, i):
+        athena_type = self.column_types[i] if i < len(self.column_types) else None
+        # Athena writes NULL as an empty field; keep '' for string columns
+        if value == '' and athena_type not in ('varchar', 'char', 'string'):
+            return None
+        return decode_value(value, athena_type)
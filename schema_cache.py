@@ -0,0 +1,77 @@
+import json
+import os
+
+import ttl_store
+from ttl_store import StoreBackend, TTLStore
+
+SCHEMA_CACHE_TTL_SECONDS = float(os.environ.get('SCHEMA_CACHE_TTL_SECONDS', '3600'))
+SCHEMA_CACHE_MAX_ENTRIES = int(os.environ.get('SCHEMA_CACHE_MAX_ENTRIES', '128'))
+
+
+class LocalFileBackend(ttl_store.LocalFileBackend):
+    field = 'schema'
+
+    def _filename(self, key):
+        database, table = key
+        return f"{database}.{table}.json"
+
+
+class S3Backend(StoreBackend):
+    def __init__(self, s3_client, bucket, prefix='schema-cache/') -> None:
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _key(self, key):
+        database, table = key
+        return f"{self.prefix}{database}/{table}.json"
+
+    def get(self, key):
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+        entry = json.loads(response['Body'].read())
+        return entry['expires_at'], entry['schema']
+
+    def put(self, key, expires_at, schema):
+        body = json.dumps({'expires_at': expires_at, 'schema': schema})
+        self.s3_client.put_object(Bucket=self.bucket, Key=self._key(key), Body=body.encode('utf-8'))
+
+    def delete(self, key):
+        self.s3_client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+
+class SchemaCache(TTLStore):
+    """TTL + LRU cache of table schemas keyed by (database, table)."""
+
+    def __init__(self, ttl_seconds=SCHEMA_CACHE_TTL_SECONDS, max_entries=SCHEMA_CACHE_MAX_ENTRIES, backend=None) -> None:
+        super().__init__(ttl_seconds, max_entries, backend)
+
+    def get(self, database, table):
+        return self.lookup((database, table))
+
+    def put(self, database, table, schema):
+        self.store((database, table), schema)
+
+    def invalidate(self, database, table):
+        self.discard((database, table))
+
+
+def fetch_glue_schema(glue_client, database, table):
+    # Shape Glue columns like Athena's DESCRIBE rows so prompts are unchanged
+    response = glue_client.get_table(DatabaseName=database, Name=table)
+    storage = response['Table'].get('StorageDescriptor', {})
+    partition_keys = response['Table'].get('PartitionKeys', [])
+
+    def row(column):
+        line = f"{column['Name']}\t{column['Type']}\t{column.get('Comment', '')}"
+        return {'Data': [{'VarCharValue': line}]}
+
+    rows = [row(column) for column in storage.get('Columns', []) + partition_keys]
+    if partition_keys:
+        rows.append({'Data': [{'VarCharValue': ''}]})
+        rows.append({'Data': [{'VarCharValue': '# Partition Information'}]})
+        rows.append({'Data': [{'VarCharValue': '# col_name\tdata_type\tcomment'}]})
+        rows.extend(row(column) for column in partition_keys)
+    return rows
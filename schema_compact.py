@@ -0,0 +1,167 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from result_format import estimate_tokens
+from sql_memo import schema_fingerprint
+
+# Tables with more columns than this are pruned to the columns a question mentions
+SCHEMA_PRUNE_MIN_COLUMNS = int(os.environ.get('SCHEMA_PRUNE_MIN_COLUMNS', '40'))
+SCHEMA_PRUNE_MAX_COLUMNS = int(os.environ.get('SCHEMA_PRUNE_MAX_COLUMNS', '25'))
+SCHEMA_INDEX_MAX_ENTRIES = 64
+
+SYNONYMS = [
+    ('amount', 'amt', 'value', 'total', 'sum', 'cost', 'price', 'spend', 'revenue', 'balance'),
+    ('employee', 'emp', 'staff', 'worker', 'person', 'people', 'headcount'),
+    ('manager', 'mgr', 'supervisor', 'boss', 'report', 'direct'),
+    ('date', 'day', 'time', 'timestamp', 'ts', 'when', 'period', 'month', 'year', 'fiscal'),
+    ('id', 'identifier', 'key', 'code', 'num', 'no'),
+    ('account', 'acct', 'gl', 'ledger'),
+    ('company', 'org', 'organization', 'organisation', 'client', 'customer', 'entity', 'tenant'),
+    ('department', 'dept', 'division', 'team', 'unit'),
+    ('count', 'quantity', 'qty', 'number'),
+    ('description', 'desc', 'text', 'title', 'label'),
+    ('location', 'city', 'country', 'region', 'site', 'state'),
+    ('salary', 'pay', 'wage', 'compensation', 'earning'),
+]
+STOP_WORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'by', 'can', 'do', 'does', 'for', 'from', 'give', 'have', 'how', 'in',
+    'is', 'it', 'list', 'many', 'me', 'much', 'of', 'on', 'or', 'please', 'show', 'some', 'that', 'the', 'them',
+    'there', 'this', 'to', 'what', 'which', 'who', 'with', 'you',
+))
+
+_GROUPS = {}
+for _group, _words in enumerate(SYNONYMS):
+    for _word in _words:
+        _GROUPS.setdefault(_word, set()).add(_group)
+
+
+def _stem(word):
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def terms(text):
+    # camelCase and snake_case both split into words
+    text = re.sub(r'([a-z])([A-Z])', r'\1 \2', text or '')
+    return {_stem(word) for word in re.findall(r'[a-z]+|\d+', text.lower()) if word not in STOP_WORDS}
+
+
+def parse_schema(schema):
+    """(name, type, comment, is_partition) per column from DESCRIBE rows or fetch_glue_schema rows."""
+    columns = OrderedDict()
+    partitions = False
+    for row in schema or ():
+        try:
+            line = row['Data'][0].get('VarCharValue', '')
+        except (KeyError, IndexError, TypeError, AttributeError):
+            return []
+        if line.startswith('#'):
+            partitions = partitions or 'partition' in line.lower()
+            continue
+        fields = [field.strip() for field in line.split('\t')]
+        if not fields[0]:
+            continue
+        name = fields[0]
+        data_type = fields[1] if len(fields) > 1 else ''
+        comment = fields[2] if len(fields) > 2 else ''
+        if name in columns:
+            if partitions:
+                columns[name] = columns[name][:3] + (True,)
+            continue
+        columns[name] = (name, data_type, comment, partitions)
+    return list(columns.values())
+
+
+def compact_schema(columns):
+    text = ', '.join(f"{name}:{data_type}" for name, data_type, _, partition in columns if not partition)
+    partition_keys = [f"{name}:{data_type}" for name, data_type, _, partition in columns if partition]
+    if partition_keys:
+        text += f"; partition keys (filter on these): {', '.join(partition_keys)}"
+    return text
+
+
+class SchemaIndex:
+    """Keyword/synonym index over column names and comments, built once per schema."""
+
+    def __init__(self, columns) -> None:
+        self.columns = columns
+        self._entries = []
+        for name, _, comment, _ in columns:
+            name_terms = terms(name)
+            comment_terms = terms(comment) - name_terms
+            groups = set().union(*(_GROUPS.get(term, ()) for term in name_terms | comment_terms))
+            self._entries.append((name_terms, comment_terms, groups))
+
+    def score(self, question_terms):
+        question_groups = {term: _GROUPS.get(term, set()) for term in question_terms}
+        scores = []
+        for name_terms, comment_terms, groups in self._entries:
+            score = 0
+            for term in question_terms:
+                if term in name_terms:
+                    score += 2
+                elif term in comment_terms or question_groups[term] & groups:
+                    score += 1
+            scores.append(score)
+        return scores
+
+    def select(self, question, max_columns=SCHEMA_PRUNE_MAX_COLUMNS, required=()):
+        # Partition keys and columns matching `required` always stay; if nothing
+        # matches the question itself the full column list is kept
+        scores = self.score(terms(question))
+        ranked = sorted((i for i, score in enumerate(scores) if score > 0), key=lambda i: -scores[i])
+        if not ranked:
+            return list(self.columns)
+        keep = set(ranked[:max_columns])
+        if required:
+            keep.update(i for i, score in enumerate(self.score(terms(' '.join(required)))) if score > 0)
+        return [column for i, column in enumerate(self.columns) if i in keep or column[3]]
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def schema_index(schema, fingerprint=None):
+    fingerprint = fingerprint or schema_fingerprint(schema)
+    with _indexes_lock:
+        index = _indexes.get(fingerprint)
+        if index is not None:
+            _indexes.move_to_end(fingerprint)
+            return index
+    index = SchemaIndex(parse_schema(schema))
+    with _indexes_lock:
+        _indexes[fingerprint] = index
+        while len(_indexes) > SCHEMA_INDEX_MAX_ENTRIES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def prompt_schema(schema, question, stats=None, required=(), min_columns=SCHEMA_PRUNE_MIN_COLUMNS,
+                  max_columns=SCHEMA_PRUNE_MAX_COLUMNS, fingerprint=None):
+    """Terse `col:type` schema for the SQL prompt, pruned to relevant columns on wide tables.
+
+    When `stats` is given it receives raw_tokens (the old repr of the rows),
+    compact_tokens, columns and kept_columns.
+    """
+    raw = str(schema)
+    index = schema_index(schema, fingerprint)
+    if not index.columns:
+        text = raw
+        kept = []
+    else:
+        kept = index.select(question, max_columns, required) if len(index.columns) > min_columns else index.columns
+        text = compact_schema(kept)
+    if stats is not None:
+        stats.update({
+            'raw_tokens': estimate_tokens(raw),
+            'compact_tokens': estimate_tokens(text),
+            'columns': len(index.columns),
+            'kept_columns': len(kept),
+        })
+    return text
@@ -0,0 +1,209 @@
+import json
+import os
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from schema_compact import terms
+from sql_memo import normalize_question
+
+# Directory for the memory-mapped index; unset keeps it in memory for the life of the instance. Instances
+# sharing it don't coordinate rows: an example written over another instance's row is dropped on the next load.
+SQL_EXAMPLES_DIR = os.environ.get('SQL_EXAMPLES_DIR')
+SQL_EXAMPLES_TOP_K = int(os.environ.get('SQL_EXAMPLES_TOP_K', '3'))
+SQL_EXAMPLES_MIN_SCORE = float(os.environ.get('SQL_EXAMPLES_MIN_SCORE', '0.25'))
+# 'client' only retrieves a client's own questions; 'table' shares examples between clients of a table
+SQL_EXAMPLES_SCOPE = os.environ.get('SQL_EXAMPLES_SCOPE', 'client')
+# Terms are hashed into this many dimensions, so new vocabulary never changes the array shape
+EXAMPLE_VECTOR_DIM = 1024
+_INITIAL_CAPACITY = 256
+
+
+def question_vector(question, dim=EXAMPLE_VECTOR_DIM):
+    # Binary presence of hashed, stemmed question terms; crc32 is stable across processes. Numbers (years,
+    # ids) say little about the shape of the SQL and would only collide with other terms.
+    vector = np.zeros(dim, dtype=np.float32)
+    for term in terms(question):
+        if not term.isdigit():
+            vector[zlib.crc32(term.encode('utf-8')) % dim] = 1.0
+    return vector
+
+
+class SqlExampleIndex:
+    """Successfully executed (question, client, table, SQL) examples with TF-IDF similarity search.
+
+    Vectors live in one float32 array, memory-mapped from `directory` when
+    given, with the examples themselves in an append-only JSON-lines file next
+    to it. Each line records the row of its vector, and a line whose row was
+    already taken or whose vector no longer matches its question is skipped
+    on load. Re-adding a question replaces its earlier example.
+    """
+
+    def __init__(self, directory=None, dim=EXAMPLE_VECTOR_DIM, scope=SQL_EXAMPLES_SCOPE) -> None:
+        self.directory = directory
+        self.dim = dim
+        self.scope = scope
+        self._lock = threading.Lock()
+        self._examples = []
+        self._keys = {}
+        # Per row: still current (not replaced by a later example), and table / client as small ints
+        self._ids = {}
+        self._active = np.zeros(0, dtype=bool)
+        self._table_ids = np.zeros(0, dtype=np.int32)
+        self._client_ids = np.zeros(0, dtype=np.int32)
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._df = np.zeros(dim, dtype=np.float32)
+        self.searches = 0
+        self.search_seconds = 0.0
+        self.max_search_seconds = 0.0
+        # Questions whose first SQL ran without repair, split by whether examples were in the prompt
+        self.outcomes = {'with_examples': [0, 0], 'without_examples': [0, 0]}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._load()
+
+    @property
+    def _vectors_path(self):
+        return os.path.join(self.directory, 'vectors.f32')
+
+    @property
+    def _examples_path(self):
+        return os.path.join(self.directory, 'examples.jsonl')
+
+    def _key(self, table_name, client, question):
+        return (table_name, (client or '').strip().lower(), normalize_question(question))
+
+    def _load(self):
+        examples = []
+        if os.path.exists(self._examples_path):
+            with open(self._examples_path) as f:
+                for line in f:
+                    try:
+                        example = json.loads(line)
+                    except ValueError:
+                        # A torn last line from an interrupted write
+                        break
+                    # Lines written before rows were recorded are in row order
+                    examples.append((example.pop('row', len(examples)), example))
+        rows = os.path.getsize(self._vectors_path) // (self.dim * 4) if os.path.exists(self._vectors_path) else 0
+        self._grow(max(_INITIAL_CAPACITY, rows))
+        # Vectors are written before their example line. Another instance that picked the same row
+        # overwrote the vector, so rows have to increase and the vector has to still be the question's.
+        for row, example in examples:
+            if (isinstance(row, int) and len(self._examples) <= row < rows
+                    and np.array_equal(self._vectors[row], question_vector(example['question'], self.dim))):
+                self._append(row, example)
+
+    def _grow(self, capacity):
+        count = len(self._examples)
+        for name in ('_active', '_table_ids', '_client_ids'):
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:count] = array[:count]
+            setattr(self, name, grown)
+        if not self.directory:
+            vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+            vectors[:count] = self._vectors[:count]
+            self._vectors = vectors
+            return
+        if isinstance(self._vectors, np.memmap):
+            self._vectors.flush()
+        size = capacity * self.dim * 4
+        with open(self._vectors_path, 'ab') as f:
+            if f.tell() < size:
+                f.truncate(size)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+
+    def _id(self, kind, name):
+        return self._ids.setdefault((kind, name), len(self._ids))
+
+    def _append(self, row, example):
+        key = self._key(example['table'], example['client'], example['question'])
+        previous = self._keys.get(key)
+        if previous is not None:
+            self._active[previous] = False
+            self._df -= self._vectors[previous]
+        self._keys[key] = row
+        # Rows skipped on load stay empty and inactive
+        self._examples.extend([None] * (row - len(self._examples)))
+        self._examples.append(example)
+        self._active[row] = True
+        self._table_ids[row] = self._id('table', example['table'])
+        self._client_ids[row] = self._id('client', key[1])
+        self._df += self._vectors[row]
+
+    def add(self, table_name, client, question, sql_queries):
+        if not sql_queries or not question_vector(question, self.dim).any():
+            return
+        example = {'table': table_name, 'client': client or '', 'question': question, 'sql': list(sql_queries)}
+        with self._lock:
+            existing = self._keys.get(self._key(table_name, client, question))
+            if existing is not None and self._examples[existing]['sql'] == example['sql']:
+                return
+            row = len(self._examples)
+            if row >= len(self._vectors):
+                self._grow(max(2 * len(self._vectors), _INITIAL_CAPACITY))
+            self._vectors[row] = question_vector(question, self.dim)
+            if self.directory:
+                self._vectors.flush()
+                with open(self._examples_path, 'a') as f:
+                    f.write(json.dumps(dict(example, row=row)) + '\n')
+            self._append(row, example)
+
+    def search(self, table_name, client, question, top_k=SQL_EXAMPLES_TOP_K, min_score=SQL_EXAMPLES_MIN_SCORE):
+        """[(score, example)] of the `top_k` most similar questions for this table (and client)."""
+        started = time.perf_counter()
+        query = question_vector(question, self.dim)
+        with self._lock:
+            count = len(self._examples)
+            results = []
+            table_id = self._ids.get(('table', table_name))
+            if count and query.any() and table_id is not None:
+                mask = self._active[:count] & (self._table_ids[:count] == table_id)
+                if self.scope == 'client':
+                    mask &= self._client_ids[:count] == self._ids.get(('client', (client or '').strip().lower()), -1)
+                rows = np.flatnonzero(mask)
+                if rows.size:
+                    active = int(self._active[:count].sum())
+                    idf = np.log((1 + active) / (1 + self._df)) + 1
+                    vectors = self._vectors[rows]
+                    weighted = query * idf
+                    norms = np.sqrt((vectors * vectors) @ (idf * idf)) * np.linalg.norm(weighted)
+                    scores = (vectors @ (weighted * idf)) / np.maximum(norms, 1e-9)
+                    best = np.argsort(-scores)[:top_k]
+                    results = [(float(scores[i]), self._examples[rows[i]]) for i in best if scores[i] >= min_score]
+            elapsed = time.perf_counter() - started
+            self.searches += 1
+            self.search_seconds += elapsed
+            self.max_search_seconds = max(self.max_search_seconds, elapsed)
+        return results
+
+    def record_outcome(self, first_try, used_examples):
+        with self._lock:
+            outcome = self.outcomes['with_examples' if used_examples else 'without_examples']
+            outcome[0] += 1
+            outcome[1] += int(bool(first_try))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'examples': int(self._active[:len(self._examples)].sum()),
+                'searches': self.searches,
+                'avg_search_ms': round(self.search_seconds / self.searches * 1000, 3) if self.searches else None,
+                'max_search_ms': round(self.max_search_seconds * 1000, 3),
+                'first_try_success': {kind: {'questions': questions, 'rate': round(first / questions, 3)
+                                             if questions else None}
+                                      for kind, (questions, first) in self.outcomes.items()},
+            }
+
+
+def examples_prompt(examples):
+    if not examples:
+        return ''
+    blocks = '\n'.join(f"Question: {example['question']}\n" + ''.join(f"<SQL>{sql}</SQL>" for sql in example['sql'])
+                       for _, example in examples)
+    return f'''
+                Questions about this table that were answered by SQL that ran successfully:
+{blocks}'''
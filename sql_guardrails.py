@@ -0,0 +1,179 @@
+import json
+import math
+import os
+import re
+
+from sql_validate import tokenize
+
+# Row cap for row listings whose question only wants a few examples ("some", "a few", "a sample")
+GUARDRAIL_SAMPLE_LIMIT = int(os.environ.get('GUARDRAIL_SAMPLE_LIMIT', '100'))
+# 'add' injects a recent-window predicate on a date-like partition key into row listings (never into
+# aggregates, whose answer it would change), 'require' sends the query back for repair, 'off' leaves it alone
+GUARDRAIL_PARTITION_POLICY = os.environ.get('GUARDRAIL_PARTITION_POLICY', 'off')
+GUARDRAIL_PARTITION_DAYS = int(os.environ.get('GUARDRAIL_PARTITION_DAYS', '365'))
+# Queries EXPLAIN estimates above this many input bytes are sent back for repair. The estimate is a full Athena
+# round trip before the real query, so it is opt-in: 0 (the default) skips it.
+GUARDRAIL_SCAN_BUDGET_BYTES = int(os.environ.get('GUARDRAIL_SCAN_BUDGET_BYTES', '0'))
+
+# Only clear sample cues; "show", "list" or "give me" ask for the rows, not a sample of them
+SAMPLE_WORDS = frozenset(('some', 'few', 'example', 'examples', 'sample', 'samples', 'couple'))
+FULL_RESULT_WORDS = frozenset(('all', 'every', 'each', 'entire', 'full', 'complete', 'export'))
+AGGREGATES = frozenset(('COUNT', 'SUM', 'AVG', 'MIN', 'MAX', 'APPROX_DISTINCT', 'COUNT_IF', 'ARBITRARY',
+                        'APPROX_PERCENTILE', 'STDDEV', 'VARIANCE', 'BOOL_AND', 'BOOL_OR'))
+WHERE_END = frozenset(('GROUP', 'HAVING', 'ORDER', 'LIMIT', 'OFFSET', 'FETCH', 'WINDOW'))
+COMPOUND = frozenset(('WITH', 'UNION', 'EXCEPT', 'INTERSECT', 'JOIN'))
+
+
+def _top_level(tokens):
+    # (index, token) pairs outside any parentheses
+    depth = 0
+    for i, token in enumerate(tokens):
+        if token.text == '(':
+            depth += 1
+        elif token.text == ')':
+            depth -= 1
+        elif depth == 0:
+            yield i, token
+
+
+def _aggregated(tokens):
+    # An aggregate call outside any subquery
+    return any(token.upper in AGGREGATES and i + 1 < len(tokens) and tokens[i + 1].text == '('
+               for i, token in _top_level(tokens))
+
+
+def _strip_semicolon(sql):
+    return sql.strip().rstrip(';').rstrip()
+
+
+def add_limit(sql, question, max_rows, sample_limit=GUARDRAIL_SAMPLE_LIMIT):
+    """Append a LIMIT to a query that has none, unless it returns a single aggregate row.
+
+    Row listings whose question asks for examples get `sample_limit` rows
+    (decision 'kind' 'sample'); everything else, grouped aggregates included,
+    one row more than the result stream's `max_rows` ('row_budget'), so the
+    stream still sees that the result was cut and marks it truncated.
+    """
+    tokens = tokenize(sql)
+    top = [token.upper for _, token in _top_level(tokens)]
+    if 'LIMIT' in top or 'FETCH' in top:
+        return sql, {'guardrail': 'limit', 'action': 'present'}
+    aggregated = _aggregated(tokens) or 'GROUP' in top
+    if aggregated and 'GROUP' not in top:
+        return sql, {'guardrail': 'limit', 'action': 'skipped', 'reason': 'single aggregate row'}
+
+    words = set(re.findall(r'[a-z]+', (question or '').lower()))
+    if not aggregated and words & SAMPLE_WORDS and not words & FULL_RESULT_WORDS:
+        kind, limit = 'sample', sample_limit
+    else:
+        kind, limit = 'row_budget', max_rows + 1
+    return f"{_strip_semicolon(sql)} LIMIT {limit}", {'guardrail': 'limit', 'action': 'added', 'kind': kind,
+                                                      'limit': limit}
+
+
+def partition_predicate(name, data_type, days=GUARDRAIL_PARTITION_DAYS):
+    """A predicate keeping the last `days` days of a date-like partition key, or None."""
+    data_type = (data_type or '').lower()
+    window = f"current_date - interval '{days}' day"
+    quoted = f'"{name}"'
+    if data_type == 'date':
+        return f"{quoted} >= {window}"
+    if data_type.startswith('timestamp'):
+        return f"{quoted} >= CAST({window} AS timestamp)"
+    if data_type in ('string', 'varchar') or data_type.startswith('varchar'):
+        if re.search(r'(^|_)(date|dt|day|ds)($|_)', name.lower()):
+            return f"{quoted} >= date_format({window}, '%Y-%m-%d')"
+        return None
+    if data_type in ('int', 'integer', 'bigint', 'smallint') and re.search(r'(^|_)year($|_)', name.lower()):
+        return f"{quoted} >= year({window})"
+    return None
+
+
+def guard_partitions(sql, partition_keys, table_name, policy=GUARDRAIL_PARTITION_POLICY,
+                     days=GUARDRAIL_PARTITION_DAYS):
+    """(sql, decision, problem) after checking that a partitioned table is filtered on a partition key.
+
+    `partition_keys` is a list of (name, type). With policy 'add' a window
+    predicate is injected into simple single-table queries; a `problem` means
+    the query should go back for repair. Aggregates are never filtered: a
+    count over the last year is not the count that was asked for.
+    """
+    if policy == 'off' or not partition_keys:
+        return sql, None, None
+    tokens = tokenize(sql)
+    names = {name.lower() for name, _ in partition_keys}
+    where = next((i for i, token in enumerate(tokens) if token.upper == 'WHERE'), None)
+    if where is not None and any(token.identifier in names for token in tokens[where:]):
+        return sql, {'guardrail': 'partition', 'action': 'present'}, None
+
+    keys = ', '.join(name for name, _ in partition_keys)
+    if policy == 'require':
+        return sql, {'guardrail': 'partition', 'action': 'required', 'keys': keys}, \
+            f"filter on the partition key(s) {keys} to bound the data scanned"
+
+    predicate = next(filter(None, (partition_predicate(name, data_type, days) for name, data_type in partition_keys)),
+                     None)
+    top = list(_top_level(tokens))
+    uppers = {token.upper for _, token in top}
+    from_index = next((i for i, token in top if token.upper == 'FROM'), None)
+    single_table = (from_index is not None and not uppers & COMPOUND and from_index + 1 < len(tokens)
+                    and tokens[from_index + 1].text != '(' and
+                    any(token.identifier == table_name.lower() for token in tokens[from_index + 1:from_index + 4]))
+    if predicate is None or not single_table or _aggregated(tokens):
+        return sql, {'guardrail': 'partition', 'action': 'missing', 'keys': keys}, None
+
+    sql = _strip_semicolon(sql)
+    top_where = next((i for i, token in top if token.upper == 'WHERE'), None)
+    if top_where is not None:
+        end = next((tokens[i].start for i, token in top if i > top_where and token.upper in WHERE_END), len(sql))
+        start = tokens[top_where + 1].start
+        sql = f"{sql[:start]}{predicate} AND ({sql[start:end].rstrip()}) {sql[end:]}".rstrip()
+    else:
+        end = next((tokens[i].start for i, token in top if i > from_index and token.upper in WHERE_END), len(sql))
+        sql = f"{sql[:end].rstrip()} WHERE {predicate} {sql[end:]}".rstrip()
+    return sql, {'guardrail': 'partition', 'action': 'added', 'predicate': predicate}, None
+
+
+def explain_query(sql):
+    return f"EXPLAIN (TYPE IO, FORMAT JSON) {_strip_semicolon(sql)}"
+
+
+def estimated_scan_bytes(rows):
+    """Input bytes estimated by an `EXPLAIN (TYPE IO, FORMAT JSON)` result, or None when unknown.
+
+    Without table statistics Athena reports NaN, which is treated as unknown.
+    """
+    text = '\n'.join(datum.get('VarCharValue', '') for row in rows or () for datum in row.get('Data', []))
+    try:
+        # Skips a 'Query Plan' header row if one is present
+        plan = json.loads(text[text.find('{'):])
+    except ValueError:
+        return None
+    total = 0
+    for table in plan.get('inputTableColumnInfos', []):
+        size = table.get('estimate', {}).get('outputSizeInBytes')
+        if not isinstance(size, (int, float)) or math.isnan(size):
+            return None
+        total += size
+    return int(total) if plan.get('inputTableColumnInfos') else None
+
+
+def format_bytes(size):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024 or unit == 'GiB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def scan_budget_decision(estimated_bytes, budget_bytes=GUARDRAIL_SCAN_BUDGET_BYTES):
+    """(decision, problem) for an EXPLAIN estimate against the bytes-scanned budget."""
+    decision = {'guardrail': 'scan_budget', 'estimated_bytes': estimated_bytes, 'budget_bytes': budget_bytes}
+    if estimated_bytes is None:
+        decision['action'] = 'unknown'
+        return decision, None
+    if estimated_bytes > budget_bytes:
+        decision['action'] = 'rejected'
+        return decision, (f"the query would scan about {format_bytes(estimated_bytes)}, over the "
+                          f"{format_bytes(budget_bytes)} budget; filter on partition keys or select fewer columns")
+    decision['action'] = 'ok'
+    return decision, None
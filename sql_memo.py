@@ -0,0 +1,42 @@
+import hashlib
+import json
+import os
+import re
+
+from ttl_store import TTLStore
+
+SQL_MEMO_TTL_SECONDS = float(os.environ.get('SQL_MEMO_TTL_SECONDS', '86400'))
+SQL_MEMO_MAX_ENTRIES = int(os.environ.get('SQL_MEMO_MAX_ENTRIES', '1024'))
+
+
+def normalize_question(question):
+    question = re.sub(r'\s+', ' ', (question or '').strip().lower())
+    return question.rstrip(' ?.!')
+
+
+def schema_fingerprint(schema):
+    encoded = json.dumps(schema, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+class SqlMemo(TTLStore):
+    """Remembers SQL that executed successfully for a (table, client, question).
+
+    The schema fingerprint is part of the key, so a changed schema never
+    serves SQL written against the old one.
+    """
+
+    def __init__(self, ttl_seconds=SQL_MEMO_TTL_SECONDS, max_entries=SQL_MEMO_MAX_ENTRIES) -> None:
+        super().__init__(ttl_seconds, max_entries)
+
+    def _key(self, table_name, client, question, fingerprint):
+        return (table_name, (client or '').strip().lower(), normalize_question(question), fingerprint)
+
+    def get(self, table_name, client, question, fingerprint):
+        return self.lookup(self._key(table_name, client, question, fingerprint))
+
+    def put(self, table_name, client, question, fingerprint, sql):
+        self.store(self._key(table_name, client, question, fingerprint), sql)
+
+    def invalidate_table(self, table_name):
+        self.discard_matching(lambda key: key[0] == table_name)
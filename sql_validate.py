@@ -0,0 +1,266 @@
+import difflib
+import os
+import re
+
+SQL_REPAIR_ATTEMPTS = int(os.environ.get('SQL_REPAIR_ATTEMPTS', '2'))
+
+TOKEN_RE = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<quoted>"(?:[^"]|"")*")
+  | (?P<backtick>`[^`]*`)
+  | (?P<number>(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<name>[A-Za-z_][A-Za-z0-9_$@]*)
+  | (?P<op><>|!=|<=|>=|->|=>|\|\||[-+*/%=<>(),.;\[\]?:|^])
+""", re.VERBOSE | re.DOTALL)
+
+# Statements that change data or metadata; only queries may reach Athena
+FORBIDDEN = frozenset((
+    'ALTER', 'CALL', 'CREATE', 'DEALLOCATE', 'DELETE', 'DROP', 'EXECUTE', 'GRANT', 'INSERT', 'MERGE', 'MSCK',
+    'OPTIMIZE', 'PREPARE', 'REVOKE', 'UNLOAD', 'UPDATE', 'VACUUM',
+))
+
+# Trino keywords, type names and niladic functions; none of these are checked as column references
+KEYWORDS = frozenset('''
+    ALL AND ANY ARRAY AS ASC AT BERNOULLI BETWEEN BIGINT BOOLEAN BOTH BY CASE CAST CHAR CROSS CUBE CURRENT
+    CURRENT_DATE CURRENT_TIME CURRENT_TIMESTAMP CURRENT_USER DATE DAY DECIMAL DESC DISTINCT DOUBLE ELSE END ESCAPE
+    EXCEPT EXISTS EXTRACT FALSE FETCH FILTER FIRST FLOAT FOLLOWING FOR FROM FULL GROUP GROUPING HAVING HOUR IF IGNORE
+    ILIKE IN INNER INT INTEGER INTERSECT INTERVAL INTO IS JOIN JSON LAST LATERAL LEADING LEFT LIKE LIMIT LOCALTIME
+    LOCALTIMESTAMP MAP MINUTE MONTH NATURAL NEXT NO NOT NULL NULLS OF OFFSET ON ONLY OR ORDER ORDINALITY OUTER OVER
+    PARTITION PRECEDING QUARTER RANGE REAL RECURSIVE RESPECT RIGHT ROLLUP ROW ROWS SECOND SELECT SETS SMALLINT SOME
+    SYSTEM TABLESAMPLE THEN TIES TIME TIMESTAMP TINYINT TO TRAILING TRUE UNBOUNDED UNION UNNEST USING VALUE VALUES
+    VARBINARY VARCHAR WEEK WHEN WHERE WINDOW WITH WITHOUT YEAR ZONE
+'''.split())
+
+DANGLING = frozenset(('AND', 'OR', 'NOT', 'WHERE', 'FROM', 'JOIN', 'ON', 'BY', 'SELECT', 'HAVING', 'LIMIT', 'AS',
+                      'THEN', 'ELSE', 'WHEN', 'CASE', 'IN', 'LIKE', 'BETWEEN', 'IS'))
+
+
+class Token:
+    __slots__ = ('kind', 'text', 'upper', 'start')
+
+    def __init__(self, kind, text, start=0) -> None:
+        self.kind = kind
+        self.text = text
+        self.start = start
+        self.upper = text.upper() if kind == 'name' else text
+
+    @property
+    def identifier(self):
+        # Athena folds unquoted and quoted identifiers to lower case alike
+        if self.kind == 'quoted':
+            return self.text[1:-1].replace('""', '"').lower()
+        if self.kind == 'name':
+            return self.text.lower()
+        return None
+
+    @property
+    def is_keyword(self):
+        return self.kind == 'name' and self.upper in KEYWORDS
+
+
+def tokenize(sql):
+    """Significant tokens of `sql`; raises ValueError on an unterminated literal or stray character."""
+    tokens = []
+    position = 0
+    while position < len(sql):
+        match = TOKEN_RE.match(sql, position)
+        if match is None:
+            char = sql[position]
+            if char in '\'"':
+                kind = 'string literal' if char == "'" else 'quoted identifier'
+                raise ValueError(f"unterminated {kind} starting at: {sql[position:position + 30]}")
+            raise ValueError(f"unexpected character {char!r} at: {sql[position:position + 30]}")
+        position = match.end()
+        if match.lastgroup not in ('space', 'comment'):
+            tokens.append(Token(match.lastgroup, match.group(), match.start()))
+    return tokens
+
+
+def _syntax_problems(tokens):
+    problems = []
+    depth = 0
+    for token in tokens:
+        if token.text == '(':
+            depth += 1
+        elif token.text == ')':
+            depth -= 1
+            if depth < 0:
+                problems.append("unbalanced ')'")
+                depth = 0
+    if depth > 0:
+        problems.append(f"{depth} unclosed '('")
+
+    if any(token.kind == 'backtick' for token in tokens):
+        problems.append('Athena quotes identifiers with double quotes, not backticks')
+    for i, (previous, token) in enumerate(zip(tokens, tokens[1:])):
+        if previous.upper == 'SELECT' and token.upper == 'TOP':
+            problems.append('TOP is not supported; use LIMIT n at the end of the query')
+        elif token.upper == 'FROM' and (previous.upper == 'SELECT' or previous.upper == 'DISTINCT'
+                                        and i > 0 and tokens[i - 1].upper == 'SELECT'):
+            # Not `x IS [NOT] DISTINCT FROM y`
+            problems.append('empty select list')
+        elif previous.text == ',' and token.upper in ('FROM', 'WHERE', 'GROUP', 'ORDER', 'LIMIT', ')'):
+            problems.append(f"stray comma before {token.text}")
+        elif previous.upper == 'LIMIT' and token.kind != 'number' and token.upper != 'ALL':
+            problems.append(f"LIMIT needs a row count, got {token.text}")
+    last = tokens[-1]
+    if last.upper in DANGLING or (last.kind == 'op' and last.text not in (')', '*', ']')):
+        problems.append(f"statement ends unexpectedly after {last.text}")
+    return problems
+
+
+FROM_CLAUSE_END = frozenset(('WHERE', 'GROUP', 'HAVING', 'ORDER', 'LIMIT', 'OFFSET', 'FETCH', 'WINDOW', 'UNION',
+                             'EXCEPT', 'INTERSECT'))
+
+
+def _table_positions(tokens):
+    # Indexes of the (last part of) table names after FROM, JOIN and the commas of a FROM list
+    positions = set()
+    depth = 0
+    from_depths = []
+    expect_table = False
+    for i, token in enumerate(tokens):
+        if token.text == '(':
+            depth += 1
+            expect_table = False
+            continue
+        if token.text == ')':
+            depth -= 1
+            while from_depths and from_depths[-1] > depth:
+                from_depths.pop()
+            continue
+        in_from = bool(from_depths) and from_depths[-1] == depth
+        if token.upper in ('FROM', 'JOIN'):
+            if token.upper == 'FROM':
+                from_depths.append(depth)
+            expect_table = True
+        elif in_from and token.upper in FROM_CLAUSE_END:
+            from_depths.pop()
+            expect_table = False
+        elif in_from and token.text == ',':
+            expect_table = True
+        elif expect_table and token.identifier is not None and not token.is_keyword:
+            following = tokens[i + 1] if i + 1 < len(tokens) else None
+            if following is None or following.text != '.':
+                positions.add(i)
+                expect_table = False
+        elif token.text != '.':
+            expect_table = False
+    return positions
+
+
+def _lambda_parameter(tokens, i):
+    # Whether the name at `i` is in a parenthesized parameter list followed by ->
+    j = i + 1
+    while j < len(tokens) and (tokens[j].text == ',' or tokens[j].identifier is not None):
+        j += 1
+    return j + 1 < len(tokens) and tokens[j].text == ')' and tokens[j + 1].text == '->'
+
+
+def only_unknown_columns(problem):
+    # Whether a validate_sqls problem is nothing but unknown columns, which may be the validator's mistake
+    return all(part.startswith('unknown column ') for part in problem.split('; '))
+
+
+def _column_problems(tokens, columns, table_name):
+    known_tables = {table_name.lower()} if table_name else set()
+    ctes = set()
+    aliases = set()
+    tables = set()
+    count = len(tokens)
+
+    def at(i):
+        return tokens[i] if 0 <= i < count else None
+
+    table_positions = _table_positions(tokens)
+    for i, token in enumerate(tokens):
+        following = at(i + 1)
+        previous = at(i - 1)
+        if token.identifier is None or token.is_keyword:
+            continue
+        if following is not None and following.upper == 'AS' and at(i + 2) is not None and at(i + 2).text == '(':
+            ctes.add(token.identifier)
+        elif i in table_positions:
+            tables.add(token.identifier)
+        elif previous is not None and previous.upper == 'AS':
+            aliases.add(token.identifier)
+            if following is not None and following.text == '(':
+                # AS t(a, b) names the columns of an UNNEST or subquery
+                j = i + 2
+                while at(j) is not None and at(j).text != ')':
+                    if at(j).identifier:
+                        aliases.add(at(j).identifier)
+                    j += 1
+        elif following is not None and following.text == '->':
+            aliases.add(token.identifier)
+        elif previous is not None and previous.text in ('(', ',') and _lambda_parameter(tokens, i):
+            # `(k, v) -> v > 0`
+            aliases.add(token.identifier)
+        elif previous is not None and (previous.kind in ('number', 'string') or previous.text == ')'
+                                       or previous.upper == 'END'
+                                       or (previous.identifier and not previous.is_keyword
+                                           and previous.kind in ('name', 'quoted'))):
+            # An implicit alias: `count(*) total`, `CASE ... END kind`, `FROM pl_transaction t`
+            aliases.add(token.identifier)
+
+    if tables - known_tables - ctes:
+        # Another table is involved whose columns are unknown here
+        return []
+
+    lowered = {column.lower() for column in columns}
+    scope = lowered | aliases | tables | ctes
+    unknown = []
+    for i, token in enumerate(tokens):
+        name = token.identifier
+        if name is None or token.is_keyword or name in scope:
+            continue
+        following = at(i + 1)
+        previous = at(i - 1)
+        if following is not None and following.text in ('(', '.', '->'):
+            continue
+        if previous is not None and previous.text == '.':
+            qualifier = at(i - 2)
+            if qualifier is None or qualifier.identifier not in aliases | tables | ctes:
+                continue
+        if name not in unknown:
+            unknown.append(name)
+
+    problems = []
+    for name in unknown:
+        close = difflib.get_close_matches(name, sorted(lowered), n=3)
+        hint = f" (did you mean {', '.join(close)}?)" if close else ''
+        problems.append(f"unknown column {name}{hint}")
+    return problems
+
+
+def validate_sql(sql, columns=None, table_name=None):
+    """Problems found in `sql` without a round trip to Athena; an empty list means it may be submitted.
+
+    Only a single SELECT (or WITH ... SELECT) is accepted. With `columns`, references
+    that are not columns of `table_name`, aliases or CTE names are reported too.
+    """
+    try:
+        tokens = tokenize(sql or '')
+    except ValueError as e:
+        return [str(e)]
+    while tokens and tokens[-1].text == ';':
+        tokens.pop()
+    if not tokens:
+        return ['empty statement']
+    if any(token.text == ';' for token in tokens):
+        return ['only one statement may be submitted at a time']
+
+    first = next((token for token in tokens if token.text != '('), tokens[0])
+    if first.upper not in ('SELECT', 'WITH', 'VALUES'):
+        return [f"only SELECT queries are allowed, got {first.text}"]
+    for i, token in enumerate(tokens):
+        following = tokens[i + 1] if i + 1 < len(tokens) else None
+        if token.kind == 'name' and token.upper in FORBIDDEN and (following is None or following.text != '('):
+            return [f"{token.upper} statements are not allowed"]
+
+    problems = _syntax_problems(tokens)
+    if columns and not problems:
+        problems = _column_problems(tokens, columns, table_name)
+    return problems
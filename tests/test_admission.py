@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+import admission
+from admission import AdmissionController, Gate, ServiceBusyError, TokenBucket
+
+
+class ClientError(Exception):
+    """Shaped like botocore's: the error code is in `response`."""
+
+    def __init__(self, code) -> None:
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(admission, 'retry_delays', lambda: iter([0.0] * 3))
+
+
+def flaky(*errors, result='ok'):
+    errors = list(errors)
+    calls = []
+
+    def fn(**kwargs):
+        calls.append(kwargs)
+        if errors:
+            raise errors.pop(0)
+        return result
+
+    return fn, calls
+
+
+def test_throttling_is_retried():
+    gate = Gate('athena', 'primary')
+    fn, calls = flaky(ClientError('ThrottlingException'), ClientError('TooManyRequestsException'))
+    assert gate.call(fn, QueryExecutionId='q') == 'ok'
+    assert len(calls) == 3
+    assert gate.stats()['throttled'] == 2 and gate.stats()['retries'] == 2
+
+
+def test_other_errors_are_never_retried():
+    gate = Gate('athena', 'primary')
+    for error in (ClientError('InvalidRequestException'), ValueError('SYNTAX_ERROR: line 1:8')):
+        fn, calls = flaky(error)
+        with pytest.raises(type(error)):
+            gate.call(fn)
+        assert len(calls) == 1
+    assert gate.stats()['retries'] == 0
+
+
+def test_throttling_past_the_retries_is_busy():
+    gate = Gate('bedrock', 'model')
+    fn, calls = flaky(*[ClientError('ThrottlingException')] * 4)
+    with pytest.raises(ServiceBusyError) as busy:
+        gate.call(fn)
+    assert (busy.value.service, busy.value.scope) == ('bedrock', 'model')
+    assert len(calls) == 4
+
+
+def test_async_call_retries_the_same_way():
+    gate = Gate('athena', 'primary')
+    fn, calls = flaky(ClientError('ThrottlingException'))
+
+    async def run(fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    assert asyncio.run(gate.call_async(run, fn)) == 'ok'
+    assert len(calls) == 2
+    fn, calls = flaky(ValueError('bad'))
+    with pytest.raises(ValueError):
+        asyncio.run(gate.call_async(run, fn))
+    assert len(calls) == 1
+
+
+def test_slots_limit_concurrency():
+    gate = Gate('athena', 'primary', concurrency=1)
+    with gate.slot() as waited:
+        assert waited is not None
+        with gate.slot(blocking=False) as free:
+            assert free is None
+        with pytest.raises(ServiceBusyError):
+            with gate.slot(deadline=0):
+                pass
+    assert gate.stats()['rejected'] == 1 and gate.stats()['in_flight'] == 0
+
+
+def test_token_bucket_paces_past_the_burst():
+    bucket = TokenBucket(rate=10, burst=2)
+    assert [bucket.reserve() for _ in range(2)] == [0.0, 0.0]
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert TokenBucket().reserve() == 0.0
+
+
+def test_scoped_limits_override_the_service():
+    controller = AdmissionController({'athena': {'concurrency': 4}},
+                                     overrides='{"athena:analytics": {"concurrency": 1}}')
+    assert controller.gate('athena', 'analytics').semaphore._value == 1
+    assert controller.gate('athena', 'primary').semaphore._value == 4
+    assert controller.gate('athena', 'primary') is controller.gate('athena', 'primary')
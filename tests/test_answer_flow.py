@@ -0,0 +1,63 @@
+from answer_flow import QuestionState, answer_steps, run_steps
+from tracing import Tracer
+
+
+class FakeAgent:
+    """Just enough of SQL_Answer_Agent for answer_steps; every generated SQL is `sql`."""
+
+    table_name = 'pl_transaction'
+    schema = None
+    sql_memo = None
+    tracer = Tracer()
+
+    def __init__(self, sql, problems, sql_repair_attempts=1) -> None:
+        self.sql = sql
+        self.problems = problems
+        self.sql_repair_attempts = sql_repair_attempts
+        self.stages = []
+
+    def retrieve_examples(self, query, client):
+        return []
+
+    def sql_prompt(self, query, client, examples):
+        return query
+
+    def repair_prompt(self, query, client, failures):
+        return query
+
+    def extract_sqls(self, text):
+        return [text]
+
+    def validate_sqls(self, sql_queries):
+        return [(sql_query, self.problems) for sql_query in sql_queries] if self.problems else []
+
+    def failure_message(self, failures):
+        return 'failed: ' + '; '.join(problem for _, problem in failures)
+
+    def guarded_question(self, query, decisions):
+        return query
+
+    def record_sql_outcome(self, *args):
+        pass
+
+    def run_step(self, stage, *args):
+        self.stages.append(stage)
+        if stage in ('sql_generation', 'sql_repair'):
+            return self.sql
+        if stage == 'guardrails':
+            return args[1], [], []
+        return 'rows', True
+
+
+def test_unknown_columns_go_to_athena_once_repairs_are_used_up():
+    agent = FakeAgent('SELECT k FROM pl_transaction', 'unknown column k')
+    message, summary_input = run_steps(answer_steps(agent, QuestionState(), 'q', 'c'), agent.run_step)
+    assert message is None and summary_input == ('q', 'rows')
+    assert agent.stages == ['sql_generation', 'sql_repair', 'guardrails', 'athena']
+
+
+def test_other_problems_stop_before_athena():
+    agent = FakeAgent('SELECT k, FROM pl_transaction', 'stray comma before FROM')
+    message, _ = run_steps(answer_steps(agent, QuestionState(), 'q', 'c'), agent.run_step)
+    assert message == 'failed: stray comma before FROM'
+    assert agent.stages == ['sql_generation', 'sql_repair']
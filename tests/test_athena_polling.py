@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+import pytest
+
+from athena_polling import (BackoffPolicy, FixedPolicy, QueryTimeoutError, deadline_from_context, wait_for_queries,
+                            wait_for_query, wait_for_query_async)
+
+
+class FakeAthena:
+    """Each query reports RUNNING for `polls` polls, then `final`; stops are recorded."""
+
+    def __init__(self, polls=0, final='SUCCEEDED') -> None:
+        self.polls = polls
+        self.final = final
+        self.calls = {}
+        self.stopped = []
+
+    def _execution(self, query_execution_id):
+        self.calls[query_execution_id] = self.calls.get(query_execution_id, 0) + 1
+        state = 'RUNNING' if self.calls[query_execution_id] <= self.polls else self.final
+        return {'QueryExecutionId': query_execution_id, 'Status': {'State': state}}
+
+    def get_query_execution(self, QueryExecutionId):
+        return {'QueryExecution': self._execution(QueryExecutionId)}
+
+    def batch_get_query_execution(self, QueryExecutionIds):
+        return {'QueryExecutions': [self._execution(query_execution_id) for query_execution_id in QueryExecutionIds]}
+
+    def stop_query_execution(self, QueryExecutionId):
+        self.stopped.append(QueryExecutionId)
+
+
+FAST = FixedPolicy(0.001)
+
+
+def test_polls_until_terminal():
+    athena = FakeAthena(polls=3)
+    assert wait_for_query(athena, 'q', policy=FAST)['Status']['State'] == 'SUCCEEDED'
+    assert athena.calls == {'q': 4} and athena.stopped == []
+
+
+def test_deadline_stops_the_query():
+    athena = FakeAthena(polls=10 ** 6)
+    started = time.monotonic()
+    with pytest.raises(QueryTimeoutError):
+        wait_for_query(athena, 'q', policy=FixedPolicy(1), deadline=started + 0.05)
+    # The last sleep is cut to the deadline rather than taking the policy's full second
+    assert time.monotonic() - started < 0.5
+    assert athena.stopped == ['q']
+
+
+def test_a_failing_call_stops_the_query():
+    athena = FakeAthena(polls=10)
+
+    def call(fn, **kwargs):
+        raise RuntimeError('throttled past every retry')
+
+    with pytest.raises(RuntimeError):
+        wait_for_query(athena, 'q', policy=FAST, call=call)
+    assert athena.stopped == ['q']
+
+
+def test_wait_for_queries_stops_only_the_pending_ones():
+    athena = FakeAthena(polls=10 ** 6)
+    athena.calls['done'] = 10 ** 6
+    with pytest.raises(QueryTimeoutError):
+        wait_for_queries(athena, ['done', 'slow'], policy=FAST, deadline=time.monotonic() + 0.02)
+    assert athena.stopped == ['slow']
+
+    athena = FakeAthena(polls=2, final='FAILED')
+    finished = wait_for_queries(athena, [f"q{i}" for i in range(60)], policy=FAST)
+    assert len(finished) == 60 and finished['q59']['Status']['State'] == 'FAILED'
+
+
+def test_async_wait_stops_a_cancelled_query():
+    athena = FakeAthena(polls=10 ** 6)
+
+    async def cancel_soon():
+        task = asyncio.ensure_future(wait_for_query_async(athena, 'q', policy=FAST))
+        await asyncio.sleep(0.02)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_soon())
+    assert athena.stopped == ['q']
+    athena = FakeAthena(polls=2)
+    assert asyncio.run(wait_for_query_async(athena, 'q', policy=FAST))['Status']['State'] == 'SUCCEEDED'
+
+
+def test_backoff_policy_is_capped():
+    delays = BackoffPolicy(initial=0.1, maximum=0.3).delays()
+    assert [next(delays) for _ in range(4)] == [0.1, 0.2, 0.3, 0.3]
+
+
+def test_deadline_from_context_keeps_a_margin():
+    class Context:
+        def get_remaining_time_in_millis(self):
+            return 10000
+
+    assert deadline_from_context(None) is None
+    assert deadline_from_context(Context(), margin_ms=3000) - time.monotonic() == pytest.approx(7, abs=0.1)
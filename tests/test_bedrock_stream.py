@@ -0,0 +1,44 @@
+import json
+
+from bedrock_stream import iter_stream_text, read_until, stop_reading
+
+
+def event(payload):
+    return {'chunk': {'bytes': json.dumps(payload).encode('utf-8')}}
+
+
+class Body(list):
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_stop_reading():
+    assert not stop_reading('<SQL>SELECT 1', '</SQL>', '<SQL>')
+    # Another block may follow the closing tag
+    assert not stop_reading('<SQL>SELECT 1</SQL> ', '</SQL>', '<SQL>')
+    assert not stop_reading('<SQL>SELECT 1</SQL>\n<SQ', '</SQL>', '<SQL>')
+    assert stop_reading('<SQL>SELECT 1</SQL> That is all', '</SQL>', '<SQL>')
+    assert stop_reading('<SAQ>q</SAQ>', '</SAQ>')
+    assert not stop_reading('anything', None)
+
+
+def test_read_until_stops_after_the_last_block_and_closes():
+    chunks = iter(['<SQL>SELECT 1</SQL>', ' <SQL>SELECT 2</SQL>', ' done', ' never read'])
+    assert read_until(chunks, '</SQL>', '<SQL>') == '<SQL>SELECT 1</SQL> <SQL>SELECT 2</SQL> done'
+    assert next(chunks, None) == ' never read'
+
+
+def test_iter_stream_text_yields_deltas_stop_sequence_and_usage():
+    body = Body([
+        event({'type': 'message_start', 'message': {'usage': {'input_tokens': 12}}}),
+        event({'type': 'content_block_delta', 'delta': {'text': '<SQL>SELECT 1'}}),
+        {'other': {}},
+        event({'type': 'message_delta', 'delta': {'stop_reason': 'stop_sequence', 'stop_sequence': '</SQL>'},
+               'usage': {'output_tokens': 4}}),
+    ])
+    usage = {}
+    assert ''.join(iter_stream_text({'body': body}, usage)) == '<SQL>SELECT 1</SQL>'
+    assert usage == {'input_tokens': 12, 'output_tokens': 4}
+    assert body.closed
@@ -0,0 +1,47 @@
+from conversation import bounded_history, compress_turns, needs_standalone_rewrite, pair_turns
+
+
+def test_short_history_is_passed_through():
+    assert bounded_history(['q1', 'a1', 'q2', 'a2'], recent_turns=3) == ['q1', 'a1', 'q2', 'a2']
+
+
+def test_unanswered_question_is_kept_alone():
+    assert pair_turns(['q1', 'a1', 'q2']) == [('q1', 'a1'), ('q2', '')]
+    assert bounded_history(['q1', 'a1', 'q2'], recent_turns=3) == ['q1', 'a1', 'q2']
+
+
+def test_older_turns_are_folded_into_a_summary():
+    history = bounded_history(['q1', 'First answer. More detail.', 'q2', 'a2', 'q3', 'a3'], recent_turns=2)
+    assert history == ['Summary of the earlier conversation: Q: q1 A: First answer.', 'q2', 'a2', 'q3', 'a3']
+
+
+def test_summarizer_only_sees_the_older_turns():
+    seen = []
+
+    def summarizer(summary, turns):
+        seen.append((summary, turns))
+        return 'earlier'
+
+    history = bounded_history(['q1', 'a1', 'q2', 'a2', 'q3', 'a3'], recent_turns=1, summarizer=summarizer)
+    assert seen == [('', [('q1', 'a1'), ('q2', 'a2')])]
+    assert history == ['Summary of the earlier conversation: earlier', 'q3', 'a3']
+
+
+def test_long_turns_are_clipped():
+    history = bounded_history(['q' * 5000, 'a' * 5000], recent_turns=1)
+    assert all(len(text) < 1000 for text in history)
+    assert history[0].endswith('…')
+
+
+def test_summary_stays_within_its_budget():
+    turns = [(f"question {i}", f"answer {i}.") for i in range(100)]
+    summary = compress_turns('', turns, max_chars=200)
+    assert len(summary) <= 200
+    assert summary.endswith('Q: question 99 A: answer 99.')
+
+
+def test_needs_standalone_rewrite():
+    assert not needs_standalone_rewrite('how many accounts posted last month', [])
+    assert needs_standalone_rewrite('and last year?', ['q', 'a'])
+    assert needs_standalone_rewrite('what about them', ['q', 'a'])
+    assert not needs_standalone_rewrite('total posting amount by currency in 2023', ['q', 'a'])
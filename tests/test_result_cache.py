@@ -0,0 +1,78 @@
+import time
+
+from result_cache import CachedResult, RecordingStream, ResultCache, normalize_sql
+
+
+def result(size, rows=()):
+    return CachedResult(['n'], ['integer'], list(rows), False, size)
+
+
+class Stream:
+    """A ResultStream stand-in: every row counts `row_bytes` towards bytes_read."""
+
+    def __init__(self, rows, row_bytes) -> None:
+        self.rows = rows
+        self.row_bytes = row_bytes
+        self.columns = ['n']
+        self.column_types = ['integer']
+        self.truncated = False
+        self.bytes_read = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            self.bytes_read += self.row_bytes
+            yield row
+
+
+def test_normalize_sql_keeps_literals():
+    assert normalize_sql("SELECT  *\nFROM T WHERE name = 'Bluestar';") == "select * from t where name = 'Bluestar'"
+
+
+def test_hit_on_the_same_sql_in_the_same_database():
+    cache = ResultCache()
+    cached = result(10, [(1,)])
+    cache.put('db', 'SELECT 1', cached, cost_seconds=2.0, scanned_bytes=100)
+    assert cache.get('db', 'select   1;') is cached
+    assert cache.get('other', 'SELECT 1') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['saved_seconds'], stats['saved_scanned_bytes']) == (1, 1, 2.0, 100)
+
+
+def test_entries_expire():
+    cache = ResultCache(ttl_seconds=0.01)
+    cache.put('db', 'SELECT 1', result(10))
+    assert cache.contains('db', 'SELECT 1')
+    time.sleep(0.02)
+    assert not cache.contains('db', 'SELECT 1')
+    assert cache.get('db', 'SELECT 1') is None
+    assert cache.stats()['bytes'] == 0
+
+
+def test_byte_cap_evicts_least_recently_used():
+    cache = ResultCache(max_bytes=25)
+    cache.put('db', 'a', result(10))
+    cache.put('db', 'b', result(10))
+    cache.get('db', 'a')
+    cache.put('db', 'c', result(10))
+    assert cache.get('db', 'b') is None
+    assert cache.get('db', 'a') is not None and cache.get('db', 'c') is not None
+    assert cache.stats()['bytes'] == 20
+
+
+def test_result_larger_than_the_cache_is_not_kept():
+    cache = ResultCache(max_bytes=25)
+    cache.put('db', 'a', result(26))
+    assert cache.stats()['entries'] == 0
+
+
+def test_recording_stream_hands_over_complete_results_only():
+    recorded = []
+    stream = RecordingStream(Stream([(1,), (2,)], 4), lambda cached, seconds: recorded.append(cached))
+    assert list(stream) == [(1,), (2,)]
+    assert list(recorded[0]) == [(1,), (2,)] and recorded[0].bytes_read == 8
+
+    recorded.clear()
+    # Past the per-entry cap the rows still stream through but nothing is cached
+    assert list(RecordingStream(Stream([(1,), (2,)], 4), lambda *args: recorded.append(args), max_bytes=5)) == [
+        (1,), (2,)]
+    assert recorded == []
@@ -0,0 +1,32 @@
+import numpy as np
+
+from result_profile import profile_column, stratified_sample, to_columns
+
+
+def strata_arrays(keys):
+    arrays = to_columns(['varchar'], [(key,) for key in keys])
+    return arrays, [profile_column('kind', 'varchar', arrays[0])]
+
+
+def test_stratified_sample_keeps_every_stratum_within_size():
+    # Rounding gives 5 + 5 + 1 rows; the trim comes out of the large strata, not the last one
+    keys = ['a'] * 15 + ['b'] * 14 + ['c']
+    arrays, profiles = strata_arrays(keys)
+    sample = stratified_sample(arrays, profiles, len(keys), 10)
+    assert len(sample) == 10
+    assert {keys[i] for i in sample} == {'a', 'b', 'c'}
+    assert list(sample) == sorted(set(sample))
+
+
+def test_more_strata_than_rows_requested_takes_one_each():
+    keys = [f"k{i % 12}" for i in range(120)]
+    arrays, profiles = strata_arrays(keys)
+    sample = stratified_sample(arrays, profiles, len(keys), 5)
+    assert sorted(keys[i] for i in sample) == sorted(set(keys))
+
+
+def test_without_strata_rows_are_spread_evenly():
+    arrays = to_columns(['double'], [(float(i),) for i in range(100)])
+    profiles = [profile_column('amount', 'double', arrays[0])]
+    assert list(stratified_sample(arrays, profiles, 100, 5)) == list(np.linspace(0, 99, 5).astype(int))
+    assert len(stratified_sample(arrays, profiles, 100, 200)) == 100
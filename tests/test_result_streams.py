@@ -0,0 +1,119 @@
+from decimal import Decimal
+
+import pytest
+
+from athena_results import ResultStream, decode_value, iter_result_pages
+from s3_results import CsvResultStream, iter_lines, parse_s3_uri
+
+COLUMN_INFO = [{'Name': 'account_id', 'Type': 'varchar'}, {'Name': 'amount', 'Type': 'decimal'},
+               {'Name': 'posted', 'Type': 'integer'}]
+
+
+def row(*values):
+    return {'Data': [{} if value is None else {'VarCharValue': value} for value in values]}
+
+
+class FakeAthena:
+    """get_query_results over fixed pages, chained by NextToken."""
+
+    def __init__(self, pages) -> None:
+        self.pages = pages
+        self.calls = []
+
+    def get_query_results(self, QueryExecutionId, MaxResults, NextToken=None):
+        self.calls.append(NextToken)
+        index = int(NextToken or 0)
+        page = {'ResultSet': {'ResultSetMetadata': {'ColumnInfo': COLUMN_INFO}, 'Rows': self.pages[index]}}
+        if index + 1 < len(self.pages):
+            page['NextToken'] = str(index + 1)
+        return page
+
+
+class MemorySource:
+    def __init__(self, data) -> None:
+        self.data = data
+        self.reads = 0
+
+    def size(self):
+        return len(self.data)
+
+    def read_range(self, start, end):
+        self.reads += 1
+        return self.data[start:end]
+
+
+def test_decode_value():
+    assert decode_value('12', 'bigint') == 12
+    assert decode_value('1.5', 'double') == 1.5
+    assert decode_value('1.10', 'decimal') == Decimal('1.10')
+    assert decode_value('TRUE', 'boolean') is True
+    assert decode_value('n/a', 'integer') == 'n/a'
+    assert decode_value(None, 'integer') is None
+
+
+def test_result_stream_pages_and_skips_the_header_row():
+    athena = FakeAthena([[row('account_id', 'amount', 'posted'), row('a', '1.50', '3')], [row('b', None, '4')]])
+    stream = ResultStream(athena, 'q', page_size=2)
+    assert list(stream) == [('a', Decimal('1.50'), 3), ('b', None, 4)]
+    assert stream.columns == ['account_id', 'amount', 'posted']
+    assert athena.calls == [None, '1']
+    assert not stream.truncated
+    with pytest.raises(RuntimeError):
+        iter(stream)
+
+
+def test_result_stream_stops_at_the_row_budget():
+    athena = FakeAthena([[row('account_id', 'amount', 'posted')] + [row(str(i), '1', '1') for i in range(5)],
+                         [row('x', '1', '1')]])
+    stream = ResultStream(athena, 'q', max_rows=3)
+    assert len(list(stream)) == 3
+    assert stream.truncated
+    # The budget ran out on the first page, so the second was never fetched
+    assert athena.calls == [None]
+
+
+def test_result_stream_starts_from_a_given_first_page():
+    athena = FakeAthena([[row('account_id', 'amount', 'posted'), row('a', '1', '1')], [row('b', '2', '2')]])
+    first_page = athena.get_query_results(QueryExecutionId='q', MaxResults=10)
+    calls = []
+
+    def call(fn, **kwargs):
+        calls.append(kwargs)
+        return fn(**kwargs)
+
+    stream = ResultStream(athena, 'q', first_page=first_page, call=call)
+    assert [values[0] for values in stream] == ['a', 'b']
+    assert [kwargs.get('NextToken') for kwargs in calls] == ['1']
+
+
+def test_iter_result_pages_without_next_token_makes_one_call():
+    athena = FakeAthena([[row('a', '1', '1')]])
+    assert len(list(iter_result_pages(athena, 'q'))) == 1
+    assert athena.calls == [None]
+
+
+def test_csv_stream_reads_in_chunks_and_decodes():
+    data = 'account_id,amount,posted\n"a, inc","1.25",3\n"multi\nline","",\nb,2,5\n'.encode('utf-8')
+    source = MemorySource(data)
+    stream = CsvResultStream(source, COLUMN_INFO, chunk_bytes=7)
+    assert list(stream) == [('a, inc', Decimal('1.25'), 3), ('multi\nline', None, None), ('b', Decimal('2'), 5)]
+    assert source.reads > 1
+    assert not stream.truncated
+
+
+def test_csv_stream_keeps_empty_strings_and_honours_the_byte_budget():
+    data = b'account_id,amount,posted\n,1,1\nabcdef,2,2\n'
+    stream = CsvResultStream(MemorySource(data), COLUMN_INFO, max_bytes=5)
+    assert list(stream) == [('', Decimal('1'), 1)]
+    assert stream.truncated
+
+
+def test_iter_lines_splits_only_on_newlines_across_chunks():
+    chunks = ['é,\x1c'.encode('utf-8')[:2], 'é,\x1c'.encode('utf-8')[2:] + b'\nb', b'\n']
+    assert list(iter_lines(chunks)) == ['é,\x1c\n', 'b\n']
+
+
+def test_parse_s3_uri():
+    assert parse_s3_uri('s3://bucket/path/to/q.csv') == ('bucket', 'path/to/q.csv')
+    with pytest.raises(ValueError):
+        parse_s3_uri('https://bucket/q.csv')
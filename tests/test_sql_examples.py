@@ -0,0 +1,70 @@
+import json
+import os
+
+import numpy as np
+
+from sql_examples import SqlExampleIndex, examples_prompt, question_vector
+
+
+def test_similar_question_is_found_for_the_same_table_and_client():
+    index = SqlExampleIndex()
+    index.add('pl_transaction', 'c', 'total posting amount by account', ['SELECT 1'])
+    index.add('pl_transaction', 'c', 'list employees of a company', ['SELECT 2'])
+    index.add('other_table', 'c', 'total posting amount by account', ['SELECT 3'])
+    results = index.search('pl_transaction', 'c', 'posting amount total per account')
+    assert [example['sql'] for _, example in results] == [['SELECT 1']]
+    assert index.search('pl_transaction', 'someone else', 'posting amount total per account') == []
+    assert 'Question: total posting amount by account' in examples_prompt(results)
+
+
+def test_readding_a_question_replaces_its_example():
+    index = SqlExampleIndex()
+    index.add('t', 'c', 'total posting amount by account', ['SELECT 1'])
+    index.add('t', 'c', 'Total posting amount by account?', ['SELECT 2'])
+    assert [example['sql'] for _, example in index.search('t', 'c', 'total posting amount by account')] == [
+        ['SELECT 2']]
+    assert index.stats()['examples'] == 1
+
+
+def word(i):
+    return 'zz' + chr(97 + i % 26) + chr(97 + i // 26)
+
+
+def test_memory_mapped_index_reloads(tmp_path):
+    index = SqlExampleIndex(str(tmp_path))
+    for i in range(300):
+        # Past the initial capacity, so the memory map is grown once
+        index.add('t', 'c', f"total posting amount for account group {word(i)}", [f"SELECT {i}"])
+    index.add('t', 'c', f"total posting amount for account group {word(7)}", ['SELECT 7 again'])
+
+    reloaded = SqlExampleIndex(str(tmp_path))
+    assert reloaded.stats()['examples'] == 300
+    assert np.array_equal(reloaded._vectors[:301], index._vectors[:301])
+    best = reloaded.search('t', 'c', f"posting amount {word(7)}", top_k=1)
+    assert best[0][1]['sql'] == ['SELECT 7 again']
+
+
+def test_lines_whose_row_was_overwritten_are_skipped(tmp_path):
+    first, second = SqlExampleIndex(str(tmp_path)), SqlExampleIndex(str(tmp_path))
+    first.add('t', 'c', 'total posting amount by account', ['SELECT 1'])
+    # A second instance on the same directory picks the same row and overwrites its vector
+    second.add('t', 'c', 'count of customers per region', ['SELECT 2'])
+    with open(os.path.join(str(tmp_path), 'examples.jsonl')) as f:
+        assert [json.loads(line)['row'] for line in f] == [0, 0]
+
+    reloaded = SqlExampleIndex(str(tmp_path))
+    assert reloaded.stats()['examples'] == 1
+    assert reloaded.search('t', 'c', 'total posting amount by account') == []
+    assert reloaded.search('t', 'c', 'customers per region')[0][1]['sql'] == ['SELECT 2']
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    index = SqlExampleIndex(str(tmp_path))
+    index.add('t', 'c', 'total posting amount by account', ['SELECT 1'])
+    with open(os.path.join(str(tmp_path), 'examples.jsonl'), 'a') as f:
+        f.write('{"table": "t", "cli')
+    assert SqlExampleIndex(str(tmp_path)).stats()['examples'] == 1
+
+
+def test_question_vector_ignores_numbers():
+    assert np.array_equal(question_vector('accounts in 2023'), question_vector('accounts in 2024'))
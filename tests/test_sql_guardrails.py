@@ -0,0 +1,108 @@
+import json
+
+from sql_guardrails import (add_limit, estimated_scan_bytes, explain_query, guard_partitions, partition_predicate,
+                            scan_budget_decision)
+
+PARTITIONS = [('posting_date', 'date')]
+WINDOW = "\"posting_date\" >= current_date - interval '30' day"
+
+
+def test_limit_is_one_past_the_row_budget():
+    sql, decision = add_limit('SELECT account_id FROM pl_transaction;', 'which accounts posted', 100, 10)
+    assert sql == 'SELECT account_id FROM pl_transaction LIMIT 101'
+    assert decision == {'guardrail': 'limit', 'action': 'added', 'kind': 'row_budget', 'limit': 101}
+
+
+def test_sample_questions_get_the_sample_limit():
+    sql, _ = add_limit('SELECT * FROM pl_transaction', 'show me some transactions', 100, 10)
+    assert sql.endswith('LIMIT 10')
+    sql, _ = add_limit('SELECT * FROM pl_transaction', 'show all transactions', 100, 10)
+    assert sql.endswith('LIMIT 101')
+
+
+def test_listing_verbs_are_not_sample_cues():
+    for question in ('show the transactions of account 7', 'give me details of employees', 'list the accounts'):
+        assert add_limit('SELECT * FROM pl_transaction', question, 100, 10)[0].endswith('LIMIT 101')
+
+
+def test_grouped_aggregates_never_get_the_sample_limit():
+    sql = 'SELECT account_id, sum(amount) FROM t GROUP BY account_id'
+    for question in ('show total amount per account', 'some totals per account'):
+        assert add_limit(sql, question, 10000)[0] == f"{sql} LIMIT 10001"
+
+
+def test_existing_limit_is_kept():
+    sql = 'SELECT * FROM pl_transaction LIMIT 5'
+    assert add_limit(sql, '', 100) == (sql, {'guardrail': 'limit', 'action': 'present'})
+
+
+def test_single_aggregate_row_gets_no_limit():
+    sql = 'SELECT count(*) FROM pl_transaction'
+    assert add_limit(sql, '', 100)[1]['action'] == 'skipped'
+
+
+def test_grouped_aggregate_gets_a_limit():
+    _, decision = add_limit('SELECT account_id, sum(posting_amount) FROM pl_transaction GROUP BY 1', '', 100)
+    assert decision['action'] == 'added'
+
+
+def test_aggregate_in_a_subquery_does_not_skip_the_limit():
+    sql = 'SELECT * FROM pl_transaction WHERE posting_amount > (SELECT avg(posting_amount) FROM pl_transaction)'
+    assert add_limit(sql, '', 100)[1]['action'] == 'added'
+
+
+def test_partitions_left_alone_when_off_or_filtered():
+    sql = 'SELECT * FROM pl_transaction'
+    assert guard_partitions(sql, PARTITIONS, 'pl_transaction', policy='off') == (sql, None, None)
+    filtered = "SELECT * FROM pl_transaction WHERE posting_date = DATE '2024-01-01'"
+    assert guard_partitions(filtered, PARTITIONS, 'pl_transaction', policy='add')[1]['action'] == 'present'
+
+
+def test_require_policy_sends_the_query_back():
+    _, decision, problem = guard_partitions('SELECT * FROM pl_transaction', PARTITIONS, 'pl_transaction',
+                                            policy='require')
+    assert decision['action'] == 'required'
+    assert 'posting_date' in problem
+
+
+def test_add_policy_injects_a_window_into_row_listings():
+    sql, decision, problem = guard_partitions('SELECT * FROM pl_transaction', PARTITIONS, 'pl_transaction',
+                                              policy='add', days=30)
+    assert sql == f'SELECT * FROM pl_transaction WHERE {WINDOW}'
+    assert decision['action'] == 'added' and problem is None
+
+    sql, _, _ = guard_partitions('SELECT * FROM pl_transaction WHERE a = 1 OR b = 2 ORDER BY a', PARTITIONS,
+                                 'pl_transaction', policy='add', days=30)
+    assert sql == f'SELECT * FROM pl_transaction WHERE {WINDOW} AND (a = 1 OR b = 2) ORDER BY a'
+
+
+def test_add_policy_never_filters_aggregates_or_joins():
+    for sql in ('SELECT count(*) FROM pl_transaction',
+                'SELECT * FROM pl_transaction p JOIN accounts a ON a.id = p.account_id'):
+        assert guard_partitions(sql, PARTITIONS, 'pl_transaction', policy='add') == (
+            sql, {'guardrail': 'partition', 'action': 'missing', 'keys': 'posting_date'}, None)
+
+
+def test_partition_predicates_by_type():
+    assert partition_predicate('dt', 'string', 7) == "\"dt\" >= date_format(current_date - interval '7' day, '%Y-%m-%d')"
+    assert partition_predicate('year', 'int', 7) == "\"year\" >= year(current_date - interval '7' day)"
+    assert partition_predicate('region', 'string') is None
+
+
+def test_scan_estimate_from_explain():
+    plan = {'inputTableColumnInfos': [{'estimate': {'outputSizeInBytes': 2048.0}},
+                                      {'estimate': {'outputSizeInBytes': 1024}}]}
+    rows = [{'Data': [{'VarCharValue': 'Query Plan'}]}, {'Data': [{'VarCharValue': json.dumps(plan)}]}]
+    assert estimated_scan_bytes(rows) == 3072
+    unknown = {'inputTableColumnInfos': [{'estimate': {'outputSizeInBytes': float('nan')}}]}
+    assert estimated_scan_bytes([{'Data': [{'VarCharValue': json.dumps(unknown)}]}]) is None
+    assert explain_query('SELECT 1;') == 'EXPLAIN (TYPE IO, FORMAT JSON) SELECT 1'
+
+
+def test_scan_budget():
+    assert scan_budget_decision(None, 100)[0]['action'] == 'unknown'
+    assert scan_budget_decision(100, 100) == (
+        {'guardrail': 'scan_budget', 'estimated_bytes': 100, 'budget_bytes': 100, 'action': 'ok'}, None)
+    decision, problem = scan_budget_decision(3 * 1024 ** 3, 1024 ** 3)
+    assert decision['action'] == 'rejected'
+    assert problem.startswith('the query would scan about 3.0 GiB, over the 1.0 GiB budget')
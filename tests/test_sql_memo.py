@@ -0,0 +1,45 @@
+import time
+
+from sql_memo import SqlMemo, normalize_question, schema_fingerprint
+
+
+def test_repeat_question_is_served_from_the_memo():
+    memo = SqlMemo()
+    memo.put('pl_transaction', 'Bluestar', 'How many accounts?', 'f1', ['SELECT 1'])
+    assert memo.get('pl_transaction', ' bluestar', 'how  many accounts', 'f1') == ['SELECT 1']
+    assert memo.get('pl_transaction', 'other', 'how many accounts', 'f1') is None
+    assert memo.stats() == {'hits': 1, 'misses': 1, 'entries': 1}
+
+
+def test_changed_schema_misses():
+    memo = SqlMemo()
+    memo.put('t', 'c', 'q', schema_fingerprint([{'a': 'int'}]), ['SELECT a FROM t'])
+    assert memo.get('t', 'c', 'q', schema_fingerprint([{'a': 'bigint'}])) is None
+
+
+def test_invalidate_table_drops_only_that_table():
+    memo = SqlMemo()
+    memo.put('t1', 'c', 'q', 'f', ['SELECT 1'])
+    memo.put('t2', 'c', 'q', 'f', ['SELECT 2'])
+    memo.invalidate_table('t1')
+    assert memo.get('t1', 'c', 'q', 'f') is None
+    assert memo.get('t2', 'c', 'q', 'f') == ['SELECT 2']
+
+
+def test_entries_expire_and_are_evicted_least_recently_used_first():
+    memo = SqlMemo(ttl_seconds=0.01)
+    memo.put('t', 'c', 'q', 'f', ['SELECT 1'])
+    time.sleep(0.02)
+    assert memo.get('t', 'c', 'q', 'f') is None
+
+    memo = SqlMemo(max_entries=2)
+    for question in ('a', 'b'):
+        memo.put('t', 'c', question, 'f', [question])
+    memo.get('t', 'c', 'a', 'f')
+    memo.put('t', 'c', 'd', 'f', ['d'])
+    assert memo.get('t', 'c', 'b', 'f') is None
+    assert memo.get('t', 'c', 'a', 'f') == ['a']
+
+
+def test_normalize_question():
+    assert normalize_question('  How many   Accounts?! ') == 'how many accounts'
@@ -0,0 +1,85 @@
+from sql_validate import only_unknown_columns, tokenize, validate_sql
+
+COLUMNS = ['account_id', 'posting_amount', 'posting_date', 'currency']
+TABLE = 'pl_transaction'
+
+
+def test_accepts_a_plain_select():
+    assert validate_sql('SELECT account_id, sum(posting_amount) FROM pl_transaction GROUP BY 1', COLUMNS, TABLE) == []
+
+
+def test_case_expression_with_implicit_alias():
+    sql = "SELECT CASE WHEN posting_amount > 0 THEN 'credit' ELSE 'debit' END kind FROM pl_transaction"
+    assert validate_sql(sql, COLUMNS, TABLE) == []
+    assert validate_sql(f"{sql} ORDER BY kind", COLUMNS, TABLE) == []
+
+
+def test_implicit_and_explicit_aliases():
+    sql = ('SELECT t.account_id, count(*) total, sum(posting_amount) AS amount FROM pl_transaction t '
+           'GROUP BY t.account_id ORDER BY total DESC, amount')
+    assert validate_sql(sql, COLUMNS, TABLE) == []
+
+
+def test_cte_and_its_columns():
+    sql = ('WITH totals AS (SELECT account_id, sum(posting_amount) AS amount FROM pl_transaction GROUP BY 1) '
+           'SELECT account_id, amount FROM totals')
+    assert validate_sql(sql, COLUMNS, TABLE) == []
+
+
+def test_is_distinct_from_is_not_an_empty_select_list():
+    for sql in ('SELECT account_id FROM pl_transaction WHERE currency IS DISTINCT FROM account_id',
+                'SELECT account_id FROM pl_transaction WHERE currency IS NOT DISTINCT FROM NULL'):
+        assert validate_sql(sql, COLUMNS, TABLE) == []
+    assert validate_sql('SELECT DISTINCT FROM pl_transaction') == ['empty select list']
+
+
+def test_lambda_parameters_are_not_columns():
+    sql = 'SELECT map_filter(tags, (k, v) -> v > 0), filter(amounts, x -> x > 0) FROM pl_transaction'
+    assert validate_sql(sql, COLUMNS + ['tags', 'amounts'], TABLE) == []
+    assert validate_sql('SELECT coalesce(k, v) FROM pl_transaction', COLUMNS, TABLE) == [
+        'unknown column k', 'unknown column v']
+
+
+def test_only_unknown_columns():
+    assert only_unknown_columns('unknown column k; unknown column v (did you mean currency?)')
+    assert not only_unknown_columns('unknown column k; stray comma before FROM')
+
+
+def test_unknown_column_suggests_close_match():
+    assert validate_sql('SELECT currancy FROM pl_transaction', COLUMNS, TABLE) == [
+        'unknown column currancy (did you mean currency?)']
+
+
+def test_quoted_identifiers_fold_to_lower_case():
+    assert validate_sql('SELECT "Account_Id" FROM pl_transaction', COLUMNS, TABLE) == []
+
+
+def test_other_tables_skip_the_column_check():
+    sql = 'SELECT a.whatever FROM pl_transaction p JOIN accounts a ON a.id = p.account_id'
+    assert validate_sql(sql, COLUMNS, TABLE) == []
+
+
+def test_only_single_queries_are_allowed():
+    assert validate_sql('DROP TABLE pl_transaction') == ['only SELECT queries are allowed, got DROP']
+    assert validate_sql('SELECT 1; SELECT 2') == ['only one statement may be submitted at a time']
+    assert validate_sql('SELECT 1;') == []
+    assert validate_sql('  ') == ['empty statement']
+
+
+def test_syntax_problems():
+    assert validate_sql('SELECT count(* FROM pl_transaction') == ["1 unclosed '('"]
+    assert validate_sql('SELECT account_id, FROM pl_transaction') == ['stray comma before FROM']
+    assert validate_sql('SELECT TOP 10 account_id FROM pl_transaction')[0].startswith('TOP is not supported')
+    assert validate_sql('SELECT account_id FROM pl_transaction WHERE') == [
+        'statement ends unexpectedly after WHERE']
+    assert validate_sql('SELECT `account_id` FROM pl_transaction') == [
+        'Athena quotes identifiers with double quotes, not backticks']
+
+
+def test_unterminated_literal():
+    assert validate_sql("SELECT 'abc FROM pl_transaction")[0].startswith('unterminated string literal')
+
+
+def test_tokenize_skips_comments_and_keeps_literals():
+    tokens = tokenize("SELECT 'it''s' -- note\n, 1.5e3 /* x */ FROM t")
+    assert [token.text for token in tokens] == ['SELECT', "'it''s'", ',', '1.5e3', 'FROM', 't']
@@ -0,0 +1,61 @@
+import io
+import json
+
+import pytest
+
+from tracing import EmfSink, InMemorySink, Tracer, metrics_sink
+
+
+def test_spans_reach_the_sink_with_bound_attributes():
+    sink = InMemorySink()
+    tracer = Tracer(sink).bind('trace-1', table='pl_transaction')
+    with tracer.span('bedrock', route='sql_generation') as span:
+        span.set('rows', 3)
+        span.usage({'input_tokens': 10, 'output_tokens': 2})
+        span.usage({'input_tokens': 5})
+    tracer.record('athena_queue', 12.3456, service='athena')
+    bedrock, = sink.spans('bedrock')
+    assert bedrock['trace_id'] == 'trace-1'
+    assert bedrock['attributes'] == {'table': 'pl_transaction', 'route': 'sql_generation', 'rows': 3,
+                                     'input_tokens': 15, 'output_tokens': 2}
+    assert sink.spans('athena_queue')[0]['duration_ms'] == 12.346
+
+
+def test_errors_are_recorded_except_an_early_close():
+    sink = InMemorySink()
+    tracer = Tracer(sink)
+    with pytest.raises(ValueError):
+        with tracer.span('athena'):
+            raise ValueError
+    with pytest.raises(GeneratorExit):
+        with tracer.span('bedrock'):
+            raise GeneratorExit
+    assert sink.spans('athena')[0]['attributes'] == {'error': 'ValueError'}
+    assert sink.spans('bedrock')[0]['attributes'] == {}
+
+
+def test_without_a_sink_nothing_is_recorded():
+    tracer = Tracer()
+    assert not tracer.enabled
+    with tracer.span('athena') as span:
+        span.set('rows', 1)
+    tracer.record('athena_queue', 1)
+    assert tracer.bind(table='t').span('x') is tracer.span('y')
+
+
+def test_emf_lines_publish_numeric_metrics_with_stage_dimensions():
+    stream = io.StringIO()
+    tracer = Tracer(EmfSink('Test', stream=stream), trace_id='t1')
+    tracer.record('bedrock', 250, model='m', input_tokens=7, sql='SELECT 1')
+    line = json.loads(stream.getvalue())
+    metrics = line['_aws']['CloudWatchMetrics'][0]
+    assert metrics['Namespace'] == 'Test'
+    assert metrics['Dimensions'] == [['stage'], ['stage', 'model']]
+    assert {metric['Name'] for metric in metrics['Metrics']} == {'duration_ms', 'input_tokens'}
+    assert (line['stage'], line['trace_id'], line['duration_ms'], line['sql']) == ('bedrock', 't1', 250, 'SELECT 1')
+
+
+def test_metrics_sink_spec():
+    assert isinstance(metrics_sink('emf'), EmfSink)
+    assert isinstance(metrics_sink('memory'), InMemorySink)
+    assert metrics_sink('off') is None
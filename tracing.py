@@ -0,0 +1,180 @@
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+
+# 'emf' writes CloudWatch embedded-metric JSON lines to stdout, 'memory' keeps spans in process, 'off' disables
+METRICS_SINK = os.environ.get('METRICS_SINK', 'off')
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'SQLAnswerAgent')
+
+# Span attributes published as CloudWatch metrics, with their units; everything else is a property
+METRIC_UNITS = {
+    'duration_ms': 'Milliseconds',
+    'input_tokens': 'Count',
+    'output_tokens': 'Count',
+    'data_scanned_bytes': 'Bytes',
+    'rows': 'Count',
+    'prompt_tokens': 'Count',
+    'raw_tokens': 'Count',
+    'compact_tokens': 'Count',
+    'first_token_ms': 'Milliseconds',
+    'first_try': 'Count',
+}
+# Attributes that, when a span has them, add a finer dimension set next to stage
+DIMENSION_KEYS = ('route', 'model', 'service', 'scope')
+
+
+class InMemorySink:
+    """Keeps every span record; meant for tests and benchmarks."""
+
+    def __init__(self) -> None:
+        self.records = []
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def spans(self, name=None):
+        with self._lock:
+            return [record for record in self.records if name is None or record['name'] == name]
+
+    def clear(self):
+        with self._lock:
+            self.records.clear()
+
+
+class EmfSink:
+    """Writes one CloudWatch embedded metric format line per span, dimensioned by stage."""
+
+    def __init__(self, namespace=METRICS_NAMESPACE, stream=None) -> None:
+        self.namespace = namespace
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        attributes = record['attributes']
+        metrics = [{'Name': name, 'Unit': unit} for name, unit in METRIC_UNITS.items()
+                   if isinstance(attributes.get(name), (int, float)) or name == 'duration_ms']
+        dimensions = [['stage']]
+        extra = [key for key in DIMENSION_KEYS if key in attributes]
+        if extra:
+            dimensions.append(['stage'] + extra)
+        line = {
+            '_aws': {
+                'Timestamp': int(record['timestamp'] * 1000),
+                'CloudWatchMetrics': [{'Namespace': self.namespace, 'Dimensions': dimensions, 'Metrics': metrics}],
+            },
+            'stage': record['name'],
+            'trace_id': record['trace_id'],
+            'duration_ms': record['duration_ms'],
+        }
+        line.update(attributes)
+        text = json.dumps(line, default=str)
+        with self._lock:
+            print(text, file=self.stream or sys.stdout, flush=True)
+
+
+def metrics_sink(spec=METRICS_SINK):
+    if spec == 'emf':
+        return EmfSink()
+    if spec == 'memory':
+        return InMemorySink()
+    return None
+
+
+class Span:
+    __slots__ = ('tracer', 'name', 'attributes', 'started')
+
+    def __init__(self, tracer, name, attributes) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.started = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def add(self, key, value):
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def usage(self, usage):
+        # Bedrock token counts, as collected by iter_stream_text
+        for key in ('input_tokens', 'output_tokens'):
+            if key in usage:
+                self.add(key, usage[key])
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # A stream closed early (read_until stopping at a tag) is not a failure
+        if exc_type is not None and exc_type is not GeneratorExit:
+            self.attributes['error'] = exc_type.__name__
+        self.tracer.emit(self.name, (time.perf_counter() - self.started) * 1000, self.attributes)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, key, value):
+        pass
+
+    def add(self, key, value):
+        pass
+
+    def usage(self, usage):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """Hands out spans for the stages of one request and sends them to `sink`.
+
+    Without a sink every span is a shared no-op object, so instrumented code
+    costs a method call per stage when metrics are off.
+    """
+
+    def __init__(self, sink=None, trace_id=None, **attributes) -> None:
+        self.sink = sink
+        self.trace_id = trace_id
+        self.attributes = attributes
+
+    @property
+    def enabled(self):
+        return self.sink is not None
+
+    def bind(self, trace_id=None, **attributes):
+        # A tracer for one request: same sink, its own trace id and common attributes
+        return Tracer(self.sink, trace_id or uuid.uuid4().hex, **{**self.attributes, **attributes})
+
+    def span(self, name, **attributes):
+        if self.sink is None:
+            return _NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def record(self, name, duration_ms, **attributes):
+        # For stages timed elsewhere, e.g. the queue and execution times Athena reports
+        if self.sink is not None:
+            self.emit(name, duration_ms, attributes)
+
+    def emit(self, name, duration_ms, attributes):
+        self.sink.emit({
+            'name': name,
+            'trace_id': self.trace_id,
+            'timestamp': time.time(),
+            'duration_ms': round(duration_ms, 3),
+            'attributes': {**self.attributes, **attributes},
+        })
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class StoreBackend:
+    """Second-tier storage behind a TTLStore. Entries are (expires_at, value)."""
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def put(self, key, expires_at, value):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+
+class LocalFileBackend(StoreBackend):
+    """One JSON file per key in `directory`, {'expires_at': ..., <field>: value}."""
+
+    field = 'value'
+
+    def __init__(self, directory) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _filename(self, key):
+        return f"{hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest()[:32]}.json"
+
+    def _path(self, key):
+        return os.path.join(self.directory, self._filename(key))
+
+    def get(self, key):
+        try:
+            with open(self._path(key)) as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        return entry['expires_at'], entry[self.field]
+
+    def put(self, key, expires_at, value):
+        path = self._path(key)
+        # Writers in other threads or processes sharing the directory each get their own temporary file;
+        # the rename is atomic, so readers see one complete entry or the other and the last write wins
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'expires_at': expires_at, self.field: value}, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class TTLStore:
+    """TTL + LRU map in memory, written through to an optional backend.
+
+    Expiry uses wall-clock time so entries written to a shared backend stay
+    meaningful across processes. A miss in memory falls back to the backend
+    and an unexpired entry found there is kept in memory again.
+    """
+
+    def __init__(self, ttl_seconds, max_entries, backend=None) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+        if self.backend is not None:
+            entry = self.backend.get(key)
+            if entry is not None and entry[0] > now:
+                with self._lock:
+                    self._remember(key, entry)
+                    self.hits += 1
+                return entry[1]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, key, value):
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._remember(key, (expires_at, value))
+        if self.backend is not None:
+            self.backend.put(key, expires_at, value)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.backend is not None:
+            self.backend.delete(key)
+
+    def discard_matching(self, predicate):
+        # Memory only: backends can't be enumerated by key
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def clear(self):
+        # Memory only; the backend is shared with other processes
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)